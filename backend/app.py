@@ -1,16 +1,36 @@
 # backend/app.py
+import glob
 import os
 from datetime import datetime, timedelta
 from functools import wraps
 from urllib.parse import quote_plus
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, send_from_directory
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_jwt_extended import create_access_token, get_jwt_identity, jwt_required, JWTManager
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.dialects import mysql
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
 from dotenv import load_dotenv
 
+import batch
+import fact_store
+import images
+from metrics import init_metrics, metrics
+from order_events import TooManyStreams, init_order_events, order_events
+from event_log import event_log, init_event_log
+from response_cache import catalog_cache, customer_analytics_cache, init_catalog_cache
+from shop_geo import init_shop_grid, parse_coordinates, shop_grid
+from sold_counts import bestsellers, build_rankings, init_sold_counts, sold_counts
+import inventory
+import order_archive
+import pricing
+from pricing import InvalidOffer, init_pricing, price_book
+import sharded_stock
+import stock_alerts
+import timeseries
+from sql_profiler import init_sql_profiler
+
 load_dotenv() # Load environment variables from .env
 
 app = Flask(__name__)
@@ -22,6 +42,52 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', f'mysql+p
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'your-jwt-secret-key') # Should be in .env
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=24)
+# Per-request SQL profiling (see sql_profiler.py) - off unless explicitly enabled
+app.config['SQL_PROFILER_ENABLED'] = os.environ.get('SQL_PROFILER_ENABLED', 'false').lower() == 'true'
+app.config['SQL_PROFILER_SAMPLE_RATE'] = float(os.environ.get('SQL_PROFILER_SAMPLE_RATE', 1.0))
+app.config['SQL_PROFILER_OUTPUT'] = os.environ.get('SQL_PROFILER_OUTPUT') # 'headers' or 'log'
+app.config['SQL_PROFILER_SLOW_REQUEST_MS'] = float(os.environ.get('SQL_PROFILER_SLOW_REQUEST_MS', 500))
+# Shared directory where each worker process drops its metrics snapshot for /metrics to aggregate
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR')
+# sold_count is buffered per process and written in batches (see sold_counts.py)
+app.config['SOLD_COUNT_FLUSH_INTERVAL'] = float(os.environ.get('SOLD_COUNT_FLUSH_INTERVAL', 5))
+app.config['BESTSELLERS_TOP_N'] = int(os.environ.get('BESTSELLERS_TOP_N', 50))
+app.config['BESTSELLERS_REFRESH_SECONDS'] = float(os.environ.get('BESTSELLERS_REFRESH_SECONDS', 60))
+# Number of counter rows a product's stock is split across when sharded stock is turned on
+app.config['STOCK_SHARDS'] = int(os.environ.get('STOCK_SHARDS', 8))
+# Public catalog listings are cached per ?fields= selection for this many seconds (0 = off)
+app.config['CATALOG_CACHE_SECONDS'] = float(os.environ.get('CATALOG_CACHE_SECONDS', 5))
+# Per-customer dashboard figures (GET /api/customers/me/analytics) are cached this long at most
+app.config['CUSTOMER_ANALYTICS_CACHE_SECONDS'] = float(os.environ.get('CUSTOMER_ANALYTICS_CACHE_SECONDS', 600))
+# POST /api/batch limits (see batch.py)
+app.config['BATCH_MAX_REQUESTS'] = int(os.environ.get('BATCH_MAX_REQUESTS', 20))
+app.config['BATCH_MAX_WORKERS'] = int(os.environ.get('BATCH_MAX_WORKERS', 4))
+# Uploaded product images (see images.py)
+app.config['IMAGE_DIR'] = os.environ.get('IMAGE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'media'))
+app.config['MEDIA_URL'] = os.environ.get('MEDIA_URL', '/media').rstrip('/')
+app.config['IMAGE_MAX_BYTES'] = int(os.environ.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', 2))
+# Nearby shop lookups (see shop_geo.py)
+app.config['SHOP_GRID_CELL_DEGREES'] = float(os.environ.get('SHOP_GRID_CELL_DEGREES', 0.02))
+app.config['SHOP_INDEX_REFRESH_SECONDS'] = float(os.environ.get('SHOP_INDEX_REFRESH_SECONDS', 300))
+# Live shop order events (see order_events.py); set ORDER_EVENTS_DIR when running several workers
+app.config['ORDER_EVENTS_DIR'] = os.environ.get('ORDER_EVENTS_DIR')
+app.config['ORDER_EVENTS_MAX_STREAMS'] = int(os.environ.get('ORDER_EVENTS_MAX_STREAMS', 100))
+# Append-only order and inventory event log (see event_log.py); off unless EVENT_LOG_DIR is set
+app.config['EVENT_LOG_DIR'] = os.environ.get('EVENT_LOG_DIR')
+app.config['EVENT_LOG_SEGMENT_BYTES'] = int(os.environ.get('EVENT_LOG_SEGMENT_BYTES', 64 * 1024 * 1024))
+app.config['EVENT_LOG_FLUSH_INTERVAL'] = float(os.environ.get('EVENT_LOG_FLUSH_INTERVAL', 0.005))
+app.config['EVENT_LOG_SYNC'] = os.environ.get('EVENT_LOG_SYNC', 'false').lower() == 'true'
+# Columnar order facts for platform-wide analytics (see fact_store.py)
+app.config['FACT_STORE_DIR'] = os.environ.get('FACT_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'facts'))
+app.config['FACT_STORE_WORKERS'] = int(os.environ.get('FACT_STORE_WORKERS', os.cpu_count() or 1))
+# Compiled offers are reloaded this often at most (see pricing.py)
+app.config['PRICING_REFRESH_SECONDS'] = float(os.environ.get('PRICING_REFRESH_SECONDS', 30))
+# Finished orders older than this move to the archive tables (see order_archive.py); web and job must agree
+app.config['ORDER_ARCHIVE_DAYS'] = int(os.environ.get('ORDER_ARCHIVE_DAYS', 365))
+# Admin emails allowed to see platform-wide analytics (comma-separated); nobody when unset
+app.config['PLATFORM_ANALYTICS_EMAILS'] = {email.strip().lower() for email in
+                                           os.environ.get('PLATFORM_ANALYTICS_EMAILS', '').split(',') if email.strip()}
 
 # --- Extensions ---
 db = SQLAlchemy(app)
@@ -31,12 +97,20 @@ CORS(app,
         #  "origins": ["http://localhost:3000", "http://localhost:5173", "http://127.0.0.1:5173", "http://localhost:8081" , "http://localhost:8082", "exp://192.168.167.73:8081","exp://192.168.167.73:8082"], 
          "origins": "*",
          "allow_headers": ["Content-Type", "Authorization", "Accept", "X-Requested-With"],
-         "expose_headers": ["Content-Type", "Authorization"],
+         "expose_headers": ["Content-Type", "Authorization", "X-SQL-Statements", "X-SQL-Time-Ms", "X-SQL-N-Plus-One"],
          "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
          "supports_credentials": True,
          "max_age": 86400  # Cache preflight requests for 24 hours
      }})
 jwt = JWTManager(app)
+init_sql_profiler(app, db)
+init_metrics(app, db)
+init_sold_counts(app, db)
+init_catalog_cache(app)
+init_order_events(app)
+init_event_log(app)
+init_shop_grid(app)
+init_pricing(app)
 
 # Global error handler to ensure CORS headers are sent with error responses
 @app.errorhandler(Exception)
@@ -66,6 +140,9 @@ def invalid_token_callback(callback):
     return response
 
 # --- Database Models ---
+# Change timestamps need sub-second precision for delta sync; MySQL DATETIME drops it unless asked
+ChangeTimestamp = db.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql')
+
 class User(db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
@@ -92,6 +169,11 @@ class Shop(db.Model):
     name = db.Column(db.String(100), nullable=False)
     city = db.Column(db.String(100), nullable=False)
     owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    latitude = db.Column(db.Float, nullable=True) # Optional; shops without a location only show up by city
+    longitude = db.Column(db.Float, nullable=True)
+    updated_at = db.Column(ChangeTimestamp, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.func.current_timestamp())
+    deleted_at = db.Column(ChangeTimestamp, nullable=True) # Soft delete: its products become tombstones in the change feed
     products = db.relationship('Product', backref='shop', lazy=True, cascade="all, delete-orphan")
 
 class Product(db.Model):
@@ -100,6 +182,7 @@ class Product(db.Model):
     name = db.Column(db.String(100), nullable=False)
     price = db.Column(db.Float, nullable=False)
     image_url = db.Column(db.String(255), nullable=True) # Placeholder for image path/URL
+    image_key = db.Column(db.String(80), nullable=True) # "<sha256>.<ext>" of an uploaded image (see images.py)
     shop_id = db.Column(db.Integer, db.ForeignKey('shops.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False, default=0) # Available quantity of the product
     category = db.Column(db.String(50), nullable=False, default='Vegetables') # Product category
@@ -108,6 +191,21 @@ class Product(db.Model):
     description = db.Column(db.Text, nullable=True) # Product description
     unit = db.Column(db.String(20), nullable=False, default='kg') # Unit of measurement
     sold_count = db.Column(db.Integer, nullable=False, default=0) # Number of units sold
+    sharded_stock = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false()) # Stock kept in product_stock_shards
+    reorder_threshold = db.Column(db.Integer, nullable=False, default=0, server_default='0') # Alert the shop at or below this stock
+    # Bumped by every write to the row, including the stock and sold_count UPDATEs; drives /api/products/changes
+    updated_at = db.Column(ChangeTimestamp, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.func.current_timestamp())
+    deleted_at = db.Column(ChangeTimestamp, nullable=True) # Soft delete: order history keeps pointing at the row
+    stock_shards = db.relationship('ProductStockShard', backref='product', lazy=True, cascade="all, delete-orphan")
+    __table_args__ = (db.Index('ix_products_updated_at', 'updated_at', 'id'),)
+
+class ProductStockShard(db.Model):
+    # One of several counters that together hold a sharded product's stock (see sharded_stock.py)
+    __tablename__ = 'product_stock_shards'
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
 
 class Address(db.Model):
     __tablename__ = 'addresses'
@@ -125,6 +223,8 @@ class Address(db.Model):
     phone_number = db.Column(db.String(20), nullable=False)
     is_default = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
     
     # Relationship to orders
     orders = db.relationship('Order', backref='delivery_address', lazy=True)
@@ -143,37 +243,303 @@ class Order(db.Model):
     # We'll define the relationships after all models are defined
 
 
+class InventoryMovement(db.Model):
+    # Append-only stock ledger, see inventory.py. No foreign keys: history outlives deleted products.
+    __tablename__ = 'inventory_movements'
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    order_id = db.Column(db.Integer, nullable=True, index=True)
+    kind = db.Column(db.String(20), nullable=False) # opening, sale, cancel_restock, adjustment, shipment
+    quantity = db.Column(db.Integer, nullable=False) # Units moved
+    stock_delta = db.Column(db.Integer, nullable=False) # Effect on sellable stock
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_inventory_movements_product_created', 'product_id', 'created_at'),)
+
+class Offer(db.Model):
+    # A shop's pricing rule, compiled into pricing.price_book. An offer with neither
+    # product_id nor category set applies to every product in the shop.
+    __tablename__ = 'offers'
+    id = db.Column(db.Integer, primary_key=True)
+    shop_id = db.Column(db.Integer, db.ForeignKey('shops.id'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False) # Shown to customers, e.g. "Buy 2 get 1 free"
+    kind = db.Column(db.String(20), nullable=False) # percentage, flat, buy_x_get_y
+    value = db.Column(db.Float, nullable=False, default=0) # Percent or amount off each unit
+    buy_quantity = db.Column(db.Integer, nullable=True) # buy_x_get_y only
+    free_quantity = db.Column(db.Integer, nullable=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=True)
+    category = db.Column(db.String(50), nullable=True)
+    starts_at = db.Column(db.DateTime, nullable=True)
+    ends_at = db.Column(db.DateTime, nullable=True)
+    active = db.Column(db.Boolean, nullable=False, default=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class ProductPairCount(db.Model):
+    # Orders containing both products, stored both ways round; the diagonal is the product's own order count.
+    # Maintained by recommendations.py, which also keeps related_products in step.
+    __tablename__ = 'product_pair_counts'
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    other_product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    orders = db.Column(db.Integer, nullable=False)
+
+class RelatedProduct(db.Model):
+    # A product's most frequently bought together partners, best first
+    __tablename__ = 'related_products'
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    related_product_id = db.Column(db.Integer, nullable=False)
+    orders = db.Column(db.Integer, nullable=False) # Orders with both
+    confidence = db.Column(db.Float, nullable=False) # Share of the product's orders that also had this one
+
+class JobWatermark(db.Model):
+    # Last order a batch job has processed
+    __tablename__ = 'job_watermarks'
+    name = db.Column(db.String(50), primary_key=True)
+    last_order_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class StockAlert(db.Model):
+    # A product at or below its reorder threshold; at most one row per product (see stock_alerts.py)
+    __tablename__ = 'stock_alerts'
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    shop_id = db.Column(db.Integer, nullable=False)
+    level = db.Column(db.String(20), nullable=False) # low_stock, out_of_stock
+    stock = db.Column(db.Integer, nullable=False) # Sellable units when raised
+    raised_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    dismissed_at = db.Column(db.DateTime, nullable=True) # Hidden from the queue until the level changes again
+    __table_args__ = (db.Index('ix_stock_alerts_shop_raised', 'shop_id', 'raised_at'),)
+
+
 # Association table for many-to-many relationship between orders and products
 order_items = db.Table('order_items',
     db.Column('order_id', db.Integer, db.ForeignKey('orders.id'), primary_key=True),
     db.Column('product_id', db.Integer, db.ForeignKey('products.id'), primary_key=True),
     db.Column('quantity', db.Integer, nullable=False, default=1),
-    db.Column('shop_id', db.Integer, db.ForeignKey('shops.id'), nullable=False) # To associate order item with shop
+    db.Column('shop_id', db.Integer, db.ForeignKey('shops.id'), nullable=False), # To associate order item with shop
+    db.Column('unit_price', db.Float, nullable=True) # Paid per unit after offers (see pricing.py); NULL on older orders
+)
+
+# Finished orders past ORDER_ARCHIVE_DAYS, moved here by order_archive.py. Same columns as orders and
+# order_items; no foreign keys, cold rows must not pin products or addresses.
+orders_archive = db.Table('orders_archive',
+    db.Column('id', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('customer_id', db.Integer, nullable=False),
+    db.Column('address_id', db.Integer, nullable=True),
+    db.Column('created_at', db.DateTime),
+    db.Column('total_amount', db.Float, nullable=False, default=0.0),
+    db.Column('status', db.String(50), nullable=False),
+    db.Column('payment_method', db.String(50), nullable=True),
+    db.Column('payment_transaction_id', db.String(100), nullable=True),
+    db.Index('ix_orders_archive_customer_created', 'customer_id', 'created_at'),
+    db.Index('ix_orders_archive_created_at', 'created_at')
+)
+order_items_archive = db.Table('order_items_archive',
+    db.Column('order_id', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('product_id', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('quantity', db.Integer, nullable=False, default=1),
+    db.Column('shop_id', db.Integer, nullable=False),
+    db.Column('unit_price', db.Float, nullable=True),
+    db.Index('ix_order_items_archive_shop_order', 'shop_id', 'order_id')
 )
+# Stock shown to customers: the sum of the shards for sharded products, the quantity column otherwise
+Product.available_quantity = db.column_property(db.case(
+    (Product.sharded_stock == db.true(),
+     db.select(db.func.coalesce(db.func.sum(ProductStockShard.quantity), 0)).
+     where(ProductStockShard.product_id == Product.id).correlate_except(ProductStockShard).scalar_subquery()),
+    else_=Product.quantity))
+
+# What an order line brought in: unit_price as paid, or for lines from before unit_price
+# was recorded, the list price less the product's discount (what place_order charged then)
+def line_unit_price(items=order_items):
+    return db.func.coalesce(items.c.unit_price, Product.price * (100 - db.func.coalesce(Product.discount_percentage, 0)) / 100)
+
+def line_amount(items=order_items):
+    return line_unit_price(items) * items.c.quantity
 
 # Now define the relationships
 Shop.orders = db.relationship('Order', secondary=order_items, overlaps="products,orders")
 Product.orders = db.relationship('Order', secondary=order_items, back_populates='products', overlaps="orders")
 Order.products = db.relationship('Product', secondary=order_items, back_populates='orders', overlaps="orders")
 
+# Archived orders load as Order objects, so history reads are written once and run per source
+ArchivedOrder = db.aliased(Order, orders_archive, adapt_on_names=True)
+HOT_ORDERS = (Order, order_items)
+ARCHIVED_ORDERS = (ArchivedOrder, order_items_archive)
+
+def order_sources(start=None):
+    """
+    (Order entity, order lines table) pairs holding the orders created from
+    `start` on (None: any time): the hot tables, plus the archive when the
+    range reaches back past ORDER_ARCHIVE_DAYS.
+    """
+    if order_archive.reaches_archive(start, app.config['ORDER_ARCHIVE_DAYS']):
+        return (HOT_ORDERS, ARCHIVED_ORDERS)
+    return (HOT_ORDERS,)
+
+# --- Shared Queries & Serializers ---
+# The catalog read routes below and the async read path in asgi_app.py both build
+# their statements and response bodies from these helpers, so the two stay in sync.
+class InvalidFields(ValueError):
+    """?fields= asked for something the endpoint does not return"""
+
+def parse_fields(raw, available, presets):
+    """
+    Keys selected by a ?fields= value: a preset name or comma-separated keys
+    of `available`. None or empty selects every key.
+    """
+    if not raw:
+        return tuple(available)
+    if raw in presets:
+        return presets[raw]
+    names = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = names - set(available)
+    if unknown:
+        raise InvalidFields(f"Unknown field(s): {', '.join(sorted(unknown))}. "
+                            f"Use a preset ({', '.join(presets)}) or any of: {', '.join(available)}")
+    return tuple(name for name in available if name in names)
+
+def requested_fields(available, presets):
+    return parse_fields(request.args.get('fields'), available, presets)
+
+def product_image_urls(image_key):
+    """Original and resized URLs of an uploaded image, None for products without one"""
+    if not image_key:
+        return None
+    image_hash, _, extension = image_key.partition('.')
+    return images.image_urls(app.config['MEDIA_URL'], image_hash, extension)
+
+# Serialized product key -> (Product columns it reads, getter). shop_name and city come from the
+# joined Shop. Getters fall back to defaults for columns that might be empty on older rows.
+PRODUCT_FIELDS = {
+    'id': ((), lambda p, shop: p.id),
+    'name': ((Product.name,), lambda p, shop: p.name),
+    'price': ((Product.price,), lambda p, shop: p.price),
+    'image_url': ((Product.image_url,), lambda p, shop: p.image_url),
+    'image_urls': ((Product.image_key,), lambda p, shop: product_image_urls(p.image_key)),
+    'shop_id': ((Product.shop_id,), lambda p, shop: p.shop_id),
+    'shop_name': ((), lambda p, shop: shop.name),
+    'city': ((), lambda p, shop: shop.city),
+    'category': ((Product.category,), lambda p, shop: p.category or 'Vegetables'),
+    'discount_percentage': ((Product.discount_percentage,),
+                            lambda p, shop: p.discount_percentage if p.discount_percentage is not None else 0),
+    'featured': ((Product.featured,), lambda p, shop: p.featured if p.featured is not None else False),
+    'unit': ((Product.unit,), lambda p, shop: p.unit or 'kg'),
+    'description': ((Product.description,), lambda p, shop: p.description or 'Fresh and locally sourced'),
+    'sold_count': ((Product.sold_count,), lambda p, shop: p.sold_count if p.sold_count is not None else 0),
+    'quantity': ((Product.available_quantity,), lambda p, shop: p.available_quantity),
+    'sharded_stock': ((Product.sharded_stock,), lambda p, shop: bool(p.sharded_stock)),
+    'reorder_threshold': ((Product.reorder_threshold,), lambda p, shop: p.reorder_threshold or 0),
+}
+PRODUCT_FIELD_PRESETS = {
+    'card': ('id', 'name', 'price', 'image_url', 'image_urls', 'quantity'),
+    'detail': tuple(field for field in PRODUCT_FIELDS if field not in ('sold_count', 'sharded_stock', 'reorder_threshold')),
+    'admin': tuple(PRODUCT_FIELDS),
+}
+
+def product_columns(fields):
+    """load_only() option fetching just the Product columns `fields` needs (e.g. no description for cards)"""
+    columns = {column for field in fields for column in PRODUCT_FIELDS[field][0]}
+    return db.load_only(Product.id, *sorted(columns, key=lambda column: column.key))
+
+def catalog_query(fields=tuple(PRODUCT_FIELDS)):
+    """Products joined to their shop, the row shape every catalog listing serializes."""
+    return db.select(Product, Shop).join(Shop, Product.shop_id == Shop.id).\
+        filter(Product.deleted_at.is_(None), Shop.deleted_at.is_(None)).\
+        options(product_columns(fields), db.load_only(Shop.name, Shop.city)).order_by(Product.id)
+
+def shops_in_city_query(city_name):
+    return db.select(Shop).filter(Shop.city.ilike(f"%{city_name}%"), Shop.deleted_at.is_(None))
+
+def serialize_product(p, shop, fields=tuple(PRODUCT_FIELDS)):
+    return {field: PRODUCT_FIELDS[field][1](p, shop) for field in fields}
+
+# Keys of the two order listings; the ones named after Order columns are copied straight from the row
+CUSTOMER_ORDER_FIELDS = ('id', 'created_at', 'total_amount', 'status', 'payment_method', 'payment_transaction_id',
+                         'items', 'delivery_address')
+SHOP_ORDER_FIELDS = ('id', 'customer_id', 'customer_name', 'customer_city', 'created_at', 'total_amount', 'status',
+                     'items_for_this_shop', 'shop_specific_total_amount')
+ORDER_FIELD_PRESETS = {'card': ('id', 'created_at', 'total_amount', 'status')}
+# Order lines only show these product columns
+ORDER_ITEM_PRODUCT_COLUMNS = db.load_only(Product.name, Product.price, Product.image_url, Product.shop_id)
+
+def order_columns(fields, orders=Order):
+    """load_only() option for the columns of `orders` (Order or ArchivedOrder) behind `fields`"""
+    columns = [getattr(orders, field) for field in fields if field in Order.__table__.c and field != 'id']
+    if 'delivery_address' in fields:
+        columns.append(orders.address_id)
+    return db.load_only(orders.id, *columns)
+
+def order_window(args):
+    """(start, end) of an order listing's ?days= or ?start=&end=, (None, None) for the whole history"""
+    if not any(args.get(name) for name in ('start', 'end', 'days')):
+        return None, None
+    return timeseries.parse_window(args)
+
+def in_window(orders, start, end):
+    """Filter criteria keeping `orders` created between start and end (either may be None)"""
+    return [criterion for criterion in (orders.created_at >= start if start else None,
+                                        orders.created_at <= end if end else None) if criterion is not None]
+
+def serialize_order_columns(order, fields):
+    data = {field: getattr(order, field) for field in fields if field in Order.__table__.c}
+    if 'created_at' in data:
+        data['created_at'] = data['created_at'].isoformat()
+    return data
+
+def serialize_shop(shop):
+    return {'id': shop.id, 'name': shop.name, 'city': shop.city, 'latitude': shop.latitude, 'longitude': shop.longitude}
+
+def serialize_address(address):
+    return {
+        'id': address.id,
+        'full_name': address.full_name,
+        'street_address': address.street_address,
+        'city': address.city,
+        'state': address.state,
+        'postal_code': address.postal_code,
+        'phone_number': address.phone_number,
+        'is_default': address.is_default,
+        'latitude': address.latitude,
+        'longitude': address.longitude
+    }
+
+def price_cart(lines, payment_method=None):
+    """pricing.quote() of [(product, quantity)] against the compiled offers, recompiled first if stale"""
+    price_book.refresh(lambda: Offer.query.filter(Offer.active == db.true(), db.or_(
+        Offer.ends_at.is_(None), Offer.ends_at > datetime.utcnow())).all())
+    return pricing.quote(price_book, lines, payment_method)
+
 # --- Helper Decorators for Role-Based Access ---
+def get_current_user():
+    """The User behind the request's JWT, looked up once per request and shared via g"""
+    if 'current_user' not in g:
+        g.current_user = User.query.filter_by(email=get_jwt_identity()).first()
+    return g.current_user
+
 def admin_required(fn):
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
-        current_user_identity = get_jwt_identity()
-        user = User.query.filter_by(email=current_user_identity).first()
+        user = get_current_user()
         if not user or user.role != 'admin':
             return jsonify(message="Admins only!"), 403
         return fn(*args, **kwargs)
     return wrapper
 
+def platform_admin_required(fn):
+    """Admins listed in PLATFORM_ANALYTICS_EMAILS only; the data spans every shop"""
+    @wraps(fn)
+    @admin_required
+    def wrapper(*args, **kwargs):
+        if get_current_user().email.lower() not in app.config['PLATFORM_ANALYTICS_EMAILS']:
+            return jsonify(message="Platform analytics are not enabled for this account"), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
 def customer_required(fn):
     @wraps(fn)
     @jwt_required()
     def wrapper(*args, **kwargs):
-        current_user_identity = get_jwt_identity() # This is the email
-        user = User.query.filter_by(email=current_user_identity).first()
+        user = get_current_user()
         if not user or user.role != 'customer':
             return jsonify(message="Customers only!"), 403
         return fn(*args, **kwargs)
@@ -231,8 +597,7 @@ def login():
 @app.route('/api/auth/me', methods=['GET'])
 @jwt_required()
 def get_me():
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
     if not user:
         return jsonify(message="User not found"), 404
     return jsonify(id=user.id, name=user.name, email=user.email, role=user.role, city=user.city), 200
@@ -240,8 +605,7 @@ def get_me():
 @app.route('/api/auth/profile', methods=['PUT'])
 @jwt_required()
 def update_profile():
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
     
     if not user:
         return jsonify(message="User not found"), 404
@@ -268,35 +632,20 @@ def update_profile():
 @app.route('/api/addresses', methods=['GET'])
 @jwt_required()
 def get_addresses():
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
     
     if not user:
         return jsonify(message="User not found"), 404
     
     addresses = Address.query.filter_by(user_id=user.id).order_by(Address.is_default.desc(), Address.created_at.desc()).all()
     
-    result = []
-    for address in addresses:
-        result.append({
-            'id': address.id,
-            'full_name': address.full_name,
-            'street_address': address.street_address,
-            'city': address.city,
-            'state': address.state,
-            'postal_code': address.postal_code,
-            'phone_number': address.phone_number,
-            'is_default': address.is_default
-        })
-    
-    return jsonify(result), 200
+    return jsonify([serialize_address(address) for address in addresses]), 200
 
 @app.route('/api/addresses', methods=['POST'])
 @jwt_required()
 def add_address():
     data = request.get_json()
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
     
     if not user:
         return jsonify(message="User not found"), 404
@@ -307,6 +656,11 @@ def add_address():
         if field not in data or not data[field]:
             return jsonify(message=f"Missing required field: {field}"), 400
     
+    try:
+        latitude, longitude = parse_coordinates(data.get('latitude'), data.get('longitude'))
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+    
     # Check if this is the first address for the user
     is_first_address = Address.query.filter_by(user_id=user.id).count() == 0
     
@@ -323,7 +677,9 @@ def add_address():
         postal_code=data['postal_code'],
         phone=data['phone_number'],  # Set legacy field
         phone_number=data['phone_number'],
-        is_default=data.get('is_default', is_first_address)  # First address is default by default
+        is_default=data.get('is_default', is_first_address),  # First address is default by default
+        latitude=latitude,
+        longitude=longitude
     )
     
     # If this address is set as default, unset any existing default
@@ -343,8 +699,7 @@ def add_address():
 @jwt_required()
 def update_address(address_id):
     data = request.get_json()
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
     
     if not user:
         return jsonify(message="User not found"), 404
@@ -371,6 +726,11 @@ def update_address(address_id):
     if 'phone_number' in data:
         address.phone_number = data['phone_number']
         address.phone = data['phone_number']  # Update legacy field
+    if 'latitude' in data or 'longitude' in data:
+        try:
+            address.latitude, address.longitude = parse_coordinates(data.get('latitude'), data.get('longitude'))
+        except ValueError as e:
+            return jsonify(message=str(e)), 400
     
     # Handle default address setting
     if 'is_default' in data and data['is_default'] and not address.is_default:
@@ -388,8 +748,7 @@ def update_address(address_id):
 @app.route('/api/addresses/<int:address_id>', methods=['DELETE'])
 @jwt_required()
 def delete_address(address_id):
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
     
     if not user:
         return jsonify(message="User not found"), 404
@@ -401,7 +760,8 @@ def delete_address(address_id):
     was_default = address.is_default
     
     # Check if this address is used in any orders
-    orders_with_address = Order.query.filter_by(address_id=address_id).count()
+    orders_with_address = Order.query.filter_by(address_id=address_id).count() or \
+        db.session.query(orders_archive.c.id).filter(orders_archive.c.address_id == address_id).count()
     if orders_with_address > 0:
         return jsonify(message="Cannot delete address as it is used in orders"), 400
     
@@ -422,8 +782,7 @@ def delete_address(address_id):
 @app.route('/api/addresses/default', methods=['GET'])
 @jwt_required()
 def get_default_address():
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = get_current_user()
     
     if not user:
         return jsonify(message="User not found"), 404
@@ -433,16 +792,7 @@ def get_default_address():
     if not default_address:
         return jsonify(message="No default address found"), 404
     
-    return jsonify({
-        'id': default_address.id,
-        'full_name': default_address.full_name,
-        'street_address': default_address.street_address,
-        'city': default_address.city,
-        'state': default_address.state,
-        'postal_code': default_address.postal_code,
-        'phone_number': default_address.phone_number,
-        'is_default': default_address.is_default
-    }), 200
+    return jsonify(serialize_address(default_address)), 200
 
 
 # --- Shop Routes ---
@@ -453,8 +803,7 @@ def create_shop():
     name = data.get('name')
     city = data.get('city') # Shop city, can be different from owner's registration city if needed
     
-    current_user_email = get_jwt_identity()
-    owner = User.query.filter_by(email=current_user_email).first()
+    owner = get_current_user()
 
     if not name or not city:
         return jsonify(message="Shop name and city are required"), 400
@@ -465,30 +814,84 @@ def create_shop():
         return jsonify(message=f"Admin already owns shop: {existing_shop.name}"), 409
 
 
-    new_shop = Shop(name=name, city=city, owner_id=owner.id)
+    try:
+        latitude, longitude = parse_coordinates(data.get('latitude'), data.get('longitude'))
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+
+    new_shop = Shop(name=name, city=city, owner_id=owner.id, latitude=latitude, longitude=longitude)
     db.session.add(new_shop)
     db.session.commit()
-    return jsonify(message="Shop created successfully", shop_id=new_shop.id, name=new_shop.name, city=new_shop.city), 201
+    if latitude is not None:
+        shop_grid.add(new_shop.id, latitude, longitude)
+    return jsonify(message="Shop created successfully", shop_id=new_shop.id, name=name, city=city,
+                   latitude=latitude, longitude=longitude), 201
 
 @app.route('/api/shops/my', methods=['GET'])
 @admin_required
 def get_my_shop():
-    current_user_email = get_jwt_identity()
-    owner = User.query.filter_by(email=current_user_email).first()
+    owner = get_current_user()
     shop = Shop.query.filter_by(owner_id=owner.id).first()
     if not shop:
         return jsonify(message="No shop found for this admin."), 404 # Or return an empty object/array
-    return jsonify(id=shop.id, name=shop.name, city=shop.city, owner_id=shop.owner_id), 200
+    return jsonify(id=shop.id, name=shop.name, city=shop.city, owner_id=shop.owner_id,
+                   latitude=shop.latitude, longitude=shop.longitude), 200
 
 
 @app.route('/api/shops/city/<city_name>', methods=['GET'])
 @jwt_required() # Any logged in user can see shops
 def get_shops_by_city(city_name):
-    shops = Shop.query.filter(Shop.city.ilike(f"%{city_name}%")).all()
+    shops = db.session.execute(shops_in_city_query(city_name)).scalars().all()
     if not shops:
         return jsonify(message=f"No shops found in {city_name}"), 404
     
-    return jsonify([{'id': shop.id, 'name': shop.name, 'city': shop.city} for shop in shops]), 200
+    return jsonify([serialize_shop(shop) for shop in shops]), 200
+
+class InvalidLocation(ValueError):
+    """A nearby lookup without a usable point or radius"""
+
+DEFAULT_NEARBY_RADIUS_KM = 5
+MAX_NEARBY_RADIUS_KM = 50
+MAX_NEARBY_SHOPS = 200
+
+def nearby_shops():
+    """
+    [(distance_km, shop_id)] nearest first for the ?lat=&lng=&radius=&limit= of this
+    request, from shop_grid. The point can also be one of the user's saved
+    addresses (?address_id=) when the request carries a JWT.
+    """
+    try:
+        lat, lng = parse_coordinates(request.args.get('lat'), request.args.get('lng'))
+    except ValueError as e:
+        raise InvalidLocation(str(e))
+    try:
+        radius = float(request.args.get('radius', DEFAULT_NEARBY_RADIUS_KM))
+        limit = int(request.args.get('limit', MAX_NEARBY_SHOPS))
+    except ValueError:
+        raise InvalidLocation("radius and limit must be numbers")
+    if lat is None and request.args.get('address_id', type=int) and get_jwt_identity():
+        address = Address.query.filter_by(id=request.args.get('address_id', type=int), user_id=get_current_user().id).first()
+        if address and address.latitude is not None:
+            lat, lng = address.latitude, address.longitude
+    if lat is None:
+        raise InvalidLocation("lat and lng (or the address_id of a saved address with a location) are required")
+    if not 0 < radius <= MAX_NEARBY_RADIUS_KM:
+        raise InvalidLocation(f"radius must be between 0 and {MAX_NEARBY_RADIUS_KM} km")
+    if not 0 < limit <= MAX_NEARBY_SHOPS:
+        raise InvalidLocation(f"limit must be between 1 and {MAX_NEARBY_SHOPS}")
+
+    shop_grid.refresh(lambda: db.session.query(Shop.id, Shop.latitude, Shop.longitude).
+                      filter(Shop.latitude.isnot(None), Shop.longitude.isnot(None), Shop.deleted_at.is_(None)).all())
+    return shop_grid.nearby(lat, lng, radius, limit)
+
+@app.route('/api/shops/nearby', methods=['GET'])
+@jwt_required() # Any logged in user can see shops
+def get_nearby_shops():
+    nearby = nearby_shops()
+    shops = {shop.id: shop for shop in Shop.query.filter(Shop.id.in_([shop_id for _, shop_id in nearby]),
+                                                         Shop.deleted_at.is_(None))} if nearby else {}
+    return jsonify([dict(serialize_shop(shops[shop_id]), distance_km=round(distance, 3))
+                    for distance, shop_id in nearby if shop_id in shops]), 200
 
 # --- Product Routes ---
 @app.route('/api/products', methods=['POST'])
@@ -506,9 +909,9 @@ def add_product():
     unit = data.get('unit', 'kg')  # Default unit for produce
     description = data.get('description', 'Fresh and locally sourced')
     quantity = data.get('quantity', 0)  # Default quantity is 0
+    reorder_threshold = data.get('reorder_threshold', 0)
 
-    current_user_email = get_jwt_identity()
-    owner = User.query.filter_by(email=current_user_email).first()
+    owner = get_current_user()
     shop = Shop.query.filter_by(owner_id=owner.id).first()
 
     if not shop:
@@ -523,6 +926,11 @@ def add_product():
             raise ValueError
     except ValueError:
         return jsonify(message="Invalid price format"), 400
+    try:
+        reorder_threshold = int(reorder_threshold)
+        if reorder_threshold < 0: raise ValueError
+    except (TypeError, ValueError):
+        return jsonify(message="Invalid reorder threshold"), 400
 
     # Create product with only the columns that exist in the database
     new_product = Product(
@@ -530,7 +938,8 @@ def add_product():
         price=price, 
         image_url=image_url, 
         shop_id=shop.id,
-        quantity=quantity
+        quantity=quantity,
+        reorder_threshold=reorder_threshold
     )
     
     # Try to set additional attributes if they exist in the model
@@ -549,7 +958,14 @@ def add_product():
         print(f"Error setting product attributes: {e}")
     
     db.session.add(new_product)
+    db.session.flush() # To get new_product.id for the ledger
+    inventory.record_adjustment(db, new_product.id, int(new_product.quantity or 0))
+    stock_alerts.stock_changed(db, [(new_product, None, int(new_product.quantity or 0))])
+    log_events = [inventory_moved_event(new_product.id, 'adjustment', int(new_product.quantity or 0))] \
+        if new_product.quantity else []
     db.session.commit()
+    catalog_cache.invalidate()
+    event_log.append(log_events)
     
     # Return the created product with default values for missing columns
     product_data = {
@@ -565,7 +981,8 @@ def add_product():
         'unit': unit,
         'description': description,
         'sold_count': 0,
-        'quantity': new_product.quantity
+        'quantity': new_product.quantity,
+        'reorder_threshold': reorder_threshold
     }
     
     return jsonify({
@@ -578,14 +995,13 @@ def add_product():
 @admin_required
 def update_product(product_id):
     data = request.get_json()
-    current_user_email = get_jwt_identity()
-    owner = User.query.filter_by(email=current_user_email).first()
+    owner = get_current_user()
     shop = Shop.query.filter_by(owner_id=owner.id).first()
 
     if not shop:
         return jsonify(message="Admin does not have a shop."), 403
 
-    product = Product.query.filter_by(id=product_id, shop_id=shop.id).first()
+    product = Product.query.filter_by(id=product_id, shop_id=shop.id, deleted_at=None).first()
     if not product:
         return jsonify(message="Product not found or does not belong to this shop"), 404
 
@@ -601,13 +1017,40 @@ def update_product(product_id):
             return jsonify(message="Invalid price format"), 400
     if 'image_url' in data:
         product.image_url = data['image_url']
+        product.image_key = None # A pasted URL replaces any uploaded image
+    stock_changes = 'quantity' in data or 'reorder_threshold' in data
+    log_events = []
+    if stock_changes:
+        previous_level = stock_alerts.level(product.available_quantity, product.reorder_threshold)
+    if 'reorder_threshold' in data:
+        try:
+            reorder_threshold = int(data['reorder_threshold'])
+            if reorder_threshold < 0: raise ValueError
+            product.reorder_threshold = reorder_threshold
+        except (TypeError, ValueError):
+            return jsonify(message="Invalid reorder threshold"), 400
+    # Switch stock mode first so a quantity sent alongside lands in the new mode
+    if 'sharded_stock' in data:
+        if data['sharded_stock'] and not product.sharded_stock:
+            sharded_stock.enable(db, product, app.config['STOCK_SHARDS'])
+        elif not data['sharded_stock'] and product.sharded_stock:
+            sharded_stock.disable(db, product)
     if 'quantity' in data:
         try:
             quantity = int(data['quantity'])
             if quantity < 0: raise ValueError
-            product.quantity = quantity
         except ValueError:
             return jsonify(message="Invalid quantity format"), 400
+        inventory.record_adjustment(db, product.id, quantity - product.available_quantity)
+        if quantity != product.available_quantity:
+            log_events.append(inventory_moved_event(product.id, 'adjustment', quantity - product.available_quantity))
+        if product.sharded_stock:
+            sharded_stock.set_quantity(db, product, quantity)
+        else:
+            product.quantity = quantity
+    if stock_changes:
+        stock_alerts.stock_changed(db, [(product, previous_level,
+                                         quantity if 'quantity' in data else product.available_quantity)])
     
     # Update all fields
     try:
@@ -638,7 +1081,11 @@ def update_product(product_id):
     except Exception as e:
         print(f"Error updating product attributes: {e}")
     
+    # Stock held in shards does not touch the products row, so mark the change explicitly
+    product.updated_at = datetime.utcnow()
     db.session.commit()
+    catalog_cache.invalidate()
+    event_log.append(log_events)
     
     # Return the updated product with all fields
     product_data = {
@@ -646,9 +1093,12 @@ def update_product(product_id):
         'name': product.name,
         'price': product.price,
         'image_url': product.image_url,
+        'image_urls': product_image_urls(product.image_key),
         'shop_id': product.shop_id,
         'shop_name': product.shop.name,
-        'quantity': product.quantity,
+        'quantity': product.available_quantity,
+        'sharded_stock': product.sharded_stock,
+        'reorder_threshold': product.reorder_threshold,
         'category': product.category,
         'discount_percentage': product.discount_percentage,
         'featured': product.featured,
@@ -662,160 +1112,509 @@ def update_product(product_id):
 @app.route('/api/products/<int:product_id>', methods=['DELETE'])
 @admin_required
 def delete_product(product_id):
-    current_user_email = get_jwt_identity()
-    owner = User.query.filter_by(email=current_user_email).first()
+    owner = get_current_user()
     shop = Shop.query.filter_by(owner_id=owner.id).first()
 
     if not shop:
         return jsonify(message="Admin does not have a shop."), 403
 
-    product = Product.query.filter_by(id=product_id, shop_id=shop.id).first()
+    product = Product.query.filter_by(id=product_id, shop_id=shop.id, deleted_at=None).first()
     if not product:
         return jsonify(message="Product not found or does not belong to this shop"), 404
         
-    db.session.delete(product)
+    # Soft delete: past orders keep their lines and synced clients get a tombstone
+    product.deleted_at = datetime.utcnow()
     db.session.commit()
+    catalog_cache.invalidate()
     return jsonify(message="Product deleted successfully"), 200
 
+@app.route('/api/products/<int:product_id>/image', methods=['POST'])
+@admin_required
+def upload_product_image(product_id):
+    """
+    Store an uploaded image (multipart field `image`) for the product and queue its
+    resized copies. Responds 202 while they are being made; until then the sized
+    URLs serve the original.
+    """
+    owner = get_current_user()
+    shop = Shop.query.filter_by(owner_id=owner.id).first()
+
+    if not shop:
+        return jsonify(message="Admin does not have a shop."), 403
+
+    product = Product.query.filter_by(id=product_id, shop_id=shop.id, deleted_at=None).first()
+    if not product:
+        return jsonify(message="Product not found or does not belong to this shop"), 404
+
+    upload = request.files.get('image')
+    if not upload:
+        return jsonify(message="An image file is required (multipart field 'image')"), 400
+    data = upload.stream.read(app.config['IMAGE_MAX_BYTES'] + 1)
+    if len(data) > app.config['IMAGE_MAX_BYTES']:
+        return jsonify(message=f"Image must be at most {app.config['IMAGE_MAX_BYTES'] // (1024 * 1024)} MB"), 413
+
+    try:
+        image_hash, extension, ready = images.store_original(app.config['IMAGE_DIR'], data)
+    except images.InvalidImage as e:
+        return jsonify(message=str(e)), 400
+    if not ready:
+        images.submit_thumbnails(app.config['IMAGE_DIR'], image_hash, extension, app.config['IMAGE_WORKERS'])
+
+    product.image_key = f"{image_hash}.{extension}"
+    urls = product_image_urls(product.image_key)
+    product.image_url = urls['card']['jpg'] # Older clients showing image_url get the card size too
+    db.session.commit()
+    catalog_cache.invalidate()
+
+    return jsonify(
+        message="Image uploaded" if ready else "Image uploaded, resized copies are being generated",
+        product_id=product.id,
+        image_url=product.image_url,
+        image_urls=urls
+    ), 200 if ready else 202
+
+@app.route('/media/<path:filename>', methods=['GET'])
+def serve_media(filename):
+    """
+    Uploaded images. Names are content hashes, so they never change and are cached
+    for a year. A resized copy that is not made yet falls back to the original,
+    uncached, so the browser asks again later.
+    """
+    directory = app.config['IMAGE_DIR']
+    path = safe_join(directory, filename)
+    if path and os.path.isfile(path):
+        response = send_from_directory(directory, filename, max_age=365 * 24 * 3600)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    folder = os.path.dirname(filename)
+    originals = glob.glob(os.path.join(glob.escape(os.path.dirname(path)), 'original.*')) if path and folder else []
+    if not originals:
+        return jsonify(message="Image not found"), 404
+    response = send_from_directory(directory, os.path.join(folder, os.path.basename(originals[0])))
+    response.cache_control.no_cache = True
+    return response
+
+
+def cached_listing(key, build):
+    """
+    Response for a public listing, from catalog_cache while fresh. `build`
+    returns (body, status); only 200 bodies are cached.
+    """
+    payload, generation = catalog_cache.lookup(key)
+    if payload is None:
+        body, status = build()
+        if status != 200:
+            return jsonify(body), status
+        payload = app.json.dumps(body)
+        catalog_cache.store(key, payload, generation)
+    return app.response_class(payload, mimetype='application/json'), 200
 
 @app.route('/api/shops/<int:shop_id>/products', methods=['GET'])
 def get_products_by_shop(shop_id):
-    shop = Shop.query.get(shop_id)
-    if not shop:
-        return jsonify(message="Shop not found"), 404
-    
-    products = Product.query.filter_by(shop_id=shop_id).all()
-    
-    result = []
-    for p in products:
-        product_data = {
-            'id': p.id, 
-            'name': p.name, 
-            'price': p.price, 
-            'image_url': p.image_url,
-            'shop_id': p.shop_id,
-            'shop_name': shop.name,
-            'city': shop.city,
-            'quantity': p.quantity,
-            'category': p.category,
-            'discount_percentage': p.discount_percentage,
-            'featured': p.featured,
-            'unit': p.unit,
-            'description': p.description,
-            'sold_count': p.sold_count
-        }
-            
-        result.append(product_data)
-    
-    return jsonify(result), 200
+    fields = requested_fields(PRODUCT_FIELDS, PRODUCT_FIELD_PRESETS)
+
+    def build():
+        shop = Shop.query.get(shop_id)
+        if not shop or shop.deleted_at:
+            return {'message': "Shop not found"}, 404
+        products = Product.query.options(product_columns(fields)).filter_by(shop_id=shop_id, deleted_at=None).\
+            order_by(Product.id).all()
+        return [serialize_product(p, shop, fields) for p in products], 200
+
+    return cached_listing(('shop_products', shop_id, fields), build)
 
 @app.route('/api/products', methods=['GET'])
 def get_all_products():
     """Get all products with shop information - public endpoint, no auth required"""
-    products = Product.query.all()
-    
-    if not products:
-        return jsonify(message="No products found"), 404
-    
-    # Get shop information for each product
-    result = []
-    for p in products:
-        shop = Shop.query.get(p.shop_id)
-        
-        # Add default values for columns that might not exist in the database
-        product_data = {
-            'id': p.id,
-            'name': p.name,
-            'price': p.price,
-            'image_url': p.image_url,
-            'shop_id': p.shop_id,
-            'shop_name': shop.name,
-            'city': shop.city,
-            'category': 'Vegetables',  # Default category
-            'discount_percentage': 0,  # Default discount
-            'featured': False,  # Default featured status
-            'unit': 'kg',  # Default unit for produce
-            'description': 'Fresh and locally sourced',  # Default description
-            'sold_count': 0,  # Default sold count
-            'quantity': p.quantity  # Available quantity
-        }
-        
-        # Try to access attributes that might not exist in the database
-        try:
-            if hasattr(p, 'category') and p.category:
-                product_data['category'] = p.category
-            if hasattr(p, 'discount_percentage') and p.discount_percentage is not None:
-                product_data['discount_percentage'] = p.discount_percentage
-            if hasattr(p, 'featured') and p.featured is not None:
-                product_data['featured'] = p.featured
-            if hasattr(p, 'unit') and p.unit:
-                product_data['unit'] = p.unit
-            if hasattr(p, 'description') and p.description:
-                product_data['description'] = p.description
-            if hasattr(p, 'sold_count') and p.sold_count is not None:
-                product_data['sold_count'] = p.sold_count
-        except Exception as e:
-            print(f"Error accessing product attributes: {e}")
-            
-        result.append(product_data)
-    
-    return jsonify(result), 200
+    fields = requested_fields(PRODUCT_FIELDS, PRODUCT_FIELD_PRESETS)
+
+    def build():
+        # Shops come back in the same query instead of one lookup per product
+        rows = db.session.execute(catalog_query(fields)).all()
+        if not rows:
+            return {'message': "No products found"}, 404
+        return [serialize_product(p, shop, fields) for p, shop in rows], 200
+
+    return cached_listing(('products', fields), build)
 
 @app.route('/api/products/city/<city_name>', methods=['GET'])
 def get_products_by_city(city_name):
-    # Find shops in the city
-    shops_in_city = Shop.query.filter(Shop.city.ilike(f"%{city_name}%")).all()
-    if not shops_in_city:
-        return jsonify(message=f"No shops found in {city_name}, hence no products."), 404
+    fields = requested_fields(PRODUCT_FIELDS, PRODUCT_FIELD_PRESETS)
+
+    def build():
+        # Find shops in the city
+        shops_in_city = db.session.execute(shops_in_city_query(city_name)).scalars().all()
+        if not shops_in_city:
+            return {'message': f"No shops found in {city_name}, hence no products."}, 404
+
+        shop_ids = [shop.id for shop in shops_in_city]
+        rows = db.session.execute(catalog_query(fields).filter(Product.shop_id.in_(shop_ids))).all()
+        if not rows:
+            return {'message': f"No products found in {city_name}"}, 404
+        return [serialize_product(p, shop, fields) for p, shop in rows], 200
+
+    return cached_listing(('city_products', city_name, fields), build)
+
+@app.route('/api/products/nearby', methods=['GET'])
+@jwt_required(optional=True) # Only needed for ?address_id=
+def get_nearby_products():
+    """Products of the shops within ?radius= km of ?lat=&lng=, nearest shop first"""
+    fields = requested_fields(PRODUCT_FIELDS, PRODUCT_FIELD_PRESETS)
+    distances = {shop_id: distance for distance, shop_id in nearby_shops()}
+    if not distances:
+        return jsonify([]), 200
+    rows = db.session.execute(catalog_query(fields).filter(Product.shop_id.in_(distances))).all()
+    rows.sort(key=lambda row: (distances[row[1].id], row[0].id))
+    return jsonify([dict(serialize_product(p, shop, fields), distance_km=round(distances[shop.id], 3))
+                    for p, shop in rows]), 200
+
+
+def bestseller_rankings(top_n):
+    """Each (city, category)'s top `top_n` products by sold_count, ranked in SQL"""
+    rank = db.func.row_number().over(
+        partition_by=(db.func.lower(Shop.city), db.func.lower(db.func.coalesce(Product.category, 'Vegetables'))),
+        order_by=(Product.sold_count.desc(), Product.id)).label('rank')
+    ranked = db.select(Product.id, rank).join(Shop, Product.shop_id == Shop.id).\
+        filter(Product.sold_count > 0, Product.deleted_at.is_(None), Shop.deleted_at.is_(None)).subquery()
+    rows = db.session.execute(catalog_query().join(ranked, ranked.c.id == Product.id).
+                              filter(ranked.c.rank <= top_n)).all()
+    products = [serialize_product(p, shop) for p, shop in rows]
+    return build_rankings(((p['city'], p['category'], p) for p in products), top_n)
+
+@app.route('/api/products/bestsellers', methods=['GET'])
+def get_bestsellers():
+    limit = request.args.get('limit', 10, type=int)
+    if limit is None or limit <= 0:
+        return jsonify(message="limit must be a positive integer"), 400
+    fields = requested_fields(PRODUCT_FIELDS, PRODUCT_FIELD_PRESETS)
+    products = bestsellers.get(bestseller_rankings, city=request.args.get('city'),
+                               category=request.args.get('category'), limit=limit)
+    if len(fields) < len(PRODUCT_FIELDS):
+        # The ranking holds full product dicts; trim them to the requested keys
+        products = [{field: p[field] for field in fields} for p in products]
+    return jsonify(products), 200
+
+# Frequently bought together, precomputed by recommendations.py (recommendations.TOP_K partners per product)
+MAX_RELATED_PRODUCTS = 20
+MAX_CART_PRODUCTS = 50
+
+def related_products_query(product_ids, fields):
+    """Stored partners of `product_ids` still on sale and in stock: (Product, Shop, product_id, orders, confidence) rows"""
+    return catalog_query(fields).\
+        join(RelatedProduct, RelatedProduct.related_product_id == Product.id).\
+        add_columns(RelatedProduct.product_id, RelatedProduct.orders, RelatedProduct.confidence).\
+        filter(RelatedProduct.product_id.in_(product_ids), Product.available_quantity > 0).\
+        order_by(None).order_by(RelatedProduct.product_id, RelatedProduct.rank)
+
+def related_limit():
+    limit = request.args.get('limit', 6, type=int)
+    if limit is None or not 0 < limit <= MAX_RELATED_PRODUCTS:
+        return None
+    return limit
+
+@app.route('/api/products/<int:product_id>/related', methods=['GET'])
+def get_related_products(product_id):
+    """Products most often ordered together with this one, best first"""
+    limit = related_limit()
+    if limit is None:
+        return jsonify(message=f"limit must be between 1 and {MAX_RELATED_PRODUCTS}"), 400
+    fields = requested_fields(PRODUCT_FIELDS, PRODUCT_FIELD_PRESETS)
+    rows = db.session.execute(related_products_query([product_id], fields).limit(limit)).all()
+    return jsonify([dict(serialize_product(p, shop, fields), orders=orders, confidence=confidence)
+                    for p, shop, _, orders, confidence in rows]), 200
+
+@app.route('/api/products/related', methods=['GET'])
+def get_cart_related_products():
+    """Frequently bought together for a whole cart: partners of every product_ids entry not already in it,
+    ranked by their confidences added up, so items that go with several cart products come first"""
+    limit = related_limit()
+    if limit is None:
+        return jsonify(message=f"limit must be between 1 and {MAX_RELATED_PRODUCTS}"), 400
+    try:
+        product_ids = {int(value) for value in request.args.get('product_ids', '').split(',') if value.strip()}
+    except ValueError:
+        return jsonify(message="product_ids must be a comma-separated list of product ids"), 400
+    if not 0 < len(product_ids) <= MAX_CART_PRODUCTS:
+        return jsonify(message=f"Pass between 1 and {MAX_CART_PRODUCTS} product_ids"), 400
+    fields = requested_fields(PRODUCT_FIELDS, PRODUCT_FIELD_PRESETS)
+    scores, products = {}, {}
+    for p, shop, _, orders, confidence in db.session.execute(related_products_query(product_ids, fields)).all():
+        if p.id in product_ids:
+            continue
+        scores[p.id] = scores.get(p.id, 0.0) + confidence
+        if p.id not in products:
+            products[p.id] = dict(serialize_product(p, shop, fields), orders=0, confidence=0.0)
+        products[p.id]['orders'] += orders
+        products[p.id]['confidence'] = max(products[p.id]['confidence'], confidence)
+    ranked = sorted(products, key=lambda related_id: (-scores[related_id], related_id))[:limit]
+    return jsonify([products[related_id] for related_id in ranked]), 200
+
+# Writers stamp updated_at a little before they commit, so a caught-up client's next sync
+# re-reads this window rather than miss a slow transaction. Clients apply changes idempotently.
+CHANGES_OVERLAP = timedelta(seconds=5)
+MAX_CHANGES_LIMIT = 5000
+SYNC_EPOCH = datetime(1970, 1, 1)
+
+def encode_sync_token(updated_at, product_id):
+    return f"{(updated_at - SYNC_EPOCH) // timedelta(microseconds=1)}-{product_id}"
+
+def decode_sync_token(token):
+    """(updated_at, product_id) from a sync token; ValueError if it is not one"""
+    micros, _, product_id = token.partition('-')
+    return SYNC_EPOCH + timedelta(microseconds=int(micros)), int(product_id)
+
+def product_changes_query(since, after_id, city, limit, fields=tuple(PRODUCT_FIELDS)):
+    """Products (deleted ones included) changed after (since, after_id), in change order, via ix_products_updated_at"""
+    query = db.select(Product, Shop, Product.updated_at, db.or_(Product.deleted_at.isnot(None), Shop.deleted_at.isnot(None))).\
+        join(Shop, Product.shop_id == Shop.id).\
+        filter(db.or_(Product.updated_at > since, db.and_(Product.updated_at == since, Product.id > after_id))).\
+        options(product_columns(fields), db.load_only(Shop.name, Shop.city)).\
+        order_by(Product.updated_at, Product.id).limit(limit)
+    if city:
+        query = query.filter(Shop.city.ilike(f"%{city}%"))
+    return query
+
+@app.route('/api/products/changes', methods=['GET'])
+def get_product_changes():
+    """Catalog delta sync: products added or changed and ids removed since the client's sync token"""
+    fields = requested_fields(PRODUCT_FIELDS, PRODUCT_FIELD_PRESETS)
+    if 'id' not in fields:
+        fields = ('id',) + fields # Clients merge on it
+    limit = request.args.get('limit', 500, type=int)
+    if limit is None or not 0 < limit <= MAX_CHANGES_LIMIT:
+        return jsonify(message=f"limit must be between 1 and {MAX_CHANGES_LIMIT}"), 400
+    token = request.args.get('since')
+    try:
+        since, after_id = decode_sync_token(token) if token else (SYNC_EPOCH, 0)
+    except ValueError:
+        return jsonify(message="Invalid sync token; sync again without one"), 400
 
-    shop_ids = [shop.id for shop in shops_in_city]
-    products = Product.query.filter(Product.shop_id.in_(shop_ids)).all()
-    
-    if not products:
-        return jsonify(message=f"No products found in {city_name}"), 404
+    started = datetime.utcnow()
+    rows = db.session.execute(product_changes_query(since, after_id, request.args.get('city'), limit + 1, fields)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
 
-    result = []
-    for p in products:
-        product_data = {
-            'id': p.id, 
-            'name': p.name, 
-            'price': p.price, 
-            'image_url': p.image_url,
-            'shop_id': p.shop_id,
-            'shop_name': p.shop.name,
-            'city': p.shop.city,
-            'category': 'Vegetables',  # Default category
-            'discount_percentage': 0,  # Default discount
-            'featured': False,  # Default featured status
-            'unit': 'kg',  # Default unit for produce
-            'description': 'Fresh and locally sourced',  # Default description
-            'sold_count': 0,  # Default sold count
-            'quantity': p.quantity  # Available quantity
-        }
-        
-        # Try to access attributes that might not exist in the database
-        try:
-            if hasattr(p, 'category') and p.category:
-                product_data['category'] = p.category
-            if hasattr(p, 'discount_percentage') and p.discount_percentage is not None:
-                product_data['discount_percentage'] = p.discount_percentage
-            if hasattr(p, 'featured') and p.featured is not None:
-                product_data['featured'] = p.featured
-            if hasattr(p, 'unit') and p.unit:
-                product_data['unit'] = p.unit
-            if hasattr(p, 'description') and p.description:
-                product_data['description'] = p.description
-            if hasattr(p, 'sold_count') and p.sold_count is not None:
-                product_data['sold_count'] = p.sold_count
-        except Exception as e:
-            print(f"Error accessing product attributes: {e}")
-            
-        result.append(product_data)
-    
-    return jsonify(result), 200
+    upserts, deleted = [], []
+    for product, shop, updated_at, is_deleted in rows:
+        if is_deleted:
+            deleted.append(product.id)
+        else:
+            upserts.append(serialize_product(product, shop, fields))
+
+    if has_more:
+        # Resume exactly after the last row sent (rows can share a timestamp)
+        next_token = encode_sync_token(rows[-1][2], rows[-1][0].id)
+    else:
+        next_token = encode_sync_token(max(started - CHANGES_OVERLAP, SYNC_EPOCH), 0)
+    return jsonify(products=upserts, deleted=deleted, next_token=next_token, has_more=has_more), 200
+
+# --- Pricing Routes ---
+MAX_QUOTE_LINES = 200
+# Product columns pricing.quote() reads
+PRICING_FIELDS = ('id', 'price', 'shop_id', 'category', 'discount_percentage')
+
+def is_whole_number(value):
+    return isinstance(value, int) and not isinstance(value, bool) # JSON true is not 1
+
+def parse_cart(cart_items):
+    """
+    Cart lines ([{"product_id": X, "quantity": Y}, ...]) as (product_id, quantity) pairs
+    worth looking up, and an unavailable entry for each line that is not: integer ids
+    and positive integer quantities only, so nothing else reaches an IN (...) query.
+    """
+    cart, unavailable = [], []
+    for item in cart_items:
+        product_id, quantity = (item.get('product_id'), item.get('quantity')) if isinstance(item, dict) else (None, None)
+        if not is_whole_number(product_id) or not is_whole_number(quantity) or quantity <= 0:
+            unavailable.append({'product_id': product_id, 'reason': 'Invalid product or quantity'})
+            continue
+        cart.append((product_id, quantity))
+    return cart, unavailable
+
+@app.route('/api/pricing/quote', methods=['POST'])
+def quote_cart():
+    """
+    A whole cart priced in one call and one query: every line with the offer
+    that applies to it, and the totals place_order would charge.
+    """
+    data = request.get_json() or {}
+    cart_items = data.get('items') or [] # Same format as place_order: [{"product_id": X, "quantity": Y}, ...]
+    if not isinstance(cart_items, list) or len(cart_items) > MAX_QUOTE_LINES:
+        return jsonify(message=f"items must be a list of at most {MAX_QUOTE_LINES} cart lines"), 400
+    cart, unavailable = parse_cart(cart_items)
+    product_ids = [product_id for product_id, _ in cart]
+    rows = db.session.execute(catalog_query(PRICING_FIELDS).filter(Product.id.in_(product_ids))).all() \
+        if product_ids else []
+    products = {p.id: p for p, _ in rows}
+
+    lines = []
+    for product_id, quantity in cart:
+        if product_id not in products:
+            unavailable.append({'product_id': product_id, 'reason': 'Invalid product or quantity'})
+            continue
+        lines.append((products[product_id], quantity))
+    return jsonify(unavailable=unavailable, **price_cart(lines, data.get('payment_method'))), 200
+
+def serialize_offer(offer):
+    return {
+        'id': offer.id,
+        'name': offer.name,
+        'kind': offer.kind,
+        'value': offer.value,
+        'buy_quantity': offer.buy_quantity,
+        'free_quantity': offer.free_quantity,
+        'product_id': offer.product_id,
+        'category': offer.category,
+        'starts_at': offer.starts_at.isoformat() if offer.starts_at else None,
+        'ends_at': offer.ends_at.isoformat() if offer.ends_at else None,
+        'active': offer.active,
+        'created_at': offer.created_at.isoformat() if offer.created_at else None
+    }
+
+def save_offer(offer, shop, data):
+    """Validate `data` into `offer` (InvalidOffer if it does not hold up) and recompile the offers"""
+    values = pricing.parse_offer(data)
+    if values['product_id'] is not None and not Product.query.filter_by(
+            id=values['product_id'], shop_id=shop.id, deleted_at=None).count():
+        raise InvalidOffer("product_id must be one of your shop's products")
+    for name, value in values.items():
+        setattr(offer, name, value)
+    offer.shop_id = shop.id
+    db.session.add(offer)
+    db.session.commit()
+    price_book.invalidate() # Other workers pick the change up within PRICING_REFRESH_SECONDS
+
+@app.route('/api/shops/my/offers', methods=['GET'])
+@admin_required
+def get_my_offers():
+    owner = get_current_user()
+    shop = Shop.query.filter_by(owner_id=owner.id).first()
+    if not shop:
+        return jsonify(message="Admin does not have a shop."), 404
+    offers = Offer.query.filter_by(shop_id=shop.id).order_by(Offer.created_at.desc(), Offer.id.desc()).all()
+    return jsonify([serialize_offer(offer) for offer in offers]), 200
+
+@app.route('/api/shops/my/offers', methods=['POST'])
+@admin_required
+def create_offer():
+    owner = get_current_user()
+    shop = Shop.query.filter_by(owner_id=owner.id).first()
+    if not shop:
+        return jsonify(message="Admin does not have a shop. Create a shop first."), 400
+    offer = Offer()
+    save_offer(offer, shop, request.get_json() or {})
+    return jsonify(message="Offer created", offer=serialize_offer(offer)), 201
+
+@app.route('/api/shops/my/offers/<int:offer_id>', methods=['PUT'])
+@admin_required
+def update_offer(offer_id):
+    """Change some of an offer's fields; the result is validated as a whole"""
+    owner = get_current_user()
+    shop = Shop.query.filter_by(owner_id=owner.id).first()
+    offer = Offer.query.filter_by(id=offer_id, shop_id=shop.id).first() if shop else None
+    if not offer:
+        return jsonify(message="Offer not found or does not belong to this shop"), 404
+    data = serialize_offer(offer)
+    data.update(request.get_json() or {})
+    save_offer(offer, shop, data)
+    return jsonify(message="Offer updated", offer=serialize_offer(offer)), 200
+
+@app.route('/api/shops/my/offers/<int:offer_id>', methods=['DELETE'])
+@admin_required
+def delete_offer(offer_id):
+    owner = get_current_user()
+    shop = Shop.query.filter_by(owner_id=owner.id).first()
+    offer = Offer.query.filter_by(id=offer_id, shop_id=shop.id).first() if shop else None
+    if not offer:
+        return jsonify(message="Offer not found or does not belong to this shop"), 404
+    db.session.delete(offer)
+    db.session.commit()
+    price_book.invalidate()
+    return jsonify(message="Offer deleted"), 200
 
+# --- Stock Alert Routes ---
+@app.route('/api/shops/my/alerts', methods=['GET'])
+@admin_required
+def get_my_alerts():
+    """The shop's low-stock queue, newest first: at most one alert per product (see stock_alerts.py)"""
+    owner = get_current_user()
+    shop = Shop.query.filter_by(owner_id=owner.id).first()
+    if not shop:
+        return jsonify(message="Admin does not have a shop."), 404
+    query = db.select(StockAlert, Product).join(Product, Product.id == StockAlert.product_id).\
+        filter(StockAlert.shop_id == shop.id, Product.deleted_at.is_(None)).\
+        options(db.load_only(Product.name, Product.image_url, Product.reorder_threshold, Product.available_quantity)).\
+        order_by(StockAlert.raised_at.desc(), StockAlert.product_id)
+    if request.args.get('include_dismissed', 'false').lower() != 'true':
+        query = query.filter(StockAlert.dismissed_at.is_(None))
+    return jsonify([{
+        'product_id': alert.product_id,
+        'name': product.name,
+        'image_url': product.image_url,
+        'level': alert.level,
+        'stock_when_raised': alert.stock,
+        'quantity': product.available_quantity,
+        'reorder_threshold': product.reorder_threshold,
+        'raised_at': alert.raised_at.isoformat(),
+        'dismissed_at': alert.dismissed_at.isoformat() if alert.dismissed_at else None
+    } for alert, product in db.session.execute(query)]), 200
+
+@app.route('/api/shops/my/alerts/<int:product_id>', methods=['DELETE'])
+@admin_required
+def dismiss_alert(product_id):
+    """Hide a product's alert from the queue until its level changes again"""
+    owner = get_current_user()
+    shop = Shop.query.filter_by(owner_id=owner.id).first()
+    dismissed = StockAlert.query.filter_by(product_id=product_id, shop_id=shop.id).\
+        update({StockAlert.dismissed_at: datetime.utcnow()}, synchronize_session=False) if shop else 0
+    if not dismissed:
+        return jsonify(message="No alert for this product in your shop"), 404
+    db.session.commit()
+    return jsonify(message="Alert dismissed"), 200
 
 # --- Order Routes ---
+def inventory_moved_event(product_id, kind, stock_delta, order_id=None):
+    """Event log entry for a change of sellable stock, mirroring an inventory_movements row"""
+    return ('inventory_moved', {'product_id': product_id, 'order_id': order_id, 'kind': kind, 'stock_delta': stock_delta})
+
+def order_placed_log_events(order, line_items):
+    """Event log entries for a just-flushed order: the order with its lines, then each line's sale"""
+    lines = [{key: line[key] for key in ('shop_id', 'product_id', 'quantity', 'unit_price')} for line in line_items]
+    return [('order_placed', {'order_id': order.id, 'customer_id': order.customer_id, 'total_amount': order.total_amount,
+                              'payment_method': order.payment_method, 'lines': lines})] + \
+        [inventory_moved_event(line['product_id'], 'sale', -line['quantity'], order.id) for line in line_items]
+
+def order_created_events(order, customer, line_items, products):
+    """
+    One order_created event per shop in a just-flushed order, shaped like an
+    entry of GET /api/orders/shop. Built before the commit, from what
+    place_order already has loaded, so publishing costs no queries.
+    """
+    by_shop = {}
+    for line in line_items:
+        product = products[line['product_id']]
+        by_shop.setdefault(line['shop_id'], []).append({
+            'product_id': product.id,
+            'name': product.name,
+            'price': product.price,
+            'unit_price': line['unit_price'],
+            'quantity': line['quantity'],
+            'image_url': product.image_url
+        })
+    return [(shop_id, 'order_created', {
+        'id': order.id,
+        'customer_id': customer.id,
+        'customer_name': customer.name,
+        'customer_city': customer.city,
+        'created_at': order.created_at.isoformat(),
+        'total_amount': order.total_amount,
+        'status': order.status,
+        'items_for_this_shop': items,
+        'shop_specific_total_amount': sum(item['unit_price'] * item['quantity'] for item in items)
+    }) for shop_id, items in by_shop.items()]
+
 @app.route('/api/orders', methods=['POST'])
 @customer_required
 def place_order():
@@ -824,72 +1623,104 @@ def place_order():
     payment_info = data.get('payment', {})
     address_id = data.get('address_id')
     
-    current_user_email = get_jwt_identity()
-    customer = User.query.filter_by(email=current_user_email).first()
+    customer = get_current_user()
 
     if not cart_items:
+        metrics.inc('minimart_orders_placed_total', {'outcome': 'invalid'})
         return jsonify(message="Cart is empty"), 400
     
     # Validate address
     if not address_id:
+        metrics.inc('minimart_orders_placed_total', {'outcome': 'invalid'})
         return jsonify(message="Delivery address is required"), 400
     
     address = Address.query.filter_by(id=address_id, user_id=customer.id).first()
     if not address:
+        metrics.inc('minimart_orders_placed_total', {'outcome': 'invalid'})
         return jsonify(message="Invalid delivery address"), 400
 
-    # Create new order with address and payment info
-    new_order = Order(
-        customer_id=customer.id, 
-        address_id=address.id,
-        total_amount=0, # Total amount calculated later
-        payment_method=payment_info.get('method'),
-        payment_transaction_id=payment_info.get('transaction_id')
-    )
-    
-    db.session.add(new_order)
-    db.session.flush() # To get new_order.id
+    # Load every product in the cart with one query instead of one per line, then lock
+    # the rows whose quantity column is decremented. Sharded products are left unlocked:
+    # their stock is taken from one shard row at a time further down.
+    product_ids = [item_data.get('product_id') for item_data in cart_items]
+    products = {p.id: p for p in Product.query.filter(Product.id.in_(product_ids), Product.deleted_at.is_(None)).all()}
+    locked_ids = [p.id for p in products.values() if not p.sharded_stock]
+    if locked_ids:
+        Product.query.filter(Product.id.in_(locked_ids)).with_for_update().populate_existing().all()
 
-    total_order_amount = 0
+    line_items = []
+    stock_before = {} # product id -> sellable units before this order, for stock_alerts
 
     for item_data in cart_items:
-        product = Product.query.get(item_data.get('product_id'))
+        product = products.get(item_data.get('product_id'))
         quantity = item_data.get('quantity')
 
         if not product or not isinstance(quantity, int) or quantity <= 0:
             db.session.rollback() # Important: rollback if any item is invalid
+            metrics.inc('minimart_orders_placed_total', {'outcome': 'invalid'})
             return jsonify(message=f"Invalid product or quantity for product ID {item_data.get('product_id')}."), 400
             
         # Check if there's enough quantity available
-        if product.quantity < quantity:
+        stock_before.setdefault(product.id, product.available_quantity if product.sharded_stock else product.quantity)
+        if product.sharded_stock:
+            # The products row is left alone; the batched sold_count flush bumps its updated_at
+            if not sharded_stock.decrement(db, product.id, quantity):
+                available = sharded_stock.total(db, product.id)
+                db.session.rollback()
+                metrics.inc('minimart_orders_placed_total', {'outcome': 'out_of_stock'})
+                return jsonify(message=f"Not enough quantity available for {product.name}. Available: {available}, Requested: {quantity}"), 400
+        elif product.quantity < quantity:
             db.session.rollback()
+            metrics.inc('minimart_orders_placed_total', {'outcome': 'out_of_stock'})
             return jsonify(message=f"Not enough quantity available for {product.name}. Available: {product.quantity}, Requested: {quantity}"), 400
+        else:
+            # Reduce product quantity immediately when order is placed
+            product.quantity -= quantity
         
-        # Add to order_items association
-        stmt = order_items.insert().values(
-            order_id=new_order.id, 
-            product_id=product.id, 
-            quantity=quantity,
-            shop_id=product.shop_id # Store shop_id with the item
-        )
-        db.session.execute(stmt)
-        
-        # Reduce product quantity immediately when order is placed
-        product.quantity -= quantity
-        
-        # Calculate price (considering any discounts)
-        item_price = product.price
-        if hasattr(product, 'discount_percentage') and product.discount_percentage > 0:
-            item_price = item_price * (1 - (product.discount_percentage / 100))
-            
-        total_order_amount += item_price * quantity
-    
-    # Add COD fee if applicable
-    if payment_info.get('method') == 'cod':
-        total_order_amount += 40  # ₹40 COD fee
-    
-    new_order.total_amount = total_order_amount
+        line_items.append({
+            'product_id': product.id,
+            'quantity': quantity,
+            'shop_id': product.shop_id # Store shop_id with the item
+        })
+
+    # Offers, discounts and the COD fee, exactly as the cart was quoted
+    quote = price_cart([(products[line['product_id']], line['quantity']) for line in line_items],
+                       payment_info.get('method'))
+    for line, priced in zip(line_items, quote['lines']):
+        line['unit_price'] = priced['unit_price']
+
+    # Create new order with address and payment info
+    new_order = Order(
+        customer_id=customer.id, 
+        address_id=address.id,
+        total_amount=quote['total'],
+        payment_method=payment_info.get('method'),
+        payment_transaction_id=payment_info.get('transaction_id')
+    )
+    db.session.add(new_order)
+    db.session.flush() # To get new_order.id
+
+    # Add every line to order_items in a single executemany
+    for line in line_items:
+        line['order_id'] = new_order.id
+    db.session.execute(order_items.insert(), line_items)
+    inventory.record_sales(db, new_order.id, line_items)
+    # Only products this order took past their reorder threshold (or to 0) cost a write
+    sold = {}
+    for line in line_items:
+        sold[line['product_id']] = sold.get(line['product_id'], 0) + line['quantity']
+    stock_alerts.stock_changed(db, [
+        (products[product_id], stock_alerts.level(before, products[product_id].reorder_threshold),
+         before - sold[product_id]) for product_id, before in stock_before.items()])
+    events = order_created_events(new_order, customer, line_items, products)
+    log_events = order_placed_log_events(new_order, line_items)
+    customer_id = customer.id # Read before the commit expires it
     db.session.commit()
+    sold_counts.add(line_items)
+    order_events.publish(events)
+    event_log.append(log_events)
+    customer_analytics_cache.discard(customer_id)
+    metrics.inc('minimart_orders_placed_total', {'outcome': 'success'})
 
     return jsonify(
         message="Order placed successfully", 
@@ -904,50 +1735,122 @@ def place_order():
         }
     ), 201
 
+@app.route('/api/checkout/bootstrap', methods=['POST'])
+@customer_required
+def checkout_bootstrap():
+    """
+    Everything the checkout page needs in one round trip (three queries: the user,
+    their addresses, the cart's products, plus the offers when price_book is
+    stale): profile, addresses with the default flagged, current price and stock
+    for each cart line, and the offers and totals place_order would charge.
+    """
+    data = request.get_json() or {}
+    cart_items = data.get('items') or [] # Same format as place_order: [{"product_id": X, "quantity": Y}, ...]
+    payment_method = data.get('payment_method')
+    if not isinstance(cart_items, list) or len(cart_items) > MAX_QUOTE_LINES:
+        return jsonify(message=f"items must be a list of at most {MAX_QUOTE_LINES} cart lines"), 400
+    user = get_current_user()
+
+    addresses = Address.query.filter_by(user_id=user.id).order_by(Address.is_default.desc(), Address.created_at.desc()).all()
+    default_address = next((a for a in addresses if a.is_default), None)
+
+    cart, unavailable = parse_cart(cart_items)
+    product_ids = [product_id for product_id, _ in cart]
+    rows = db.session.execute(catalog_query().filter(Product.id.in_(product_ids))).all() if product_ids else []
+    products = {p.id: (p, shop) for p, shop in rows}
+
+    lines = []
+    for product_id, quantity in cart:
+        if product_id not in products:
+            unavailable.append({'product_id': product_id, 'reason': 'Invalid product or quantity'})
+            continue
+        product = products[product_id][0]
+        if product.available_quantity < quantity:
+            unavailable.append({'product_id': product_id, 'reason': f"Only {product.available_quantity} available"})
+        lines.append((product, quantity))
+
+    quote = price_cart(lines, payment_method)
+    items = [{
+        'product': serialize_product(product, products[product.id][1]),
+        'quantity': quantity,
+        'unit_price': priced['unit_price'],
+        'line_total': priced['total'],
+        'discount': priced['discount'],
+        'offer': priced['offer'],
+        'in_stock': product.available_quantity >= quantity
+    } for (product, quantity), priced in zip(lines, quote['lines'])]
+
+    return jsonify(
+        user={'id': user.id, 'name': user.name, 'email': user.email, 'role': user.role, 'city': user.city},
+        addresses=[serialize_address(a) for a in addresses],
+        default_address_id=default_address.id if default_address else None,
+        items=items,
+        unavailable=unavailable,
+        totals={'subtotal': round(quote['total'] - quote['cod_fee'], 2), 'discount': quote['discount'],
+                'cod_fee': quote['cod_fee'], 'total': quote['total'], 'payment_method': payment_method},
+        can_checkout=bool(items) and not unavailable and default_address is not None
+    ), 200
+
 @app.route('/api/orders/customer', methods=['GET'])
 @customer_required
 def get_customer_orders():
-    current_user_email = get_jwt_identity()
-    customer = User.query.filter_by(email=current_user_email).first()
-    
-    orders = Order.query.filter_by(customer_id=customer.id).order_by(Order.created_at.desc()).all()
+    """
+    The customer's orders, newest first; ?days= or ?start=&end= narrow them to a
+    window. A window within ORDER_ARCHIVE_DAYS reads the hot tables only, the
+    whole history (the default) the archive too.
+    """
+    customer = get_current_user()
+    fields = requested_fields(CUSTOMER_ORDER_FIELDS, ORDER_FIELD_PRESETS)
+    try:
+        start, end = order_window(request.args)
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+    
+    # Per source: the orders, then line items for all of them in one query
+    orders, items_by_order = [], {}
+    for source, items in order_sources(start):
+        window = in_window(source, start, end)
+        found = db.session.query(source).options(order_columns(fields, source)).\
+            filter(source.customer_id == customer.id, *window).order_by(source.created_at.desc()).all()
+        if found and 'items' in fields:
+            customer_items = db.session.query(items.c.order_id, Product, items.c.quantity, line_unit_price(items)).\
+                options(ORDER_ITEM_PRODUCT_COLUMNS).\
+                join(items, Product.id == items.c.product_id).\
+                join(source, source.id == items.c.order_id).\
+                filter(source.customer_id == customer.id, *window).all()
+            for order_id, product, quantity, unit_price in customer_items:
+                items_by_order.setdefault(order_id, []).append((product, quantity, unit_price))
+        orders += found
+    orders.sort(key=lambda order: order.created_at or datetime.min, reverse=True) # Interleave the sources
+    
+    addresses = {a.id: a for a in Address.query.filter_by(user_id=customer.id).all()} \
+        if orders and 'delivery_address' in fields else {}
     
     result = []
     for order in orders:
-        order_data = {
-            'id': order.id,
-            'created_at': order.created_at.isoformat(),
-            'total_amount': order.total_amount,
-            'status': order.status,
-            'payment_method': order.payment_method,
-            'payment_transaction_id': order.payment_transaction_id,
-            'items': []
-        }
+        order_data = serialize_order_columns(order, fields)
+        if 'items' in fields:
+            order_data['items'] = []
         
         # Add address information if available
-        if order.address_id:
-            address = Address.query.get(order.address_id)
-            if address:
-                order_data['delivery_address'] = {
-                    'id': address.id,
-                    'full_name': address.full_name,
-                    'street_address': address.street_address,
-                    'city': address.city,
-                    'state': address.state,
-                    'postal_code': address.postal_code,
-                    'phone_number': address.phone_number
-                }
-        
-        # Fetch items for this order
-        items_in_order = db.session.query(Product, order_items.c.quantity).\
-            join(order_items, Product.id == order_items.c.product_id).\
-            filter(order_items.c.order_id == order.id).all()
+        address = addresses.get(order.address_id) if 'delivery_address' in fields else None
+        if address:
+            order_data['delivery_address'] = {
+                'id': address.id,
+                'full_name': address.full_name,
+                'street_address': address.street_address,
+                'city': address.city,
+                'state': address.state,
+                'postal_code': address.postal_code,
+                'phone_number': address.phone_number
+            }
         
-        for product, quantity in items_in_order:
+        for product, quantity, unit_price in items_by_order.get(order.id, []):
             order_data['items'].append({
                 'product_id': product.id,
                 'name': product.name,
                 'price': product.price,
+                'unit_price': unit_price,
                 'quantity': quantity,
                 'shop_id': product.shop_id
             })
@@ -955,128 +1858,375 @@ def get_customer_orders():
         
     return jsonify(result), 200
 
+CUSTOMER_FAVORITES = 5
+CUSTOMER_SPENDING_MONTHS = 12
+
+def build_customer_analytics(customer_id, status_rows, sources):
+    """
+    Dashboard figures of a customer from aggregates; `status_rows` are
+    (status, orders, amount, first order, last order) per status and `sources`
+    the order_sources() holding the customer's orders.
+    """
+    now = datetime.utcnow()
+    placed = [row for row in status_rows if row[0] != 'Cancelled']
+    order_count = sum(row[1] for row in status_rows)
+    kept_orders = sum(row[1] for row in placed)
+    total_spent = round(sum(row[2] or 0 for row in placed), 2)
+    first_order = min((row[3] for row in placed), default=None)
+    last_order = max((row[4] for row in placed), default=None)
+    months_active = max((now - first_order).days / 30.44, 1) if first_order else 1
+
+    year, month = divmod(now.year * 12 + now.month - CUSTOMER_SPENDING_MONTHS, 12)
+    since = datetime(year, month + 1, 1)
+    recent = []
+    for source, _ in sources if order_archive.reaches_archive(since, app.config['ORDER_ARCHIVE_DAYS']) else sources[:1]:
+        recent += db.session.query(source.created_at, source.total_amount, source.status).\
+            filter(source.customer_id == customer_id, source.created_at >= since).all()
+    series = timeseries.build_series(recent, since, now, 'month', window=3)
+
+    # Favourites per source; with the archive as well, every group is summed before the top ones are picked
+    categories, products = {}, {}
+    for source, items in sources:
+        kept = db.and_(source.customer_id == customer_id, source.status != 'Cancelled')
+        quantity = db.func.sum(items.c.quantity)
+        spent = db.func.sum(line_amount(items))
+        category_rows = db.session.query(Product.category, quantity, spent,
+                                         db.func.count(db.distinct(items.c.order_id))).\
+            select_from(items).\
+            join(source, source.id == items.c.order_id).\
+            join(Product, Product.id == items.c.product_id).\
+            filter(kept).group_by(Product.category).order_by(quantity.desc(), Product.category)
+        product_rows = db.session.query(Product.id, Product.name, Product.image_url, Product.image_key, quantity,
+                                        db.func.count(items.c.order_id)).\
+            select_from(items).\
+            join(source, source.id == items.c.order_id).\
+            join(Product, Product.id == items.c.product_id).\
+            filter(kept).group_by(Product.id, Product.name, Product.image_url, Product.image_key).\
+            order_by(quantity.desc(), Product.id)
+        if len(sources) == 1:
+            category_rows, product_rows = category_rows.limit(CUSTOMER_FAVORITES), product_rows.limit(CUSTOMER_FAVORITES)
+        for category, units, amount, orders in category_rows.all():
+            total = categories.setdefault(category, [category, 0, 0, 0])
+            total[1], total[2], total[3] = total[1] + units, total[2] + (amount or 0), total[3] + orders
+        for product_id, name, image_url, image_key, units, orders in product_rows.all():
+            total = products.setdefault(product_id, [product_id, name, image_url, image_key, 0, 0])
+            total[4], total[5] = total[4] + units, total[5] + orders
+    categories = sorted(categories.values(), key=lambda row: (-row[1], row[0] or ''))[:CUSTOMER_FAVORITES]
+    products = sorted(products.values(), key=lambda row: (-row[4], row[0]))[:CUSTOMER_FAVORITES]
+
+    return {
+        'order_count': order_count,
+        'cancelled_orders': order_count - kept_orders,
+        'total_spent': total_spent,
+        'average_order_value': round(total_spent / kept_orders, 2) if kept_orders else 0,
+        'orders_by_status': {row[0]: row[1] for row in status_rows},
+        'first_order_at': first_order.isoformat() if first_order else None,
+        'last_order_at': last_order.isoformat() if last_order else None,
+        'orders_per_month': round(kept_orders / months_active, 2),
+        'average_days_between_orders': round((last_order - first_order).days / (kept_orders - 1), 1)
+        if kept_orders > 1 else None,
+        'spending_by_month': [{'month': bucket[:7], 'amount': amount, 'orders': orders}
+                              for bucket, amount, orders in zip(series['buckets'], series['revenue'], series['orders'])],
+        'favorite_categories': [{'category': category, 'quantity': int(units), 'spent': round(spent, 2),
+                                 'orders': orders} for category, units, spent, orders in categories],
+        'favorite_products': [{'id': product_id, 'name': name, 'image_url': image_url,
+                               'image_urls': product_image_urls(image_key), 'quantity': int(units), 'orders': orders}
+                              for product_id, name, image_url, image_key, units, orders in products],
+    }
+
+@app.route('/api/customers/me/analytics', methods=['GET'])
+@customer_required
+def get_customer_analytics():
+    """
+    Spend, order frequency and favourite categories and products of the
+    customer, cached per customer. A cached copy is only used while the
+    customer's order count per status is unchanged: placing an order adds one
+    and a status only moves forward, so any change on any worker is seen.
+    place_order and cancel_order also drop this worker's copy at once.
+    """
+    customer = get_current_user()
+    # Lifetime figures: the archive is read as well, and its lines only if the customer has archived orders
+    by_status, sources = {}, []
+    for source, items in order_sources():
+        rows = db.session.query(source.status, db.func.count(), db.func.sum(source.total_amount),
+                                db.func.min(source.created_at), db.func.max(source.created_at)).\
+            filter(source.customer_id == customer.id).group_by(source.status).all()
+        if rows or not sources:
+            sources.append((source, items))
+        for status, count, amount, first, last in rows:
+            if status in by_status:
+                _, count_before, amount_before, first_before, last_before = by_status[status]
+                count, amount = count + count_before, (amount or 0) + (amount_before or 0)
+                first, last = min(first, first_before), max(last, last_before)
+            by_status[status] = (status, count, amount, first, last)
+    status_rows = [by_status[status] for status in sorted(by_status)]
+    version = tuple((status, count) for status, count, _, _, _ in status_rows)
+
+    payload, generation = customer_analytics_cache.lookup(customer.id, version)
+    if payload is None:
+        payload = app.json.dumps(build_customer_analytics(customer.id, status_rows, sources))
+        customer_analytics_cache.store(customer.id, payload, generation, version)
+    return app.response_class(payload, mimetype='application/json'), 200
+
 @app.route('/api/orders/shop', methods=['GET'])
 @admin_required
 def get_shop_orders():
-    current_user_email = get_jwt_identity()
-    owner = User.query.filter_by(email=current_user_email).first()
+    """
+    Orders with lines from the admin's shop, newest first; ?days= or
+    ?start=&end= narrow them to a window, read from the archive as well only
+    when it reaches back past ORDER_ARCHIVE_DAYS (see get_customer_orders).
+    """
+    owner = get_current_user()
     shop = Shop.query.filter_by(owner_id=owner.id).first()
 
     if not shop:
         return jsonify(message="Admin does not have a shop."), 404
+    try:
+        start, end = order_window(request.args)
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
 
     # Find orders that contain products from this admin's shop
     # This query is a bit more complex as orders can span multiple shops if cart allows.
     # For simplicity, this version assumes an order item is tied to a shop_id in order_items.
-    
-    order_ids_with_shop_items = db.session.query(order_items.c.order_id).\
-        filter(order_items.c.shop_id == shop.id).distinct().all()
-    
-    if not order_ids_with_shop_items:
+    fields = requested_fields(SHOP_ORDER_FIELDS, ORDER_FIELD_PRESETS)
+    with_customer = 'customer_name' in fields or 'customer_city' in fields
+    with_items = 'items_for_this_shop' in fields or 'shop_specific_total_amount' in fields
+    
+    # Per source: orders with their customer in one query, then this shop's lines for all of them in another
+    orders, items_by_order = [], {}
+    for source, items in order_sources(start):
+        shop_order_ids = db.select(items.c.order_id).filter(items.c.shop_id == shop.id)
+        window = in_window(source, start, end)
+        if with_customer:
+            found = db.session.query(source, User).options(order_columns(fields, source), db.load_only(User.name, User.city)).\
+                join(User, source.customer_id == User.id)
+        else:
+            found = db.session.query(source, db.null().label('customer')).options(order_columns(fields, source))
+        found = found.filter(source.id.in_(shop_order_ids), *window).order_by(source.created_at.desc()).all()
+        if found and with_items:
+            shop_items = db.session.query(items.c.order_id, Product, items.c.quantity, line_unit_price(items)).\
+                options(ORDER_ITEM_PRODUCT_COLUMNS).\
+                join(items, Product.id == items.c.product_id).\
+                filter(items.c.shop_id == shop.id)
+            if window:
+                shop_items = shop_items.join(source, source.id == items.c.order_id).filter(*window)
+            for order_id, product, quantity, unit_price in shop_items.all():
+                items_by_order.setdefault(order_id, []).append((product, quantity, unit_price))
+        orders += found
+    
+    if not orders:
         return jsonify([]), 200 # No orders for this shop
-
-    actual_order_ids = [oid[0] for oid in order_ids_with_shop_items]
-    
-    orders = Order.query.filter(Order.id.in_(actual_order_ids)).order_by(Order.created_at.desc()).all()
+    orders.sort(key=lambda row: row[0].created_at or datetime.min, reverse=True) # Interleave the sources
 
     result = []
-    for order in orders:
-        order_data = {
-            'id': order.id,
-            'customer_id': order.customer_id,
-            'customer_name': order.customer.name, # Assuming backref works
-            'customer_city': order.customer.city,
-            'created_at': order.created_at.isoformat(),
-            'total_amount': order.total_amount, # This is total for the whole order
-            'status': order.status,
-            'items_for_this_shop': []
-        }
+    for order, customer in orders:
+        order_data = serialize_order_columns(order, fields)
+        if 'customer_name' in fields:
+            order_data['customer_name'] = customer.name
+        if 'customer_city' in fields:
+            order_data['customer_city'] = customer.city
+        if not with_items:
+            result.append(order_data)
+            continue
         
-        # Fetch items specific to this shop for this order
-        items_for_shop_in_order = db.session.query(Product, order_items.c.quantity).\
-            join(order_items, Product.id == order_items.c.product_id).\
-            filter(order_items.c.order_id == order.id, order_items.c.shop_id == shop.id).all()
-            
+        shop_items = []
         shop_specific_total = 0
-        for product, quantity in items_for_shop_in_order:
-            order_data['items_for_this_shop'].append({
+        for product, quantity, unit_price in items_by_order.get(order.id, []):
+            shop_items.append({
                 'product_id': product.id,
                 'name': product.name,
                 'price': product.price,
+                'unit_price': unit_price,
                 'quantity': quantity,
                 'image_url': product.image_url if hasattr(product, 'image_url') else None
             })
-            shop_specific_total += product.price * quantity
+            shop_specific_total += unit_price * quantity
         
-        order_data['shop_specific_total_amount'] = shop_specific_total
+        if 'items_for_this_shop' in fields:
+            order_data['items_for_this_shop'] = shop_items
+        if 'shop_specific_total_amount' in fields:
+            order_data['shop_specific_total_amount'] = shop_specific_total
         result.append(order_data)
         
     return jsonify(result), 200
 
+@app.route('/api/orders/shop/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string']) # EventSource cannot set headers: ?jwt=<token>
+def stream_shop_orders():
+    """
+    Server-Sent Events of the admin's shop: order_created and order_status_changed
+    as they are committed, resuming after Last-Event-ID (see order_events.py).
+    """
+    owner = get_current_user()
+    if not owner or owner.role != 'admin':
+        return jsonify(message="Admins only!"), 403
+    shop = Shop.query.filter_by(owner_id=owner.id).first()
+    if not shop:
+        return jsonify(message="Admin does not have a shop."), 404
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        subscription, replay = order_events.subscribe(shop.id, last_event_id)
+    except TooManyStreams:
+        return jsonify(message="Too many open order streams, try again shortly"), 503
+    # The generator runs after this request's context (and DB session) is gone
+    response = Response(order_events.stream(subscription, replay), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(lambda: order_events.unsubscribe(subscription)) # Also if never iterated
+    return response
+
+# Status changes a shop owner may make. Stock is taken when the order is placed,
+# so only cancelling touches product quantities (it puts the units back).
+ORDER_STATUS_TRANSITIONS = {
+    'Pending': {'Processing', 'Shipped', 'Delivered', 'Cancelled'},
+    'Processing': {'Shipped', 'Delivered', 'Cancelled'},
+    'Shipped': {'Delivered', 'Cancelled'},
+    'Delivered': set(),
+    'Cancelled': set(),
+}
+MAX_BULK_STATUS_ORDERS = 500
+
+def transition_orders(shop_id, order_ids, new_status):
+    """
+    Move the given orders of a shop to `new_status` with one locking read and one
+    UPDATE. Returns ({order_id: (ok, previous_status, message)}, lines of the orders
+    this cancelled, {changed order_id: its shop ids}); the caller commits, then hands
+    those lines to sold_counts, publishes status_changed_events() for the orders and
+    appends status_changed_log_events() to the event log.
+    """
+    shop_order_ids = db.select(order_items.c.order_id).filter(order_items.c.shop_id == shop_id)
+    current = dict(db.session.query(Order.id, Order.status).
+                   filter(Order.id.in_(order_ids), Order.id.in_(shop_order_ids)).with_for_update().all())
+
+    results, to_update, cancelled_lines, shops_by_order = {}, [], [], {}
+    for order_id in order_ids:
+        status = current.get(order_id)
+        if status is None:
+            results[order_id] = (False, None, "Order not found or does not contain items from your shop")
+        elif status == new_status:
+            results[order_id] = (True, status, f"Order is already {new_status}")
+        elif new_status not in ORDER_STATUS_TRANSITIONS.get(status, set()):
+            results[order_id] = (False, status, f"Cannot change order status from {status} to {new_status}")
+        else:
+            results[order_id] = (True, status, f"Order status updated to {new_status}")
+            to_update.append(order_id)
+
+    if to_update:
+        db.session.query(Order).filter(Order.id.in_(to_update)).\
+            update({Order.status: new_status}, synchronize_session=False)
+        # Every shop with lines in a changed order is told, not only the one changing it.
+        # A cancellation needs the lines themselves, other changes only the shops.
+        if new_status == 'Cancelled':
+            inventory.restock_cancelled(db, to_update)
+            stock_alerts.restocked(db, to_update)
+            lines = db.session.query(order_items.c.order_id, order_items.c.shop_id,
+                                     order_items.c.product_id, order_items.c.quantity).\
+                filter(order_items.c.order_id.in_(to_update)).all()
+            cancelled_lines = [{'order_id': order_id, 'product_id': product_id, 'quantity': quantity}
+                               for order_id, _, product_id, quantity in lines]
+        else:
+            if new_status == 'Shipped':
+                inventory.record_shipments(db, to_update)
+            lines = db.session.query(order_items.c.order_id, order_items.c.shop_id).distinct().\
+                filter(order_items.c.order_id.in_(to_update)).all()
+        for order_id, shop, *_ in lines:
+            shops_by_order.setdefault(order_id, set()).add(shop)
+    return results, cancelled_lines, shops_by_order
+
+def status_changed_events(shops_by_order, new_status, previous_statuses):
+    """order_status_changed events for every shop of each changed order"""
+    return [(shop_id, 'order_status_changed',
+             {'id': order_id, 'status': new_status, 'previous_status': previous_statuses.get(order_id)})
+            for order_id, shop_ids in shops_by_order.items() for shop_id in sorted(shop_ids)]
+
+def status_changed_log_events(shops_by_order, new_status, previous_statuses, cancelled_lines):
+    """Event log entries for changed orders (see event_log.py): the change, and the units a cancellation returned"""
+    return [('order_status_changed', {'order_id': order_id, 'status': new_status,
+                                      'previous_status': previous_statuses.get(order_id),
+                                      'shop_ids': sorted(shop_ids)})
+            for order_id, shop_ids in shops_by_order.items()] + \
+        [inventory_moved_event(line['product_id'], 'cancel_restock', line['quantity'], line['order_id'])
+         for line in cancelled_lines]
+
+def validate_order_status(new_status):
+    if not new_status:
+        return "New status is required"
+    if new_status not in ORDER_STATUS_TRANSITIONS:
+        return f"Invalid status. Must be one of: {', '.join(ORDER_STATUS_TRANSITIONS)}"
+    return None
+
 @app.route('/api/orders/<int:order_id>/status', methods=['PUT'])
 @admin_required
 def update_order_status(order_id):
     data = request.get_json()
     new_status = data.get('status')
     
-    if not new_status:
-        return jsonify(message="New status is required"), 400
-        
-    # Validate status value
-    valid_statuses = ['Pending', 'Processing', 'Shipped', 'Delivered', 'Cancelled']
-    if new_status not in valid_statuses:
-        return jsonify(message=f"Invalid status. Must be one of: {', '.join(valid_statuses)}"), 400
+    error = validate_order_status(new_status)
+    if error:
+        return jsonify(message=error), 400
     
     # Get current user's shop
-    current_user_email = get_jwt_identity()
-    owner = User.query.filter_by(email=current_user_email).first()
+    owner = get_current_user()
     shop = Shop.query.filter_by(owner_id=owner.id).first()
     
     if not shop:
         return jsonify(message="Admin does not have a shop."), 403
     
-    # Check if order exists and contains items from this shop
-    order_has_shop_items = db.session.query(order_items).\
-        filter(order_items.c.order_id == order_id, order_items.c.shop_id == shop.id).first()
-    
-    if not order_has_shop_items:
-        return jsonify(message="Order not found or does not contain items from your shop"), 404
-    
-    # Update order status
-    order = Order.query.get(order_id)
-    if not order:
-        return jsonify(message="Order not found"), 404
-    
-    # If status is changing to "Shipped", reduce product quantities
-    if new_status == 'Shipped' and order.status != 'Shipped':
-        # Get all items in this order for this shop
-        order_items_for_shop = db.session.query(order_items).filter(
-            order_items.c.order_id == order_id,
-            order_items.c.shop_id == shop.id
-        ).all()
-        
-        for item in order_items_for_shop:
-            product = Product.query.get(item.product_id)
-            if product:
-                # Check if there's enough quantity
-                if product.quantity < item.quantity:
-                    return jsonify(message=f"Not enough quantity for product {product.name}. Available: {product.quantity}, Required: {item.quantity}"), 400
-                
-                # Reduce the quantity
-                product.quantity -= item.quantity
-        
-    order.status = new_status
+    results, cancelled_lines, shops_by_order = transition_orders(shop.id, [order_id], new_status)
+    ok, previous_status, message = results[order_id]
+    if not ok:
+        db.session.rollback()
+        return jsonify(message=message), 404 if previous_status is None else 400
     db.session.commit()
+    sold_counts.add(cancelled_lines, sign=-1)
+    order_events.publish(status_changed_events(shops_by_order, new_status, {order_id: previous_status}))
+    event_log.append(status_changed_log_events(shops_by_order, new_status, {order_id: previous_status}, cancelled_lines))
     
     return jsonify(message=f"Order status updated to {new_status}", order_id=order_id, status=new_status), 200
 
+@app.route('/api/orders/status', methods=['PUT'])
+@admin_required
+def bulk_update_order_status():
+    data = request.get_json() or {}
+    new_status = data.get('status')
+    order_ids = data.get('order_ids')
+
+    error = validate_order_status(new_status)
+    if error:
+        return jsonify(message=error), 400
+    if not isinstance(order_ids, list) or not order_ids or not all(isinstance(i, int) for i in order_ids):
+        return jsonify(message="order_ids must be a non-empty list of order IDs"), 400
+    if len(order_ids) > MAX_BULK_STATUS_ORDERS:
+        return jsonify(message=f"At most {MAX_BULK_STATUS_ORDERS} orders can be updated at once"), 400
+    order_ids = list(dict.fromkeys(order_ids)) # Drop duplicates, keep order
+
+    owner = get_current_user()
+    shop = Shop.query.filter_by(owner_id=owner.id).first()
+
+    if not shop:
+        return jsonify(message="Admin does not have a shop."), 403
+
+    results, cancelled_lines, shops_by_order = transition_orders(shop.id, order_ids, new_status)
+    db.session.commit()
+    sold_counts.add(cancelled_lines, sign=-1)
+    previous_statuses = {order_id: previous for order_id, (_, previous, _) in results.items()}
+    order_events.publish(status_changed_events(shops_by_order, new_status, previous_statuses))
+    event_log.append(status_changed_log_events(shops_by_order, new_status, previous_statuses, cancelled_lines))
+
+    return jsonify(
+        status=new_status,
+        updated=sum(1 for ok, previous, _ in results.values() if ok and previous != new_status),
+        results=[{'order_id': order_id, 'ok': ok, 'previous_status': previous, 'message': message}
+                 for order_id, (ok, previous, message) in results.items()]
+    ), 200
+
 @app.route('/api/orders/<int:order_id>/cancel', methods=['PUT'])
 @jwt_required()
 def cancel_order(order_id):
     try:
         # Get the current user
-        current_user_email = get_jwt_identity()
-        current_user = User.query.filter_by(email=current_user_email).first()
+        current_user = get_current_user()
         
         if not current_user:
             return jsonify(message="User not found"), 404
@@ -1112,14 +2262,32 @@ def cancel_order(order_id):
         if order.status == 'Cancelled':
             return jsonify(message="Order is already cancelled"), 400
         
-        # Update the order status to Cancelled
-        order.status = 'Cancelled'
+        # Update the order status to Cancelled. Guarded on the status so that of two
+        # concurrent cancellations only one returns the stock.
+        cancelled = Order.query.filter(Order.id == order.id, Order.status.notin_(['Cancelled', 'Delivered'])).\
+            update({Order.status: 'Cancelled'}, synchronize_session=False)
+        if not cancelled:
+            db.session.rollback()
+            return jsonify(message="Order is already cancelled"), 400
+        previous_status, customer_id = order.status, order.customer_id
+        inventory.restock_cancelled(db, [order.id])
+        stock_alerts.restocked(db, [order.id])
+        lines = db.session.query(order_items.c.shop_id, order_items.c.product_id, order_items.c.quantity).\
+            filter(order_items.c.order_id == order.id).all()
         db.session.commit()
+        cancelled_lines = [{'order_id': order_id, 'product_id': product_id, 'quantity': quantity}
+                           for _, product_id, quantity in lines]
+        shops_by_order = {order_id: {shop_id for shop_id, _, _ in lines}}
+        sold_counts.add(cancelled_lines, sign=-1)
+        order_events.publish(status_changed_events(shops_by_order, 'Cancelled', {order_id: previous_status}))
+        event_log.append(status_changed_log_events(shops_by_order, 'Cancelled', {order_id: previous_status},
+                                                   cancelled_lines))
+        customer_analytics_cache.discard(customer_id)
         
         return jsonify(
             message="Order cancelled successfully",
-            order_id=order.id,
-            status=order.status
+            order_id=order_id,
+            status='Cancelled'
         ), 200
         
     except Exception as e:
@@ -1141,8 +2309,7 @@ def get_shop_analytics():
         - Order status breakdown
         - Top selling products
     """
-    current_user_email = get_jwt_identity()
-    owner = User.query.filter_by(email=current_user_email).first()
+    owner = get_current_user()
     shop = Shop.query.filter_by(owner_id=owner.id).first()
     
     if not shop:
@@ -1150,14 +2317,14 @@ def get_shop_analytics():
     
     # Get time range from query parameters (default to last 30 days)
     days = request.args.get('days', 30, type=int)
-    start_date = datetime.utcnow() - timedelta(days=days)
-    
-    # Find orders that contain products from this shop
-    order_ids_with_shop_items = db.session.query(order_items.c.order_id).\
-        filter(order_items.c.shop_id == shop.id).distinct().all()
+    try:
+        start_date = datetime.utcnow() - timedelta(days=days)
+    except OverflowError:
+        return jsonify(message="days reaches back too far"), 400
     
-    if not order_ids_with_shop_items:
-        # Return empty analytics if no orders
+    # Return empty analytics if the shop has never had an order in the window's sources
+    sources = order_sources(start_date)
+    if not any(db.session.query(items.c.order_id).filter(items.c.shop_id == shop.id).first() for _, items in sources):
         return jsonify({
             'totalSales': 0,
             'totalOrders': 0,
@@ -1168,13 +2335,20 @@ def get_shop_analytics():
             'topProducts': []
         }), 200
     
-    actual_order_ids = [oid[0] for oid in order_ids_with_shop_items]
-    
-    # Get orders within the time range
-    orders = Order.query.filter(
-        Order.id.in_(actual_order_ids),
-        Order.created_at >= start_date
-    ).order_by(Order.created_at.desc()).all()
+    # Orders within the time range with this shop's share of each, summed in the database
+    # rather than one items query per order; the archive only for ranges reaching back into it
+    orders, sold_from = [], []
+    for source, items in sources:
+        source_orders = db.session.query(source.customer_id, source.status, source.created_at,
+                                         db.func.sum(line_amount(items))).\
+            select_from(items).\
+            join(source, source.id == items.c.order_id).\
+            join(Product, Product.id == items.c.product_id).\
+            filter(items.c.shop_id == shop.id, source.created_at >= start_date).\
+            group_by(source.id, source.customer_id, source.status, source.created_at).all()
+        if source_orders:
+            orders += source_orders
+            sold_from.append((source, items))
     
     # Calculate total sales for this shop
     total_sales = 0
@@ -1191,14 +2365,8 @@ def get_shop_analytics():
     # Group revenue by date
     revenue_by_date = {}
     
-    for order in orders:
-        # Get items for this shop in this order
-        items_for_shop = db.session.query(Product, order_items.c.quantity).\
-            join(order_items, Product.id == order_items.c.product_id).\
-            filter(order_items.c.order_id == order.id, order_items.c.shop_id == shop.id).all()
-        
-        # Calculate shop-specific total for this order
-        shop_specific_total = sum(product.price * quantity for product, quantity in items_for_shop)
+    for customer_id, status, created_at, shop_specific_total in orders:
+        shop_specific_total = shop_specific_total or 0
         
         # Add to total sales
         total_sales += shop_specific_total
@@ -1208,14 +2376,14 @@ def get_shop_analytics():
             order_values.append(shop_specific_total)
         
         # Add customer to unique customers set
-        customer_ids.add(order.customer_id)
+        customer_ids.add(customer_id)
         
         # Count order status
-        if order.status in order_status_counts:
-            order_status_counts[order.status] += 1
+        if status in order_status_counts:
+            order_status_counts[status] += 1
         
         # Add to revenue by date
-        order_date = order.created_at.date().isoformat()
+        order_date = created_at.date().isoformat()
         if order_date in revenue_by_date:
             revenue_by_date[order_date] += shop_specific_total
         else:
@@ -1228,30 +2396,26 @@ def get_shop_analytics():
     revenue_data = [{'date': date, 'revenue': revenue} for date, revenue in revenue_by_date.items()]
     revenue_data.sort(key=lambda x: x['date'])  # Sort by date
     
-    # Get top selling products
-    top_products_query = db.session.query(
-        Product,
-        db.func.sum(order_items.c.quantity).label('total_quantity'),
-        db.func.sum(Product.price * order_items.c.quantity).label('total_revenue')
-    ).\
-    join(order_items, Product.id == order_items.c.product_id).\
-    filter(
-        order_items.c.shop_id == shop.id,
-        order_items.c.order_id.in_(actual_order_ids)
-    ).\
-    group_by(Product.id).\
-    order_by(db.text('total_quantity DESC')).\
-    limit(5).all()
-    
-    top_products = [
-        {
-            'id': product.id,
-            'name': product.name,
-            'sales': int(total_quantity),
-            'revenue': float(total_revenue)
-        }
-        for product, total_quantity, total_revenue in top_products_query
-    ]
+    # Top selling products of the same range; with archived orders as well, summed over both before picking
+    sold = {}
+    for source, items in sold_from:
+        top_products_query = db.session.query(
+            Product.id,
+            Product.name,
+            db.func.sum(items.c.quantity).label('total_quantity'),
+            db.func.sum(line_amount(items)).label('total_revenue')
+        ).\
+        join(items, Product.id == items.c.product_id).\
+        join(source, source.id == items.c.order_id).\
+        filter(items.c.shop_id == shop.id, source.created_at >= start_date).\
+        group_by(Product.id, Product.name).\
+        order_by(db.text('total_quantity DESC'))
+        for product_id, name, total_quantity, total_revenue in \
+                (top_products_query.limit(5) if len(sold_from) == 1 else top_products_query).all():
+            product = sold.setdefault(product_id, {'id': product_id, 'name': name, 'sales': 0, 'revenue': 0.0})
+            product['sales'] += int(total_quantity)
+            product['revenue'] += float(total_revenue)
+    top_products = sorted(sold.values(), key=lambda product: -product['sales'])[:5]
     
     # Prepare response
     analytics_data = {
@@ -1266,8 +2430,124 @@ def get_shop_analytics():
     
     return jsonify(analytics_data), 200
 
+@app.route('/api/admin/analytics/timeseries', methods=['GET'])
+@admin_required
+def get_shop_timeseries():
+    """
+    Revenue, orders and cancellations of the admin's shop per hour, day, week or
+    month, gap-filled, with a trailing moving average (see timeseries.py). One
+    query fetches a row per order in the window; bucketing happens in NumPy.
+    """
+    owner = get_current_user()
+    shop = Shop.query.filter_by(owner_id=owner.id).first()
+
+    if not shop:
+        return jsonify(message="Admin does not have a shop."), 404
+
+    resolution = request.args.get('resolution', 'day')
+    if resolution not in timeseries.RESOLUTIONS:
+        return jsonify(message=f"resolution must be one of: {', '.join(timeseries.RESOLUTIONS)}"), 400
+    try:
+        start, end = timeseries.parse_window(request.args)
+    except ValueError as e:
+        return jsonify(message=str(e)), 400
+    window = request.args.get('window', timeseries.RESOLUTIONS[resolution][1], type=int)
+    if window < 1:
+        return jsonify(message="window must be at least 1"), 400
+    if timeseries.bucket_count(start, end, resolution) > timeseries.MAX_BUCKETS:
+        return jsonify(message=f"At most {timeseries.MAX_BUCKETS} buckets; use a coarser resolution or a shorter window"), 400
+
+    rows = []
+    for source, items in order_sources(start):
+        rows += db.session.query(source.created_at, db.func.sum(line_amount(items)), source.status).\
+            select_from(items).\
+            join(source, source.id == items.c.order_id).\
+            join(Product, Product.id == items.c.product_id).\
+            filter(items.c.shop_id == shop.id, source.created_at >= start, source.created_at <= end).\
+            group_by(source.id, source.created_at, source.status).all()
+
+    series = timeseries.build_series(rows, start, end, resolution, window)
+    return jsonify(shop_id=shop.id, start=start.isoformat(), end=end.isoformat(), **series), 200
+
+MAX_PLATFORM_GROUPS = 10000
+
+@app.route('/api/platform/analytics', methods=['GET'])
+@platform_admin_required
+def get_platform_analytics():
+    """
+    Revenue, units, lines and orders across all shops, filtered and grouped by
+    up to two of city, category, shop, status, hour, weekday, day and month.
+    Answered from the exported fact store (see fact_store.py), not the database.
+    """
+    group_by = [name.strip() for name in request.args.get('group_by', 'city').split(',') if name.strip()]
+    filters = {}
+    if any(request.args.get(name) for name in ('start', 'end', 'days')):
+        try:
+            filters['start'], filters['end'] = timeseries.parse_window(request.args)
+        except ValueError as e:
+            return jsonify(message=str(e)), 400
+    for name in ('city', 'category', 'status'):
+        if request.args.get(name):
+            filters[name] = [value.strip() for value in request.args[name].split(',')]
+    if request.args.get('shop_id'):
+        try:
+            filters['shop_id'] = [int(value) for value in request.args['shop_id'].split(',')]
+        except ValueError:
+            return jsonify(message="shop_id must be a comma-separated list of ids"), 400
+    if filters.get('status') is None:
+        filters['status'] = [status for status in fact_store.STATUSES if status != 'Cancelled']
+    elif filters['status'] == ['all']:
+        filters['status'] = None
+    sort = request.args.get('sort', 'key')
+    if sort not in ('key', 'revenue', 'orders'):
+        return jsonify(message="sort must be key, revenue or orders"), 400
+    limit = request.args.get('limit', 1000, type=int)
+    if not 1 <= limit <= MAX_PLATFORM_GROUPS:
+        return jsonify(message=f"limit must be between 1 and {MAX_PLATFORM_GROUPS}"), 400
+
+    store = fact_store.FactStore(app.config['FACT_STORE_DIR'])
+    try:
+        manifest, groups, totals = fact_store.query(store, filters, group_by, app.config['FACT_STORE_WORKERS'])
+    except fact_store.FactQueryError as e:
+        return jsonify(message=str(e)), 400
+    except fact_store.FactStoreMissing:
+        return jsonify(message="Platform analytics have not been exported yet"), 503
+
+    if sort != 'key':
+        groups.sort(key=lambda group: group[sort], reverse=True)
+    return jsonify(group_by=group_by, groups=groups[:limit], group_count=len(groups), totals=totals,
+                   exported_through_order=manifest['last_order_id'], exported_at=manifest['exported_at']), 200
+
+
+@app.route('/api/batch', methods=['POST'])
+@jwt_required(optional=True)
+def batch_requests():
+    """Run several GET endpoints in one round trip (see batch.py)"""
+    data = request.get_json(silent=True)
+    try:
+        specs = batch.parse_requests(data, app.config['BATCH_MAX_REQUESTS'])
+    except batch.BatchError as e:
+        return jsonify(message=str(e)), 400
+
+    # Resolve the caller once; sequential sub-requests find it on the shared g
+    user = get_current_user() if get_jwt_identity() else None
+
+    def share_principal():
+        if user is not None:
+            g.current_user = db.session.merge(user, load=False)
+
+    responses = batch.run_batch(app, specs, request.headers, parallel=bool(data.get('parallel')),
+                                share_principal=share_principal)
+    return jsonify(responses=responses), 200
+
 
 # --- Error Handlers ---
+@app.errorhandler(InvalidFields)
+@app.errorhandler(InvalidLocation)
+@app.errorhandler(InvalidOffer)
+def handle_invalid_fields(e):
+    return jsonify(message=str(e)), 400
+
 @app.errorhandler(500)
 def handle_500_error(e):
     response = jsonify({"message": "Internal server error", "error": str(e)})
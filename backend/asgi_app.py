@@ -0,0 +1,184 @@
+# backend/asgi_app.py
+"""
+Async (ASGI) read path for the public catalog and shop listing endpoints.
+
+The read-only routes below are served from an async SQLAlchemy engine so a
+single worker can keep many MySQL round trips in flight, while every other
+request falls through to the regular Flask app. Models, statements and
+serializers are imported from app.py, so responses match the sync routes.
+
+Run with:
+    uvicorn asgi_app:application --workers 2 --port 5000
+"""
+import os
+import re
+from urllib.parse import parse_qs, unquote
+
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import decode_token
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import (app, db, Product, Shop, catalog_query, shops_in_city_query, serialize_product, serialize_shop,
+                 InvalidFields, PRODUCT_FIELDS, PRODUCT_FIELD_PRESETS, parse_fields, product_columns)
+from response_cache import catalog_cache
+
+# Sync drivers used by app.py and their async counterparts
+ASYNC_DRIVERS = {
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+def async_database_url(url):
+    """Swap the driver in a SQLALCHEMY_DATABASE_URI for its asyncio equivalent"""
+    scheme, sep, rest = url.partition('://')
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL') or async_database_url(app.config['SQLALCHEMY_DATABASE_URI'])
+
+engine_options = {}
+if not ASYNC_DATABASE_URL.startswith('sqlite'):
+    # SQLite stand-ins use a static pool, MySQL gets a real one
+    engine_options = {
+        'pool_size': int(os.environ.get('ASYNC_DB_POOL_SIZE', 10)),
+        'pool_recycle': 3600,
+        'pool_pre_ping': True
+    }
+engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options)
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+
+class AuthError(Exception):
+    def __init__(self, body):
+        self.body = body
+
+
+def require_jwt(headers):
+    """Same check as @jwt_required(): a valid bearer token in the Authorization header"""
+    auth = headers.get(b'authorization', b'').decode('latin-1')
+    if not auth.startswith('Bearer '):
+        raise AuthError({'message': 'Missing Authorization Header', 'error': 'authorization_required'})
+    try:
+        with app.app_context():
+            return decode_token(auth[len('Bearer '):])
+    except Exception:
+        raise AuthError({'message': 'Invalid or expired token', 'error': 'invalid_token'})
+
+
+# --- Async Route Handlers ---
+async def get_all_products(session, fields):
+    rows = (await session.execute(catalog_query(fields))).all()
+    if not rows:
+        return {'message': "No products found"}, 404
+    return [serialize_product(p, shop, fields) for p, shop in rows], 200
+
+async def get_products_by_city(session, fields, city_name):
+    shops_in_city = (await session.execute(shops_in_city_query(city_name))).scalars().all()
+    if not shops_in_city:
+        return {'message': f"No shops found in {city_name}, hence no products."}, 404
+
+    shop_ids = [shop.id for shop in shops_in_city]
+    rows = (await session.execute(catalog_query(fields).filter(Product.shop_id.in_(shop_ids)))).all()
+    if not rows:
+        return {'message': f"No products found in {city_name}"}, 404
+    return [serialize_product(p, shop, fields) for p, shop in rows], 200
+
+async def get_products_by_shop(session, fields, shop_id):
+    shop = await session.get(Shop, int(shop_id))
+    if not shop or shop.deleted_at:
+        return {'message': "Shop not found"}, 404
+
+    products = (await session.execute(
+        db.select(Product).options(product_columns(fields)).filter_by(shop_id=shop.id, deleted_at=None).order_by(Product.id)
+    )).scalars().all()
+    return [serialize_product(p, shop, fields) for p in products], 200
+
+async def get_shops_by_city(session, city_name):
+    shops = (await session.execute(shops_in_city_query(city_name))).scalars().all()
+    if not shops:
+        return {'message': f"No shops found in {city_name}"}, 404
+    return [serialize_shop(shop) for shop in shops], 200
+
+
+# (pattern, handler, jwt_required, cache name) - mirrors the Flask URL rules of the same name.
+# Cached handlers take ?fields= and share catalog_cache keys with the Flask routes.
+ROUTES = [
+    (re.compile(r'^/api/products$'), get_all_products, False, 'products'),
+    (re.compile(r'^/api/products/city/(?P<city_name>[^/]+)$'), get_products_by_city, False, 'city_products'),
+    (re.compile(r'^/api/shops/(?P<shop_id>\d+)/products$'), get_products_by_shop, False, 'shop_products'),
+    (re.compile(r'^/api/shops/city/(?P<city_name>[^/]+)$'), get_shops_by_city, True, None),
+]
+
+
+class CatalogReadApp:
+    """ASGI app answering the catalog GETs itself and handing everything else to `fallback`"""
+
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def match(self, scope):
+        if scope['type'] != 'http' or scope['method'] != 'GET':
+            return None, None, False, None
+        for pattern, handler, auth, cache_name in ROUTES:
+            m = pattern.match(scope['path'])
+            if m:
+                return handler, {k: unquote(v) for k, v in m.groupdict().items()}, auth, cache_name
+        return None, None, False, None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        handler, kwargs, auth, cache_name = self.match(scope)
+        if handler is None:
+            return await self.fallback(scope, receive, send)
+
+        payload = None
+        try:
+            if auth:
+                require_jwt(dict(scope['headers']))
+            if cache_name:
+                query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+                fields = parse_fields(query.get('fields', [None])[-1], PRODUCT_FIELDS, PRODUCT_FIELD_PRESETS)
+                key = (cache_name, *(int(v) if k == 'shop_id' else v for k, v in kwargs.items()), fields)
+                payload, generation = catalog_cache.lookup(key)
+                kwargs['fields'] = fields
+            if payload is None:
+                async with Session() as session:
+                    body, status = await handler(session, **kwargs)
+                if cache_name and status == 200:
+                    catalog_cache.store(key, app.json.dumps(body), generation)
+            else:
+                status = 200
+        except AuthError as e:
+            body, status = e.body, 401
+        except InvalidFields as e:
+            body, status = {'message': str(e)}, 400
+        except Exception as e:
+            # Same shape as the global Flask error handler
+            body, status = {'error': str(e)}, 500
+
+        payload = (payload or app.json.dumps(body)).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(payload)).encode()),
+                (b'access-control-allow-origin', b'*'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = CatalogReadApp(WsgiToAsgi(app))
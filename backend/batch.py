@@ -0,0 +1,110 @@
+# backend/batch.py
+"""
+Multiplexed GET requests: POST /api/batch runs several read endpoints in one
+round trip, e.g. a dashboard loading its shop, orders and analytics at once.
+
+    {"requests": [{"id": "shop", "path": "/api/shops/my"},
+                  {"id": "orders", "path": "/api/orders/shop?page=1"}],
+     "parallel": false}
+
+Each sub-request goes through the normal Flask dispatch for its path (URL map,
+jwt_required, role checks, error handlers, metrics), with the batch request's
+Authorization header and nothing else. By default they run one after the other
+inside the batch request's app context, so they share its g (the user is looked
+up once) and its DB session. With "parallel": true they run on a bounded thread
+pool instead; each worker gets its own app context and session, and
+share_principal() hands it the already-loaded user.
+
+Only GET sub-requests are accepted, so running them in any order is safe.
+Streamed responses (GET /api/orders/shop/stream) are closed unread and
+reported as a 400 for that sub-request: draining one would hold the batch,
+a pool thread and a stream slot for the stream's whole lifetime.
+
+Settings (app.config):
+    BATCH_MAX_REQUESTS  sub-requests allowed per batch (default 20)
+    BATCH_MAX_WORKERS   threads shared by all parallel batches of a process (default 4)
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.test import EnvironBuilder
+
+FORWARDED_HEADERS = ('Authorization', 'Accept-Language')
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+class BatchError(ValueError):
+    """The batch body itself is invalid (reported as a 400 for the whole batch)"""
+
+
+def parse_requests(body, max_requests):
+    """Validated [(id, path)] from the batch body"""
+    specs = body.get('requests') if isinstance(body, dict) else None
+    if not isinstance(specs, list) or not specs:
+        raise BatchError("requests must be a non-empty list")
+    if len(specs) > max_requests:
+        raise BatchError(f"At most {max_requests} requests per batch")
+
+    parsed = []
+    for index, spec in enumerate(specs):
+        if not isinstance(spec, dict) or not isinstance(spec.get('path'), str):
+            raise BatchError(f"Request {index} needs a path")
+        if spec.get('method', 'GET').upper() != 'GET':
+            raise BatchError(f"Request {index}: only GET requests can be batched")
+        path = spec['path']
+        if not path.startswith('/api/') or path.startswith('/api/batch'):
+            raise BatchError(f"Request {index}: path must be an /api/ endpoint other than /api/batch")
+        parsed.append((spec.get('id', index), path))
+    return parsed
+
+
+def _executor(max_workers):
+    """Process-wide pool, recreated after a fork (threads do not survive one)"""
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool_pid != os.getpid():
+                _pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch')
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _dispatch(app, path, headers):
+    path, _, query_string = path.partition('?')
+    environ = EnvironBuilder(path=path, query_string=query_string, method='GET', headers=headers).get_environ()
+    with app.request_context(environ):
+        response = app.full_dispatch_request()
+    if response.is_streamed:
+        response.close()  # Runs its call_on_close callbacks, e.g. giving back a stream slot
+        return 400, {'message': "Streaming endpoints cannot be batched"}
+    body = response.get_json(silent=True) if response.is_json else response.get_data(as_text=True)
+    return response.status_code, body
+
+
+def run_batch(app, specs, headers, parallel=False, share_principal=None):
+    """
+    Run the parsed sub-requests and return [{'id', 'status', 'body'}] in the
+    order given. Sequential sub-requests must be run from inside the batch
+    request (they reuse its app context); parallel ones call
+    share_principal() in each worker's fresh app context before dispatching.
+    """
+    headers = {name: headers[name] for name in FORWARDED_HEADERS if name in headers}
+
+    if not parallel or len(specs) == 1:
+        results = [_dispatch(app, path, headers) for _, path in specs]
+    else:
+        def run(path):
+            with app.app_context():
+                if share_principal is not None:
+                    share_principal()
+                return _dispatch(app, path, headers)
+
+        pool = _executor(int(app.config.get('BATCH_MAX_WORKERS', 4)))
+        results = list(pool.map(run, [path for _, path in specs]))
+
+    return [{'id': request_id, 'status': status, 'body': body}
+            for (request_id, _), (status, body) in zip(specs, results)]
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# backend/benchmark.py
+"""
+Reproducible benchmark for the API routes in app.py.
+
+Boots the Flask app in-process against a throwaway SQLite database (or a MySQL
+stand-in given with --database-url), seeds a synthetic dataset, then drives a
+weighted mix of customer and admin sessions through the test client:
+
+    browse_city   list a city's products and shops
+    view_shop     open one shop's catalog
+    add_to_cart   re-read the shop catalog and the saved addresses (the cart itself lives in the client)
+    checkout      load the checkout page in one bootstrap call and place an order
+    admin         shop dashboard: analytics, incoming orders, own shop
+
+Routes the mix does not reach (auth, address and product writes, image
+uploads, offers and alerts, status changes, cancellations, related and nearby
+lookups, delta sync, quotes, batches and the remaining analytics) are exercised
+in a coverage pass afterwards. The order stream is left out: a request to it
+lasts as long as the connection does. For each endpoint the run reports
+p50/p95/p99 latency, throughput and SQL statements per request, writes them as
+JSON, and compares them against a stored baseline.
+
+The gate compares medians: most coverage routes get only --coverage-iterations
+samples, so their p95 is a single request and one GC pause or disk flush would
+fail the run. Statement counts are compared as well.
+
+Usage:
+    python benchmark.py                                  # run and compare against benchmark_baseline.json
+    python benchmark.py --sessions 2000 --orders 20000   # bigger run
+    python benchmark.py --update-baseline                # accept the current numbers
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import struct
+import time
+import zlib
+from datetime import datetime
+
+from sqlalchemy import event
+
+import fact_store
+import recommendations
+import seed_data
+from sql_profiler import capture_sql, instrument_engine
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, 'benchmark_baseline.json')
+
+SCENARIO_WEIGHTS = {
+    'browse_city': 45,
+    'view_shop': 25,
+    'add_to_cart': 12,
+    'checkout': 10,
+    'admin': 8,
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Timings and statement counts per Flask endpoint"""
+
+    def __init__(self, backend, client):
+        self.backend = backend
+        self.client = client
+        self.adapter = backend.app.url_map.bind('localhost')
+        self.samples = {}  # endpoint -> [(seconds, statements, status)]
+
+    def call(self, method, path, token=None, json_body=None, form=None):
+        endpoint, _ = self.adapter.match(path.split('?')[0], method=method)
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        with capture_sql() as profile:
+            started = time.perf_counter()
+            response = self.client.open(path, method=method, headers=headers, json=json_body, data=form)
+            elapsed = time.perf_counter() - started
+        self.samples.setdefault(endpoint, []).append((elapsed, profile.count, response.status_code))
+        if response.status_code >= 500:
+            raise RuntimeError(f"{method} {path} failed with {response.status_code}: {response.get_data(as_text=True)[:300]}")
+        return response
+
+    def results(self):
+        results = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = sorted(s[0] for s in samples)
+            total = sum(latencies)
+            results[endpoint] = {
+                'requests': len(samples),
+                'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+                'throughput_rps': round(len(samples) / total, 1) if total else None,
+                'queries_per_request': round(sum(s[1] for s in samples) / len(samples), 2),
+                'max_queries': max(s[1] for s in samples),
+                'error_rate': round(sum(1 for s in samples if s[2] >= 400) / len(samples), 3),
+            }
+        return results
+
+
+# --- Synthetic Dataset ---
+def seed_dataset(backend, args):
+    """Load a seed_data dataset and mint a token for every seeded account"""
+    config = seed_data.Config(cities=args.cities, shops=args.shops, products_per_shop=args.products_per_shop,
+                              customers=args.customers, orders=args.orders, years=1, stock=1_000_000, seed=args.seed)
+    with backend.app.app_context():
+        backend.db.drop_all()
+        backend.db.create_all()
+        # Hashed once and shared by every account; the coverage pass logs in with it
+        data = seed_data.generate(backend.db.engine, config, backend.generate_password_hash('benchmark'),
+                                  log=lambda message: None)
+        data.tokens = {u['id']: backend.create_access_token(identity=u['email']) for u in data.admins + data.customers}
+    return data
+
+
+def png_bytes(n):
+    """A distinct 1x1 PNG per `n`, so every upload stores and resizes a new image"""
+    def chunk(kind, body):
+        return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body))
+    pixel = b'\x00' + bytes((n % 256, n // 256 % 256, 128))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(pixel)) + chunk(b'IEND', b''))
+
+
+# --- Scenarios ---
+def browse_city(rec, data, rng, customer):
+    token = data.tokens[customer['id']]
+    rec.call('GET', f"/api/products/city/{customer['city']}")
+    rec.call('GET', f"/api/shops/city/{customer['city']}", token)
+    rec.call('GET', f"/api/products/bestsellers?city={customer['city']}&limit=8")
+
+def view_shop(rec, data, rng, customer):
+    product = rng.choice(data.products_by_city[customer['city']])
+    rec.call('GET', f"/api/shops/{product['shop_id']}/products")
+
+def add_to_cart(rec, data, rng, customer):
+    product = rng.choice(data.products_by_city[customer['city']])
+    rec.call('GET', f"/api/shops/{product['shop_id']}/products")
+    rec.call('GET', '/api/addresses', data.tokens[customer['id']])
+
+def checkout(rec, data, rng, customer):
+    token = data.tokens[customer['id']]
+    lines = rng.sample(data.products_by_city[customer['city']], k=rng.randint(1, 3))
+    items = [{'product_id': p['id'], 'quantity': rng.randint(1, 3)} for p in lines]
+    method = rng.choice(['cod', 'upi'])
+    page = rec.call('POST', '/api/checkout/bootstrap', token, {'items': items, 'payment_method': method}).get_json()
+    rec.call('POST', '/api/orders', token, {
+        'items': items,
+        'address_id': page['default_address_id'],
+        'payment': {'method': method}
+    })
+
+def admin(rec, data, rng, customer):
+    owner = rng.choice(data.admins)
+    token = data.tokens[owner['id']]
+    rec.call('GET', '/api/shops/my', token)
+    rec.call('GET', '/api/orders/shop', token)
+    rec.call('GET', '/api/admin/analytics?days=30', token)
+
+SCENARIOS = {
+    'browse_city': browse_city,
+    'view_shop': view_shop,
+    'add_to_cart': add_to_cart,
+    'checkout': checkout,
+    'admin': admin,
+}
+
+
+def coverage_pass(rec, data, rng, iterations):
+    """Exercise every route the weighted mix does not reach, the order stream aside"""
+    for n in range(iterations):
+        rec.call('GET', '/api/products')
+        email = f'bench-new-{n}-{rng.random()}@bench.local'
+        rec.call('POST', '/api/auth/register', json_body={'name': 'New User', 'email': email, 'password': 'benchmark',
+                                                          'role': 'customer', 'city': data.cities[0]})
+        rec.call('POST', '/api/auth/login', json_body={'email': email, 'password': 'benchmark'})
+
+        customer = rng.choice(data.customers)
+        token = data.tokens[customer['id']]
+        rec.call('GET', '/api/auth/me', token)
+        rec.call('PUT', '/api/auth/profile', token, {'city': customer['city']})
+        address_id = rec.call('POST', '/api/addresses', token, {
+            'full_name': f"Customer {customer['id']}", 'street_address': '1 Side Street', 'city': customer['city'],
+            'state': 'State', 'postal_code': '500002', 'phone_number': '9000000001'}).get_json()['address_id']
+        rec.call('PUT', f'/api/addresses/{address_id}', token, {'landmark': 'Near the park'})
+        rec.call('DELETE', f'/api/addresses/{address_id}', token)
+        rec.call('GET', '/api/orders/customer', token)
+
+        address = rec.call('GET', '/api/addresses/default', token).get_json()
+        product = rng.choice(data.products_by_city[customer['city']])
+        order_id = rec.call('POST', '/api/orders', token, {
+            'items': [{'product_id': product['id'], 'quantity': 1}], 'address_id': address['id']}).get_json()['order_id']
+        rec.call('PUT', f'/api/orders/{order_id}/cancel', token)
+
+        owner = data.admins[product['shop_id'] - 1]
+        owner_token = data.tokens[owner['id']]
+        order_id = rec.call('POST', '/api/orders', token, {
+            'items': [{'product_id': product['id'], 'quantity': 1}], 'address_id': address['id']}).get_json()['order_id']
+        rec.call('PUT', f'/api/orders/{order_id}/status', owner_token, {'status': 'Shipped'})
+        recent = rec.call('GET', '/api/orders/shop', owner_token).get_json()[:50]
+        rec.call('PUT', '/api/orders/status', owner_token, {'status': 'Delivered', 'order_ids': [o['id'] for o in recent]})
+
+        new_id = rec.call('POST', '/api/products', owner_token, {
+            'name': f'Bench Product {n}', 'price': 25, 'quantity': 10, 'category': 'Fruits'}).get_json()['product_id']
+        # A threshold above the stock raises a low-stock alert
+        rec.call('PUT', f'/api/products/{new_id}', owner_token, {'price': 30, 'discount_percentage': 5, 'reorder_threshold': 20})
+        rec.call('GET', '/api/shops/my/alerts', owner_token)
+        rec.call('DELETE', f'/api/shops/my/alerts/{new_id}', owner_token)
+        image = rec.call('POST', f'/api/products/{new_id}/image', owner_token,
+                         form={'image': (io.BytesIO(png_bytes(n)), 'bench.png')}).get_json()
+        rec.call('GET', image['image_urls']['original'])
+        rec.call('DELETE', f'/api/products/{new_id}', owner_token)
+
+        offer_id = rec.call('POST', '/api/shops/my/offers', owner_token,
+                            {'name': f'Bench Offer {n}', 'kind': 'percentage', 'value': 5}).get_json()['offer']['id']
+        rec.call('PUT', f'/api/shops/my/offers/{offer_id}', owner_token, {'value': 10})
+        rec.call('GET', '/api/shops/my/offers', owner_token)
+        rec.call('DELETE', f'/api/shops/my/offers/{offer_id}', owner_token)
+
+        lines = rng.sample(data.products_by_city[customer['city']], k=3)
+        rec.call('POST', '/api/pricing/quote', json_body={
+            'items': [{'product_id': p['id'], 'quantity': 2} for p in lines], 'payment_method': 'cod'})
+        rec.call('GET', f"/api/products/{lines[0]['id']}/related")
+        rec.call('GET', f"/api/products/related?product_ids={','.join(str(p['id']) for p in lines)}")
+        shop = data.shops[product['shop_id'] - 1]
+        near = f"lat={shop['latitude']}&lng={shop['longitude']}&radius=5"
+        rec.call('GET', f'/api/shops/nearby?{near}', token)
+        rec.call('GET', f'/api/products/nearby?{near}')
+        rec.call('GET', '/api/products/changes?limit=500')
+        rec.call('GET', '/api/customers/me/analytics', token)
+        rec.call('GET', '/api/admin/analytics/timeseries?resolution=day&days=90', owner_token)
+        rec.call('GET', '/api/platform/analytics?group_by=city,category', data.tokens[data.admins[0]['id']])
+        rec.call('POST', '/api/batch', owner_token, {'requests': [
+            {'path': '/api/shops/my'}, {'path': '/api/orders/shop'}, {'path': '/api/admin/analytics?days=30'}]})
+
+        # A fresh admin each time, since create_shop allows one shop per owner
+        admin_email = f'bench-admin-{n}-{rng.random()}@bench.local'
+        rec.call('POST', '/api/auth/register', json_body={'name': 'New Admin', 'email': admin_email, 'password': 'benchmark',
+                                                          'role': 'admin', 'city': data.cities[0]})
+        with rec.backend.app.app_context():
+            admin_token = rec.backend.create_access_token(identity=admin_email)
+        rec.call('POST', '/api/shops', admin_token, {'name': f'Bench Shop {n}', 'city': data.cities[0]})
+
+
+# --- Baseline Comparison ---
+def compare(results, baseline, threshold, noise_floor_ms):
+    """Routes whose median latency or statement count regressed past `threshold` (a fraction)"""
+    regressions = []
+    for endpoint, current in results.items():
+        previous = baseline.get(endpoint)
+        if not previous:
+            continue
+        if (current['p50_ms'] > previous['p50_ms'] * (1 + threshold)
+                and current['p50_ms'] - previous['p50_ms'] > noise_floor_ms):
+            regressions.append(f"{endpoint}: p50 {previous['p50_ms']}ms -> {current['p50_ms']}ms")
+        if current['queries_per_request'] > previous['queries_per_request'] * (1 + threshold) + 0.5:
+            regressions.append(f"{endpoint}: queries/request {previous['queries_per_request']} -> {current['queries_per_request']}")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'endpoint':<26} {'reqs':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'queries':>8}")
+    for endpoint, r in results.items():
+        print(f"{endpoint:<26} {r['requests']:>6} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} "
+              f"{r['throughput_rps']!s:>8} {r['queries_per_request']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help="Defaults to a fresh SQLite file in a temp directory")
+    parser.add_argument('--reset-database', action='store_true',
+                        help="Required with --database-url: the run drops and recreates every table")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--cities', type=int, default=5)
+    parser.add_argument('--shops', type=int, default=20)
+    parser.add_argument('--products-per-shop', type=int, default=50)
+    parser.add_argument('--customers', type=int, default=500)
+    parser.add_argument('--orders', type=int, default=5000)
+    parser.add_argument('--sessions', type=int, default=500, help="Weighted scenario runs")
+    parser.add_argument('--coverage-iterations', type=int, default=20)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed regression as a fraction (0.25 = 25%%)")
+    parser.add_argument('--noise-floor-ms', type=float, default=2.0,
+                        help="Ignore latency regressions smaller than this many milliseconds")
+    args = parser.parse_args()
+
+    if args.database_url and not args.reset_database:
+        parser.error("--database-url drops and recreates every table; pass --reset-database to confirm")
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.db')}"
+    os.environ.setdefault('SQL_PROFILER_ENABLED', 'false')
+    os.environ['IMAGE_DIR'] = tempfile.mkdtemp(prefix='benchmark-media-')
+    os.environ['FACT_STORE_DIR'] = tempfile.mkdtemp(prefix='benchmark-facts-')
+
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+
+    if not args.database_url:
+        # The throwaway file is not worth an fsync per commit; disk flushes would drown out the app's own cost
+        with backend.app.app_context():
+            event.listen(backend.db.engine, 'connect', lambda conn, _: conn.execute('PRAGMA synchronous=OFF'))
+
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    data = seed_dataset(backend, args)
+    with backend.app.app_context():
+        recommendations.rebuild(backend.db, settle_seconds=0, log=lambda message: None)
+        fact_store.export(backend.db, fact_store.FactStore(backend.app.config['FACT_STORE_DIR']), settle_seconds=0,
+                          log=lambda message: None)
+    backend.app.config['PLATFORM_ANALYTICS_EMAILS'] = {data.admins[0]['email']}
+    print(f"Seeded dataset in {time.perf_counter() - started:.1f}s")
+
+    with backend.app.app_context():
+        instrument_engine(backend.db.engine)
+    rec = Recorder(backend, backend.app.test_client())
+
+    names = list(SCENARIO_WEIGHTS)
+    weights = [SCENARIO_WEIGHTS[n] for n in names]
+    started = time.perf_counter()
+    for _ in range(args.sessions):
+        SCENARIOS[rng.choices(names, weights)[0]](rec, data, rng, rng.choice(data.customers))
+    coverage_pass(rec, data, rng, args.coverage_iterations)
+    print(f"Drove {sum(len(s) for s in rec.samples.values())} requests in {time.perf_counter() - started:.1f}s\n")
+
+    results = rec.results()
+    print_table(results)
+    report = {
+        'generated_at': datetime.utcnow().isoformat(),
+        'dataset': {k: getattr(args, k) for k in ('seed', 'cities', 'shops', 'products_per_shop', 'customers', 'orders', 'sessions')},
+        'endpoints': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --update-baseline to create one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)['endpoints']
+    regressions = compare(results, baseline, args.threshold, args.noise_floor_ms)
+    if regressions:
+        print("\nRegressions past the threshold:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nNo regressions against the baseline")
+
+
+if __name__ == '__main__':
+    main()
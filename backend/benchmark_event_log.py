@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# backend/benchmark_event_log.py
+"""
+Check and cost of the order event log (event_log.py).
+
+Seeds a small synthetic dataset with EVENT_LOG_DIR in a temp directory and a
+small EVENT_LOG_SEGMENT_BYTES, so segments roll, then places --orders orders
+through place_order and cancels every --cancel-every'th one. Once the log is
+flushed it is replayed from offset 0 by a Consumer and by
+ShopDailyProjection.rebuild(), and the projection's orders, units, revenue and
+cancellations per shop are compared with the same figures from the database.
+A torn line longer than a read block is then left at the end of the active
+segment; the next order's events have to follow it unharmed and the caught-up
+projection has to match again. Any difference exits 1.
+
+Afterwards it times, as the median of --repeats runs: append() of one order's
+events (what a request pays), append() waiting for the group-committed fsync
+(EVENT_LOG_SYNC), and write_batch() of one order on its own (an fsync per
+order, which group commit avoids).
+
+    python benchmark_event_log.py
+    python benchmark_event_log.py --orders 2000 --appends 50000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+
+import event_log
+import seed_data
+from benchmark import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def per_call_us(function, calls, repeats):
+    """Median over `repeats` runs of the time per call, each run `calls` calls long"""
+    runs = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(calls):
+            function()
+        runs.append((time.perf_counter() - started) / calls)
+    runs.sort()
+    return percentile(runs, 50) * 1_000_000
+
+
+def database_totals(backend, first_order_id):
+    """Per shop, for orders from `first_order_id` on: what ShopDailyProjection should hold"""
+    db, Order, order_items = backend.db, backend.Order, backend.order_items
+    with backend.app.app_context():
+        rows = db.session.query(order_items.c.shop_id, order_items.c.order_id, order_items.c.quantity,
+                                order_items.c.unit_price, Order.status).\
+            join(Order, Order.id == order_items.c.order_id).filter(Order.id >= first_order_id).all()
+    totals, cancelled = {}, set()
+    for shop_id, order_id, quantity, unit_price, status in rows:
+        shop = totals.setdefault(str(shop_id), {'orders': set(), 'units': 0, 'revenue': 0.0, 'cancelled_orders': 0})
+        shop['orders'].add(order_id)
+        shop['units'] += quantity
+        shop['revenue'] = round(shop['revenue'] + (unit_price or 0) * quantity, 2)
+        if status == 'Cancelled' and (shop_id, order_id) not in cancelled:
+            cancelled.add((shop_id, order_id))
+            shop['cancelled_orders'] += 1
+    for shop in totals.values():
+        shop['orders'] = len(shop['orders'])
+    return totals
+
+
+def projection_totals(projection):
+    """ShopDailyProjection's days summed per shop"""
+    totals = {}
+    for shop_id, days in projection.shops.items():
+        shop = totals.setdefault(shop_id, {'orders': 0, 'units': 0, 'revenue': 0.0, 'cancelled_orders': 0})
+        for day in days.values():
+            for key in ('orders', 'units', 'cancelled_orders'):
+                shop[key] += day[key]
+            shop['revenue'] = round(shop['revenue'] + day['revenue'], 2)
+    return totals
+
+
+def differences(expected, actual):
+    lines = []
+    for shop_id in sorted(set(expected) | set(actual), key=int):
+        if expected.get(shop_id) != actual.get(shop_id):
+            lines.append(f"  shop {shop_id}: database {expected.get(shop_id)}, projection {actual.get(shop_id)}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=400, help="Orders placed through place_order")
+    parser.add_argument('--cancel-every', type=int, default=5)
+    parser.add_argument('--segment-bytes', type=int, default=16 * 1024, help="Small, so the run rolls segments")
+    parser.add_argument('--appends', type=int, default=10_000, help="append() calls per timing run")
+    parser.add_argument('--repeats', type=int, default=5, help="Runs per measurement; the median is reported")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='benchmark-event-log-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'event_log.db')}"
+    os.environ['EVENT_LOG_DIR'] = directory
+    os.environ['EVENT_LOG_SEGMENT_BYTES'] = str(args.segment_bytes)
+    os.environ.setdefault('SQL_PROFILER_ENABLED', 'false')
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+
+    with backend.app.app_context():
+        event.listen(backend.db.engine, 'connect', lambda conn, _: conn.execute('PRAGMA synchronous=OFF'))
+        backend.db.drop_all()
+        backend.db.create_all()
+        config = seed_data.Config(cities=2, shops=6, products_per_shop=20, customers=50, orders=200, years=1,
+                                  stock=1_000_000, seed=args.seed)
+        data = seed_data.generate(backend.db.engine, config, backend.generate_password_hash('benchmark'),
+                                  log=lambda message: None)
+        tokens = {c['id']: backend.create_access_token(identity=c['email']) for c in data.customers}
+        first_order_id = (backend.db.session.query(backend.db.func.max(backend.Order.id)).scalar() or 0) + 1
+
+    client = backend.app.test_client()
+    rng = random.Random(args.seed)
+
+    def place_order():
+        customer = rng.choice(data.customers)
+        lines = rng.sample(data.products_by_city[customer['city']], k=rng.randint(1, 3))
+        headers = {'Authorization': f"Bearer {tokens[customer['id']]}"}
+        response = client.post('/api/orders', headers=headers, json={
+            'items': [{'product_id': p['id'], 'quantity': rng.randint(1, 3)} for p in lines],
+            'address_id': customer['address_id']})
+        assert response.status_code == 201, (response.status_code, response.data)
+        return response.get_json()['order_id'], headers
+
+    started = time.perf_counter()
+    cancelled = 0
+    for n in range(args.orders):
+        order_id, headers = place_order()
+        if n % args.cancel_every == 0:
+            response = client.put(f'/api/orders/{order_id}/cancel', headers=headers)
+            assert response.status_code == 200, (response.status_code, response.data)
+            cancelled += 1
+    elapsed = time.perf_counter() - started
+    if not event_log.event_log.flush(timeout=30):
+        sys.exit(f"{event_log.event_log.pending()} event(s) still buffered after 30s")
+    segments = event_log._segments(directory)
+    print(f"Placed {args.orders} orders and cancelled {cancelled} in {elapsed:.1f}s; "
+          f"the log holds {len(segments)} segment(s)")
+
+    failures = []
+    consumer = event_log.Consumer(directory, 'benchmark')
+    counts = {}
+    while True:
+        events = consumer.poll()
+        for _, logged in events:
+            counts[logged['type']] = counts.get(logged['type'], 0) + 1
+        if not events:
+            break
+    consumer.commit()
+    if counts.get('order_placed') != args.orders:
+        failures.append(f"  {counts.get('order_placed', 0)} order_placed events for {args.orders} orders")
+    if len(segments) < 2:
+        failures.append(f"  no segment roll with EVENT_LOG_SEGMENT_BYTES={args.segment_bytes}")
+
+    projection = event_log.ShopDailyProjection(directory)
+    started = time.perf_counter()
+    applied = projection.rebuild()
+    print(f"Replayed {applied} event(s) into {projection.name} in {(time.perf_counter() - started) * 1000:.1f}ms")
+    failures += differences(database_totals(backend, first_order_id), projection_totals(projection))
+
+    # A writer that died mid-line, with more than one read block of it on disk
+    with open(event_log._segment_path(directory, event_log._segments(directory)[-1]), 'ab') as segment:
+        segment.write(b'{"type": "order_placed", "torn": "' + b'x' * (event_log.READ_BYTES + 1))
+    place_order()
+    event_log.event_log.flush(timeout=30)
+    projection.catch_up()
+    failures += differences(database_totals(backend, first_order_id), projection_totals(projection))
+    print(f"Pruned {event_log.prune(directory)} segment(s) every reader is past")
+
+    if failures:
+        print("\nEvent log check failed:")
+        print('\n'.join(failures))
+        sys.exit(1)
+    print("Projection matches the database, before and after a torn line\n")
+
+    # Timings on a log of their own, so the checked one is left as it was
+    timing = event_log.EventLog()
+    timing.configure({'EVENT_LOG_DIR': tempfile.mkdtemp(prefix='benchmark-event-log-timing-'),
+                      'EVENT_LOG_FLUSH_INTERVAL': backend.app.config['EVENT_LOG_FLUSH_INTERVAL']})
+    order = [('order_placed', {'order_id': 1, 'customer_id': 1, 'total_amount': 120.0, 'payment_method': 'cod',
+                               'lines': [{'shop_id': 1, 'product_id': p, 'quantity': 2, 'unit_price': 20.0}
+                                         for p in (1, 2, 3)]})] + \
+        [('inventory_moved', {'product_id': p, 'order_id': 1, 'kind': 'sale', 'stock_delta': -2}) for p in (1, 2, 3)]
+    append_us = per_call_us(lambda: timing.append(order), args.appends, args.repeats)
+    timing.flush()
+    synced_us = per_call_us(lambda: timing.append(order, wait=True), 20, args.repeats)
+    batch = b''.join(json.dumps({'type': t, 'at': 'now', 'data': d}).encode() + b'\n' for t, d in order)
+    single_us = per_call_us(lambda: event_log.write_batch(timing.directory, batch, 1 << 30), 20, args.repeats)
+    print(f"{'per order (4 events)':<36} {'us':>10}")
+    print(f"{'append(), buffered':<36} {append_us:>10.1f}")
+    print(f"{'append(wait=True), group commit':<36} {synced_us:>10.1f}")
+    print(f"{'write_batch(), one fsync per order':<36} {single_us:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# backend/benchmark_facts.py
+"""
+Platform analytics from the columnar fact store (fact_store.py) against the
+same GROUP BY in the database.
+
+Seeds a synthetic dataset, exports it into a temporary fact store (timing
+the full export and an incremental one after a few more orders), then runs
+each report --repeats times: in SQL over orders/order_items, from the fact
+store in one process, and from the fact store split across --workers
+processes. The fact store answers are checked against each other.
+
+    python benchmark_facts.py
+    python benchmark_facts.py --orders 1000000 --workers 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import event, func, select
+
+import seed_data
+from benchmark import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+REPORTS = {
+    'revenue by city': ['city'],
+    'city x category': ['city', 'category'],
+    'hour of day': ['hour'],
+    'revenue by month': ['month'],
+}
+
+
+def sql_report(backend, group_by):
+    """The report as one GROUP BY over the OLTP tables"""
+    tables = backend.db.metadata.tables
+    orders, order_items, products, shops = (tables['orders'], tables['order_items'],
+                                            tables['products'], tables['shops'])
+    columns = {
+        'city': shops.c.city,
+        'category': products.c.category,
+        'hour': func.strftime('%H', orders.c.created_at),
+        'month': func.strftime('%Y-%m', orders.c.created_at),
+    }
+    keys = [columns[name] for name in group_by]
+    price = func.coalesce(order_items.c.unit_price,
+                          products.c.price * (100 - func.coalesce(products.c.discount_percentage, 0)) / 100)
+    query = select(*keys, func.sum(price * order_items.c.quantity), func.sum(order_items.c.quantity),
+                   func.count(), func.count(orders.c.id.distinct())).\
+        select_from(order_items).\
+        join(orders, orders.c.id == order_items.c.order_id).\
+        join(products, products.c.id == order_items.c.product_id).\
+        join(shops, shops.c.id == order_items.c.shop_id).\
+        where(orders.c.status != 'Cancelled').group_by(*keys)
+    return backend.db.session.execute(query).all()
+
+
+def timed(function, repeats):
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function()
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return percentile(latencies, 50) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cities', type=int, default=20)
+    parser.add_argument('--shops', type=int, default=200)
+    parser.add_argument('--products-per-shop', type=int, default=40)
+    parser.add_argument('--orders', type=int, default=300_000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--repeats', type=int, default=5, help="Runs per measurement; the median is reported")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'facts.db')}"
+    os.environ['FACT_STORE_DIR'] = os.path.join(workdir, 'facts')
+    os.environ.setdefault('SQL_PROFILER_ENABLED', 'false')
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+    import fact_store
+
+    store = fact_store.FactStore(os.environ['FACT_STORE_DIR'])
+    with backend.app.app_context():
+        event.listen(backend.db.engine, 'connect', lambda conn, _: conn.execute('PRAGMA synchronous=OFF'))
+        backend.db.drop_all()
+        backend.db.create_all()
+        config = seed_data.Config(cities=args.cities, shops=args.shops, products_per_shop=args.products_per_shop,
+                                  customers=5000, orders=args.orders, years=1, stock=1000, seed=args.seed,
+                                  end=datetime.utcnow())
+        data = seed_data.generate(backend.db.engine, config, backend.generate_password_hash('benchmark'),
+                                  log=lambda message: None)
+
+        started = time.perf_counter()
+        fact_store.export(backend.db, store, settle_seconds=0, log=lambda message: None)
+        full_export_s = time.perf_counter() - started
+
+        customer = data.customers[0]
+        products = data.products_by_city[customer['city']][:3]
+        client = backend.app.test_client()
+        token = client.post('/api/auth/login', json={'email': customer['email'], 'password': 'benchmark'}).\
+            get_json()['access_token']
+        for product in products:
+            client.post('/api/orders', headers={'Authorization': f'Bearer {token}'},
+                        json={'items': [{'product_id': product['id'], 'quantity': 1}],
+                              'address_id': customer['address_id']})
+        started = time.perf_counter()
+        appended, _, _ = fact_store.export(backend.db, store, settle_seconds=0, log=lambda message: None)
+        incremental_export_ms = (time.perf_counter() - started) * 1000
+
+        rows = store.manifest()['rows']
+        print(f"{data.order_count} orders, {rows} order lines; full export {full_export_s:.1f} s, "
+              f"incremental export of {appended} orders {incremental_export_ms:.0f} ms, "
+              f"{args.workers} workers, median of {args.repeats} runs\n")
+        print(f"{'report':<18} {'groups':>7} {'sql ms':>9} {'store ms':>9} {'parallel ms':>12}")
+        statuses = [status for status in fact_store.STATUSES if status != 'Cancelled']
+        for name, group_by in REPORTS.items():
+            sql_ms, _ = timed(lambda: sql_report(backend, group_by), args.repeats)
+            inline_ms, (_, inline, _) = timed(
+                lambda: fact_store.query(store, {'status': statuses}, group_by, workers=1), args.repeats)
+            fact_store.query(store, {'status': statuses}, group_by, args.workers, parallel_min_rows=0)  # Start the pool
+            parallel_ms, (_, parallel, _) = timed(
+                lambda: fact_store.query(store, {'status': statuses}, group_by, args.workers, parallel_min_rows=0),
+                args.repeats)
+            assert [(group['lines'], group['orders']) for group in inline] == \
+                [(group['lines'], group['orders']) for group in parallel], name
+            print(f"{name:<18} {len(inline):>7} {sql_ms:>9.1f} {inline_ms:>9.1f} {parallel_ms:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# backend/benchmark_fields.py
+"""
+Payload size and latency of the catalog listings per ?fields= selection.
+
+Seeds a synthetic dataset, then requests each listing --requests times with no
+fields parameter (every column, every key), with the card preset and with the
+detail preset, first with the catalog cache turned off (query + serialization
+on every request) and then with it on. Reports bytes per response and p50/p95
+latency, relative to the full listing.
+
+    python benchmark_fields.py
+    python benchmark_fields.py --products-per-shop 200 --requests 100
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+
+import seed_data
+from benchmark import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SELECTIONS = ('full', 'card', 'detail')
+
+
+def measure(client, path, requests):
+    latencies, size = [], 0
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = client.get(path)
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, (path, response.status_code)
+        size = len(response.data)
+    latencies.sort()
+    return {'bytes': size, 'p50_ms': percentile(latencies, 50) * 1000, 'p95_ms': percentile(latencies, 95) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cities', type=int, default=5)
+    parser.add_argument('--shops', type=int, default=20)
+    parser.add_argument('--products-per-shop', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=50, help="Requests per listing, selection and cache mode")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'fields.db')}"
+    os.environ.setdefault('SQL_PROFILER_ENABLED', 'false')
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+    from response_cache import catalog_cache
+
+    with backend.app.app_context():
+        event.listen(backend.db.engine, 'connect', lambda conn, _: conn.execute('PRAGMA synchronous=OFF'))
+        backend.db.drop_all()
+        backend.db.create_all()
+        config = seed_data.Config(cities=args.cities, shops=args.shops, products_per_shop=args.products_per_shop,
+                                  customers=20, orders=0, years=1, stock=1000, seed=args.seed)
+        data = seed_data.generate(backend.db.engine, config, backend.generate_password_hash('benchmark'),
+                                  log=lambda message: None)
+
+    city = data.cities[0]
+    shop_id = data.products_by_city[city][0]['shop_id']
+    listings = {
+        'all products': '/api/products',
+        f'city ({city})': f'/api/products/city/{city}',
+        f'shop {shop_id}': f'/api/shops/{shop_id}/products',
+    }
+    client = backend.app.test_client()
+    cache_age = catalog_cache.max_age or 5.0
+
+    print(f"{args.cities} cities, {args.shops} shops, {args.products_per_shop} products per shop, "
+          f"{args.requests} requests per row\n")
+    print(f"{'listing':<22} {'cache':<6} {'fields':<7} {'bytes':>9} {'p50 ms':>8} {'p95 ms':>8} {'size':>6} {'p50':>6}")
+    for name, path in listings.items():
+        for cache_on in (False, True):
+            catalog_cache.max_age = cache_age if cache_on else 0
+            catalog_cache.invalidate()
+            results = {}
+            for selection in SELECTIONS:
+                url = path if selection == 'full' else f"{path}?fields={selection}"
+                client.get(url)  # Warm up (and fill the cache when it is on)
+                results[selection] = measure(client, url, args.requests)
+            full = results['full']
+            for selection, stats in results.items():
+                print(f"{name:<22} {'on' if cache_on else 'off':<6} {selection:<7} {stats['bytes']:>9} "
+                      f"{stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} "
+                      f"{stats['bytes'] / full['bytes']:>5.0%} {stats['p50_ms'] / full['p50_ms']:>5.0%}")
+
+
+if __name__ == '__main__':
+    main()
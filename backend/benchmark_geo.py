@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# backend/benchmark_geo.py
+"""
+Lookup latency of the shop grid index (shop_geo.py) against a linear scan.
+
+Places --shops synthetic shops around --cities city centres (the same kind of
+clustering seed_data.py produces), builds the grid, then times --lookups
+nearby queries from random points near those centres. No database is used.
+
+    python benchmark_geo.py
+    python benchmark_geo.py --shops 100000 --radius 10
+"""
+import argparse
+import math
+import random
+import time
+
+from benchmark import percentile
+from shop_geo import KM_PER_DEGREE, ShopGridIndex
+
+
+def linear_scan(shops, lat, lng, radius_km):
+    cos_lat = math.cos(math.radians(lat))
+    found = []
+    for shop_id, shop_lat, shop_lng in shops:
+        y = (shop_lat - lat) * KM_PER_DEGREE
+        x = (shop_lng - lng) * KM_PER_DEGREE * cos_lat
+        if x * x + y * y <= radius_km * radius_km:
+            found.append(shop_id)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shops', type=int, default=100_000)
+    parser.add_argument('--cities', type=int, default=30)
+    parser.add_argument('--radius', type=float, default=5.0, help="Query radius in km")
+    parser.add_argument('--cell-degrees', type=float, default=0.02)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    centres = [(rng.uniform(12, 30), rng.uniform(72, 88)) for _ in range(args.cities)]
+    shops = []
+    for shop_id in range(1, args.shops + 1):
+        lat, lng = rng.choice(centres)
+        shops.append((shop_id, lat + rng.gauss(0, 0.1), lng + rng.gauss(0, 0.1)))
+    points = [(lat + rng.gauss(0, 0.1), lng + rng.gauss(0, 0.1))
+              for lat, lng in (rng.choice(centres) for _ in range(args.lookups))]
+
+    grid = ShopGridIndex(args.cell_degrees)
+    started = time.perf_counter()
+    grid.refresh(lambda: shops)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    results = {}
+    for name, lookup, lookups in (
+        ('grid', lambda lat, lng: grid.nearby(lat, lng, args.radius), points),
+        ('linear scan', lambda lat, lng: linear_scan(shops, lat, lng, args.radius), points[:50]),
+    ):
+        latencies, found = [], 0
+        for lat, lng in lookups:
+            started = time.perf_counter()
+            found += len(lookup(lat, lng))
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        results[name] = (percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000, found / len(lookups))
+
+    print(f"{args.shops} shops around {args.cities} cities, radius {args.radius} km, "
+          f"cells of {args.cell_degrees} degrees; grid built in {build_ms:.0f} ms\n")
+    print(f"{'method':<12} {'p50 ms':>8} {'p95 ms':>8} {'shops found':>12}")
+    for name, (p50, p95, found) in results.items():
+        print(f"{name:<12} {p50:>8.3f} {p95:>8.3f} {found:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
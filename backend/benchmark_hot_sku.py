@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# backend/benchmark_hot_sku.py
+"""
+Checkout throughput on a single hot product, with and without sharded stock.
+
+Seeds a small synthetic dataset, then has --threads concurrent customers place
+one-unit orders for the same product for --duration seconds: first with the
+stock in products.quantity, then with it split across --shards counter rows
+(toggled through update_product, as an admin would). Reports orders/sec and
+latency percentiles for both modes.
+
+SQLite takes one database-wide write lock per transaction, so on the default
+throwaway database both modes serialize the same way and only show the
+overhead of sharding. Run it against a MySQL database to see the row-lock
+contention that sharding removes:
+
+    python benchmark_hot_sku.py --database-url 'mysql+pymysql://user:pw@host/bench_db' --reset-database
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import event
+
+import seed_data
+from benchmark import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_mode(backend, data, product, threads, duration):
+    """Hammer place_order for `product` from `threads` customers; returns the stats for this mode"""
+    customers = [c for c in data.customers if c['city'] == product['city']][:threads]
+    customers = (customers * threads)[:threads]  # Small cities: customers place orders from several threads
+    latencies, outcomes = [], {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(customer):
+        client = backend.app.test_client()
+        headers = {'Authorization': f"Bearer {data.tokens[customer['id']]}"}
+        body = {'items': [{'product_id': product['id'], 'quantity': 1}], 'address_id': customer['address_id']}
+        local_latencies, local_outcomes = [], {}
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = client.post('/api/orders', headers=headers, json=body)
+            local_latencies.append(time.perf_counter() - started)
+            local_outcomes[response.status_code] = local_outcomes.get(response.status_code, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_outcomes.items():
+                outcomes[status] = outcomes.get(status, 0) + count
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(customer,)) for customer in customers]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'orders_per_sec': round(outcomes.get(201, 0) / elapsed, 1),
+        'requests': len(latencies),
+        'outcomes': outcomes,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help="Benchmark against this database instead of a temporary SQLite file")
+    parser.add_argument('--reset-database', action='store_true', help="Required with --database-url: every table is dropped")
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per mode")
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.database_url and not args.reset_database:
+        parser.error("--database-url drops and recreates every table; pass --reset-database to confirm")
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'hot_sku.db')}"
+    os.environ['STOCK_SHARDS'] = str(args.shards)
+    os.environ.setdefault('SQL_PROFILER_ENABLED', 'false')
+
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+
+    if not args.database_url:
+        # As in benchmark.py: an fsync per commit would swamp the difference being measured
+        with backend.app.app_context():
+            event.listen(backend.db.engine, 'connect', lambda conn, _: conn.execute('PRAGMA synchronous=OFF'))
+
+    config = seed_data.Config(cities=1, shops=2, products_per_shop=5, customers=max(args.threads, 20), orders=0,
+                              years=1, stock=10_000_000, seed=args.seed)
+    with backend.app.app_context():
+        backend.db.drop_all()
+        backend.db.create_all()
+        data = seed_data.generate(backend.db.engine, config, backend.generate_password_hash('benchmark'),
+                                  log=lambda message: None)
+        data.tokens = {u['id']: backend.create_access_token(identity=u['email']) for u in data.admins + data.customers}
+
+    city = data.cities[0]
+    product = dict(data.products_by_city[city][0], city=city)
+    owner = next(a for a in data.admins if a['shop_id'] == product['shop_id'])
+    admin_client = backend.app.test_client()
+    admin_headers = {'Authorization': f"Bearer {data.tokens[owner['id']]}"}
+
+    results = {}
+    for mode, sharded in (('unsharded', False), ('sharded', True)):
+        response = admin_client.put(f"/api/products/{product['id']}", headers=admin_headers,
+                                    json={'sharded_stock': sharded, 'quantity': 10_000_000})
+        assert response.status_code == 200, response.get_json()
+        results[mode] = run_mode(backend, data, product, args.threads, args.duration)
+
+    backend_name = 'SQLite (writes serialize database-wide)' if not args.database_url else args.database_url.split('://')[0]
+    print(f"Hot product {product['id']}, {args.threads} threads, {args.duration:.0f}s per mode, {backend_name}\n")
+    print(f"{'mode':<10} {'orders/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  outcomes")
+    for mode, stats in results.items():
+        print(f"{mode:<10} {stats['orders_per_sec']:>9} {stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}  {stats['outcomes']}")
+    if results['unsharded']['orders_per_sec']:
+        print(f"\nSharded / unsharded throughput: {results['sharded']['orders_per_sec'] / results['unsharded']['orders_per_sec']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
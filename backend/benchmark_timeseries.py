@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# backend/benchmark_timeseries.py
+"""
+Cost of the shop revenue time series (timeseries.py) for the busiest shop.
+
+Seeds a synthetic year of orders, picks the shop with the most order lines and
+times, per resolution over the whole year: the grouped query on its own, the
+NumPy bucketing of its rows against a per-row Python loop doing the same
+bucketing, and the endpoint end to end.
+
+    python benchmark_timeseries.py
+    python benchmark_timeseries.py --orders 200000 --shops 50
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+import seed_data
+import timeseries
+from benchmark import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def python_key(created_at, resolution):
+    if resolution == 'hour':
+        return created_at.replace(minute=0, second=0, microsecond=0)
+    day = created_at.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == 'day':
+        return day
+    if resolution == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def python_series(rows, start, end, resolution):
+    """The same revenue/orders buckets with datetime arithmetic and a dict, one Python step per row"""
+    revenue, orders = {}, {}
+    for created_at, amount, status in rows:
+        if status == 'Cancelled' or not start <= created_at <= end:
+            continue
+        key = python_key(created_at, resolution)
+        revenue[key] = revenue.get(key, 0.0) + amount
+        orders[key] = orders.get(key, 0) + 1
+    keys = []
+    key = python_key(start, resolution)
+    while key <= end:
+        keys.append(key)
+        if resolution == 'month':
+            key = key.replace(year=key.year + key.month // 12, month=key.month % 12 + 1)
+        else:
+            key += {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}[resolution]
+    return [revenue.get(k, 0.0) for k in keys], [orders.get(k, 0) for k in keys]
+
+
+def timed(function, repeats):
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return percentile(latencies, 50) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cities', type=int, default=5)
+    parser.add_argument('--shops', type=int, default=20)
+    parser.add_argument('--products-per-shop', type=int, default=50)
+    parser.add_argument('--orders', type=int, default=100_000)
+    parser.add_argument('--repeats', type=int, default=10, help="Runs per measurement; the median is reported")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'timeseries.db')}"
+    os.environ.setdefault('SQL_PROFILER_ENABLED', 'false')
+    sys.path.insert(0, BACKEND_DIR)
+    import app as backend
+    from flask_jwt_extended import create_access_token
+
+    end = datetime.utcnow().replace(microsecond=0)
+    with backend.app.app_context():
+        event.listen(backend.db.engine, 'connect', lambda conn, _: conn.execute('PRAGMA synchronous=OFF'))
+        backend.db.drop_all()
+        backend.db.create_all()
+        config = seed_data.Config(cities=args.cities, shops=args.shops, products_per_shop=args.products_per_shop,
+                                  customers=2000, orders=args.orders, years=1, stock=1000, seed=args.seed, end=end)
+        seed_data.generate(backend.db.engine, config, backend.generate_password_hash('benchmark'),
+                           log=lambda message: None)
+        shop_id, lines = backend.db.session.query(backend.order_items.c.shop_id, backend.db.func.count()).\
+            group_by(backend.order_items.c.shop_id).order_by(backend.db.func.count().desc()).first()
+        shop = backend.db.session.get(backend.Shop, shop_id)
+        owner = backend.db.session.get(backend.User, shop.owner_id)
+        token = create_access_token(identity=owner.email)
+
+    start = end.replace(year=end.year - 1)
+    client = backend.app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def query():
+        with backend.app.app_context():
+            return backend.db.session.query(
+                backend.Order.created_at,
+                backend.db.func.sum(backend.Product.price * backend.order_items.c.quantity),
+                backend.Order.status).\
+                select_from(backend.order_items).\
+                join(backend.Order, backend.Order.id == backend.order_items.c.order_id).\
+                join(backend.Product, backend.Product.id == backend.order_items.c.product_id).\
+                filter(backend.order_items.c.shop_id == shop_id,
+                       backend.Order.created_at >= start, backend.Order.created_at <= end).\
+                group_by(backend.Order.id, backend.Order.created_at, backend.Order.status).all()
+
+    rows = query()
+    print(f"{args.orders} orders over a year; shop {shop_id} has {lines} order lines in {len(rows)} orders; "
+          f"median of {args.repeats} runs\n")
+    print(f"{'resolution':<11} {'buckets':>8} {'query ms':>9} {'numpy ms':>9} {'python ms':>10} {'endpoint ms':>12}")
+    for resolution in timeseries.RESOLUTIONS:
+        buckets = timeseries.bucket_count(start, end, resolution)
+        query_ms = timed(query, args.repeats)
+        numpy_ms = timed(lambda: timeseries.build_series(rows, start, end, resolution), args.repeats)
+        python_ms = timed(lambda: python_series(rows, start, end, resolution), args.repeats)
+        url = (f"/api/admin/analytics/timeseries?resolution={resolution}"
+               f"&start={start.isoformat()}&end={end.isoformat()}")
+
+        def endpoint():
+            response = client.get(url, headers=headers)
+            assert response.status_code == 200, (url, response.status_code, response.data)
+
+        endpoint_ms = timed(endpoint, args.repeats)
+        print(f"{resolution:<11} {buckets:>8} {query_ms:>9.1f} {numpy_ms:>9.1f} {python_ms:>10.1f} {endpoint_ms:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+# backend/check_query_budgets.py
+"""
+Query-budget regression check for every route in app.py.
+
+Runs each route against a seeded in-memory SQLite database and fails when a
+route executes more SQL statements, or fetches more rows, than its budget in
+BUDGETS allows. Routes listed in MUST_NOT_SCALE are then run again against a
+dataset three times larger (and place_order with a much larger cart); their
+statement count has to stay the same, which is what catches a query added
+inside a per-row loop.
+
+Every violation prints the statements that actually ran, grouped by shape, and
+for scaling failures a diff between the small and large runs.
+
+Usage:
+    python check_query_budgets.py            # exit code 1 on any violation
+    python check_query_budgets.py --verbose  # print every route's counts
+"""
+import argparse
+import difflib
+import os
+import sys
+import tempfile
+
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['SQL_PROFILER_ENABLED'] = 'false'
+# Keep the sold-count flusher off the single in-memory connection the routes share
+os.environ['SOLD_COUNT_FLUSH_INTERVAL'] = '3600'
+# Every call has to reach the database to be measured
+os.environ['CATALOG_CACHE_SECONDS'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event
+
+import app as backend
+import fact_store
+import recommendations
+import seed_data
+from sql_profiler import capture_sql, instrument_engine, statement_shape
+
+SMALL = dict(cities=3, shops=6, products_per_shop=10, customers=20, orders=150)
+LARGE = dict(cities=3, shops=6, products_per_shop=30, customers=20, orders=450)
+
+# case -> (max statements, max rows fetched). Row budgets are callables of the
+# dataset summary so they track legitimate growth (a bigger catalog returns more rows).
+BUDGETS = {
+    'register': (2, lambda d: 1),
+    'login': (1, lambda d: 1),
+    'get_me': (1, lambda d: 1),
+    'update_profile': (1, lambda d: 1),
+    'get_addresses': (2, lambda d: 1 + d['addresses_per_customer']),
+    'add_address': (4, lambda d: 3),
+    'update_address': (4, lambda d: 3),
+    'delete_address': (6, lambda d: 4), # Addresses only on archived orders are still in use
+    'get_default_address': (2, lambda d: 2),
+    'create_shop': (4, lambda d: 3),
+    'get_my_shop': (2, lambda d: 2),
+    'get_shops_by_city': (1, lambda d: d['city_shops']),
+    'add_product': (6, lambda d: 5),
+    'update_product': (6, lambda d: 5),
+    # Raising an alert reads the product's alert row, then inserts one in a savepoint (which flushes the product first)
+    'update_product[reorder_threshold]': (11, lambda d: 5),
+    'get_my_alerts': (3, lambda d: 3),
+    'dismiss_alert': (3, lambda d: 2),
+    'delete_product': (4, lambda d: 3),
+    'get_products_by_shop': (2, lambda d: 1 + d['products_per_shop']),
+    'get_all_products': (1, lambda d: d['products']),
+    'get_all_products[card]': (1, lambda d: d['products']),
+    'get_product_changes': (1, lambda d: d['products'] + 1), # + the tombstone delete_product leaves
+    'get_bestsellers': (1, lambda d: d['products']),
+    # One lookup in related_products; the cart reads every stored partner of its products
+    'get_related_products': (1, lambda d: 6),
+    'get_cart_related_products': (1, lambda d: 3 * recommendations.TOP_K),
+    # Rebuilding the shop grid reads every located shop; lookups on a built grid are one query
+    'get_nearby_shops': (2, lambda d: 2 * d['shops']),
+    'get_nearby_products[card]': (1, lambda d: d['products']),
+    'get_products_by_city': (2, lambda d: d['city_shops'] + d['city_products']),
+    'create_offer': (4, lambda d: 3), # The new row is read back after the commit for the response
+    # The first pricing after an offer is saved reloads the offers
+    'checkout_bootstrap': (4, lambda d: 1 + d['addresses_per_customer'] + 8 + 1),
+    'quote_cart': (1, lambda d: 8),
+    'place_order[1 line]': (10, lambda d: 6),
+    'place_order[8 lines]': (10, lambda d: 20),
+    # Unbounded history also looks in the archive tables; a range within ORDER_ARCHIVE_DAYS does not
+    'get_customer_orders': (5, lambda d: 1 + d['orders_per_customer'] + d['addresses_per_customer'] + d['lines_per_customer']),
+    'get_customer_orders[card]': (3, lambda d: 1 + d['orders_per_customer']),
+    'get_customer_orders[days=30]': (4, lambda d: 1 + d['orders_per_customer'] + d['addresses_per_customer'] + d['lines_per_customer']),
+    # Orders per status (hot and archived), then (on a miss) the last year of orders and the top categories and products
+    'get_customer_analytics': (6, lambda d: 1 + 5 + d['orders_per_customer'] + 2 * 5),
+    'get_customer_analytics[cached]': (3, lambda d: 1 + 5),
+    'get_shop_orders': (5, lambda d: 2 + d['orders_per_shop'] + d['lines_per_shop']),
+    'get_shop_orders[days=30]': (4, lambda d: 2 + d['orders_per_shop'] + d['lines_per_shop']),
+    # Status changes also read the shops of the changed orders, for their order events
+    'update_order_status': (6, lambda d: 3 + 8),
+    'bulk_update_order_status': (5, lambda d: 3 + 2 * d['orders_per_shop']),
+    # Restocking also clears or downgrades the alerts of the cancelled products
+    'cancel_order': (9, lambda d: 4),
+    # A year reaches the archive: its orders are read too, its top products only when it had some
+    'get_shop_analytics': (6, lambda d: 3 + d['orders_per_shop'] + 5),
+    'get_shop_timeseries': (4, lambda d: 2 + d['orders_per_shop']),
+    # Answered from the fact store; only the caller is read from the database
+    'get_platform_analytics': (1, lambda d: 1),
+    # Dashboard in one round trip: the three calls above less their repeated user lookups
+    'batch[shop dashboard]': (11, lambda d: 10 + 2 * d['orders_per_shop'] + d['lines_per_shop']),
+    # A streamed sub-request is closed unread, so the batch returns at once
+    'batch[stream]': (2, lambda d: 2),
+}
+
+# Cases whose statement count must not change between the SMALL and LARGE runs
+MUST_NOT_SCALE = [
+    'get_all_products', 'get_all_products[card]', 'get_product_changes', 'get_products_by_city',
+    'get_products_by_shop', 'get_shops_by_city', 'get_bestsellers', 'get_related_products',
+    'get_cart_related_products', 'get_nearby_shops', 'get_nearby_products[card]',
+    'get_customer_orders', 'get_customer_orders[card]', 'get_customer_orders[days=30]',
+    'get_customer_analytics', 'get_customer_analytics[cached]',
+    'get_shop_orders', 'get_shop_orders[days=30]', 'get_shop_analytics', 'get_shop_timeseries',
+    'get_platform_analytics', 'get_my_alerts', 'bulk_update_order_status', 'checkout_bootstrap', 'quote_cart', 'batch[shop dashboard]',
+]
+
+
+class RowCounter:
+    """Counts rows handed back by sqlite3, through the connection's row_factory"""
+
+    def __init__(self):
+        self.rows = 0
+
+    def row_factory(self, cursor, row):
+        self.rows += 1
+        return row
+
+
+def seed(size):
+    config = seed_data.Config(years=1, stock=1_000_000, chunk_size=5_000, seed=7, **size)
+    with backend.app.app_context():
+        backend.db.drop_all()
+        backend.db.create_all()
+        data = seed_data.generate(backend.db.engine, config, backend.generate_password_hash('password'),
+                                  log=lambda message: None)
+        data.tokens = {u['id']: backend.create_access_token(identity=u['email']) for u in data.admins + data.customers}
+    return data
+
+
+def dataset_stats(data, customer, shop_id):
+    """Sizes the row budgets are expressed in, measured on the seeded data"""
+    db, Order, order_items = backend.db, backend.Order, backend.order_items
+    with backend.app.app_context():
+        orders_per_customer = Order.query.filter_by(customer_id=customer['id']).count()
+        lines_per_customer = db.session.query(order_items).join(Order, Order.id == order_items.c.order_id).\
+            filter(Order.customer_id == customer['id']).count()
+        orders_per_shop = db.session.query(order_items.c.order_id).filter(order_items.c.shop_id == shop_id).distinct().count()
+        lines_per_shop = db.session.query(order_items).filter(order_items.c.shop_id == shop_id).count()
+        products = backend.Product.query.count()
+        shop_count = backend.Shop.query.count()
+        addresses_per_customer = backend.Address.query.filter_by(user_id=customer['id']).count()
+        city_shops = backend.Shop.query.filter_by(city=customer['city']).count()
+        city_products = backend.Product.query.join(backend.Shop).filter(backend.Shop.city == customer['city']).count()
+    return {
+        'products': products,
+        'shops': shop_count,
+        'city_shops': city_shops + 1,  # create_shop adds one
+        'city_products': city_products,
+        'products_per_shop': products // shop_count,
+        'orders_per_customer': orders_per_customer + 2,  # place_order cases add two
+        'lines_per_customer': lines_per_customer + 9,
+        'addresses_per_customer': addresses_per_customer,
+        'orders_per_shop': orders_per_shop + 2,
+        'lines_per_shop': lines_per_shop + 9,
+        'max_lines': 8,
+    }
+
+
+def run_cases(data, counter):
+    """Call every route once; returns case -> (statements, rows)"""
+    client = backend.app.test_client()
+    customer = data.customers[0]
+    city = customer['city']
+    shop = next(s for s in data.shops if s['city'] == city)
+    owner_token = data.tokens[shop['owner_id']]
+    token = data.tokens[customer['id']]
+    city_products = [p for p in data.products_by_city[city] if p['shop_id'] == shop['id']]
+    stats = dataset_stats(data, customer, shop['id'])
+    results = {}
+
+    def call(case, method, path, auth=None, body=None):
+        headers = {'Authorization': f'Bearer {auth}'} if auth else {}
+        counter.rows = 0
+        with capture_sql() as profile:
+            response = client.open(path, method=method, headers=headers, json=body)
+        if response.status_code >= 400 and case != 'login':
+            raise RuntimeError(f"{case}: {method} {path} returned {response.status_code}: {response.get_data(as_text=True)[:300]}")
+        results[case] = (profile, counter.rows)
+        return response.get_json()
+
+    call('register', 'POST', '/api/auth/register', body={'name': 'N', 'email': 'budget@x.local', 'password': 'pw',
+                                                         'role': 'admin', 'city': city})
+    call('login', 'POST', '/api/auth/login', body={'email': customer['email'], 'password': 'password'})
+    call('get_me', 'GET', '/api/auth/me', token)
+    call('update_profile', 'PUT', '/api/auth/profile', token, {'city': city})
+    call('get_addresses', 'GET', '/api/addresses', token)
+    address_id = call('add_address', 'POST', '/api/addresses', token, {
+        'full_name': 'N', 'street_address': 'S', 'city': city, 'state': 'S', 'postal_code': '1', 'phone_number': '1'})['address_id']
+    call('update_address', 'PUT', f'/api/addresses/{address_id}', token, {'landmark': 'L'})
+    call('delete_address', 'DELETE', f'/api/addresses/{address_id}', token)
+    call('get_default_address', 'GET', '/api/addresses/default', token)
+
+    with backend.app.app_context():
+        new_admin_token = backend.create_access_token(identity='budget@x.local')
+    call('create_shop', 'POST', '/api/shops', new_admin_token, {'name': 'Budget Shop', 'city': city})
+    call('get_my_shop', 'GET', '/api/shops/my', owner_token)
+    call('get_shops_by_city', 'GET', f'/api/shops/city/{city}', token)
+    product_id = call('add_product', 'POST', '/api/products', owner_token, {'name': 'B', 'price': 5, 'quantity': 3})['product_id']
+    call('update_product', 'PUT', f'/api/products/{product_id}', owner_token, {'price': 6})
+    call('update_product[reorder_threshold]', 'PUT', f'/api/products/{product_id}', owner_token, {'reorder_threshold': 5})
+    call('get_my_alerts', 'GET', '/api/shops/my/alerts', owner_token)
+    call('dismiss_alert', 'DELETE', f'/api/shops/my/alerts/{product_id}', owner_token)
+    call('delete_product', 'DELETE', f'/api/products/{product_id}', owner_token)
+    call('get_products_by_shop', 'GET', f"/api/shops/{shop['id']}/products")
+    call('get_all_products', 'GET', '/api/products')
+    call('get_all_products[card]', 'GET', '/api/products?fields=card')
+    call('get_product_changes', 'GET', '/api/products/changes?limit=5000&fields=card')
+    call('get_products_by_city', 'GET', f'/api/products/city/{city}')
+    backend.bestsellers.invalidate()
+    call('get_bestsellers', 'GET', f'/api/products/bestsellers?city={city}')
+    with backend.app.app_context():
+        recommendations.rebuild(backend.db, settle_seconds=0, log=lambda message: None)
+    call('get_related_products', 'GET', f"/api/products/{city_products[0]['id']}/related?fields=card")
+    cart = ','.join(str(p['id']) for p in city_products[:3])
+    call('get_cart_related_products', 'GET', f'/api/products/related?product_ids={cart}&fields=card')
+    backend.shop_grid.invalidate()
+    near = f"lat={shop['latitude']}&lng={shop['longitude']}&radius=10"
+    call('get_nearby_shops', 'GET', f'/api/shops/nearby?{near}', token)
+    call('get_nearby_products[card]', 'GET', f'/api/products/nearby?{near}&fields=card')
+
+    call('create_offer', 'POST', '/api/shops/my/offers', owner_token,
+         {'name': 'Budget offer', 'kind': 'percentage', 'value': 5})
+    call('checkout_bootstrap', 'POST', '/api/checkout/bootstrap', token, {
+        'items': [{'product_id': p['id'], 'quantity': 1} for p in city_products[:8]], 'payment_method': 'cod'})
+    call('quote_cart', 'POST', '/api/pricing/quote', body={
+        'items': [{'product_id': p['id'], 'quantity': 3} for p in city_products[:8]], 'payment_method': 'cod'})
+    order_id = call('place_order[1 line]', 'POST', '/api/orders', token, {
+        'items': [{'product_id': city_products[0]['id'], 'quantity': 1}], 'address_id': customer['address_id']})['order_id']
+    big_order_id = call('place_order[8 lines]', 'POST', '/api/orders', token, {
+        'items': [{'product_id': p['id'], 'quantity': 1} for p in city_products[:8]],
+        'address_id': customer['address_id']})['order_id']
+    call('get_customer_orders', 'GET', '/api/orders/customer', token)
+    call('get_customer_orders[card]', 'GET', '/api/orders/customer?fields=card', token)
+    call('get_customer_orders[days=30]', 'GET', '/api/orders/customer?days=30', token)
+    backend.customer_analytics_cache.invalidate()
+    call('get_customer_analytics', 'GET', '/api/customers/me/analytics', token)
+    call('get_customer_analytics[cached]', 'GET', '/api/customers/me/analytics', token)
+    shop_orders = call('get_shop_orders', 'GET', '/api/orders/shop', owner_token)
+    call('get_shop_orders[days=30]', 'GET', '/api/orders/shop?days=30', owner_token)
+    call('update_order_status', 'PUT', f'/api/orders/{big_order_id}/status', owner_token, {'status': 'Shipped'})
+    call('bulk_update_order_status', 'PUT', '/api/orders/status', owner_token,
+         {'status': 'Delivered', 'order_ids': [o['id'] for o in shop_orders if o['id'] != order_id][:500]})
+    call('cancel_order', 'PUT', f'/api/orders/{order_id}/cancel', token)
+    call('get_shop_analytics', 'GET', '/api/admin/analytics?days=365', owner_token)
+    call('get_shop_timeseries', 'GET', '/api/admin/analytics/timeseries?resolution=hour&days=365', owner_token)
+    backend.app.config['FACT_STORE_DIR'] = tempfile.mkdtemp(prefix='budget-facts-')  # Fresh for each seeded dataset
+    with backend.app.app_context():
+        fact_store.export(backend.db, fact_store.FactStore(backend.app.config['FACT_STORE_DIR']), settle_seconds=0,
+                          log=lambda message: None)
+    backend.app.config['PLATFORM_ANALYTICS_EMAILS'] = {next(a['email'] for a in data.admins if a['shop_id'] == shop['id'])}
+    call('get_platform_analytics', 'GET', '/api/platform/analytics?group_by=city,category', owner_token)
+    call('batch[shop dashboard]', 'POST', '/api/batch', owner_token, {'requests': [
+        {'path': '/api/shops/my'}, {'path': '/api/orders/shop'}, {'path': '/api/admin/analytics?days=365'}]})
+    streamed = call('batch[stream]', 'POST', '/api/batch', owner_token, {'requests': [{'path': '/api/orders/shop/stream'}]})
+    if streamed['responses'][0]['status'] != 400:
+        raise RuntimeError(f"batch[stream]: the stream was not rejected: {streamed['responses'][0]}")
+    return results, stats
+
+
+def describe(profile):
+    """Statements grouped by shape, most repeated first"""
+    lines = []
+    for shape, count in sorted(profile.shape_counts().items(), key=lambda item: -item[1]):
+        lines.append(f"      {count:>3}x {shape[:160]}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    counter = RowCounter()
+    with backend.app.app_context():
+        engine = backend.db.engine
+        instrument_engine(engine)
+        event.listen(engine, 'connect', lambda conn, _: setattr(conn, 'row_factory', counter.row_factory))
+        engine.dispose()  # Reconnect so the listener applies to the in-memory connection
+
+    failures = []
+    small, stats = run_cases(seed(SMALL), counter)
+    for case, (profile, rows) in small.items():
+        max_statements, max_rows = BUDGETS[case]
+        row_budget = max_rows(stats)
+        if args.verbose:
+            print(f"{case:<26} {profile.count:>3}/{max_statements:<3} statements {rows:>5}/{row_budget:<5} rows")
+        if profile.count > max_statements or rows > row_budget:
+            failures.append(f"{case}: {profile.count} statements (budget {max_statements}), "
+                            f"{rows} rows (budget {row_budget})\n{describe(profile)}")
+
+    large, _ = run_cases(seed(LARGE), counter)
+    scaled = [(name, name) for name in MUST_NOT_SCALE if name in small]
+    # The cart-size check: one line vs. eight lines must cost the same number of statements
+    scaled.append(('place_order[1 line]', 'place_order[8 lines]'))
+    for small_case, large_case in scaled:
+        before, after = small[small_case][0], large[large_case][0]
+        if after.count != before.count:
+            diff = difflib.unified_diff([statement_shape(s)[:160] for s, _ in before.statements],
+                                        [statement_shape(s)[:160] for s, _ in after.statements],
+                                        fromfile=f'{small_case} (small)', tofile=f'{large_case} (large)', lineterm='')
+            failures.append(f"{large_case}: statement count grew from {before.count} to {after.count}\n"
+                            + '\n'.join(f"      {line}" for line in diff))
+
+    if failures:
+        print(f"{len(failures)} query budget violation(s):\n")
+        for failure in failures:
+            print(f"  {failure}\n")
+        sys.exit(1)
+    print(f"All {len(BUDGETS)} route budgets met; {len(scaled)} routes hold their statement count as data grows")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,416 @@
+# backend/event_log.py
+"""
+Append-only log of order and inventory events, for rebuilding read models by
+replaying it instead of querying the OLTP tables.
+
+place_order, the status routes, cancel_order and stock adjustments append
+their events after the commit that made them true:
+
+    order_placed            an order with its lines (shop, product, quantity, unit_price)
+    order_status_changed    one order moved to a new status, with the shops in it
+    inventory_moved         sellable stock of a product changed: kind is 'sale',
+                            'cancel_restock' or 'adjustment' as in inventory.py
+
+The log lives under EVENT_LOG_DIR in segment files named after the offset of
+their first byte (00000000000000000000.log, ...), each a run of JSON lines.
+An event's offset is its byte position in the whole log, so every process
+appending to the directory (under an flock) agrees on offsets without
+counting, and a consumer resumes by seeking. A segment is closed once it
+holds EVENT_LOG_SEGMENT_BYTES; the next one starts where it ends.
+
+Appending only buffers the event in memory (microseconds). A writer thread in
+each process waits EVENT_LOG_FLUSH_INTERVAL for more, then writes the whole
+batch with one write() and one fsync: group commit, so a busy worker pays one
+fsync for many orders. Events still buffered when a process dies are lost; the
+database stays the record. With EVENT_LOG_SYNC the request waits for the fsync
+covering its events (the batch is still shared) and nothing acknowledged is
+lost.
+
+Consumers read from a committed offset (Consumer) and store the offset next
+to what they build. ShopDailyProjection is one: per-shop daily orders,
+revenue and cancellations, kept in a JSON file together with its offset, so
+it can be caught up or rebuilt from offset 0 at any time:
+
+    python event_log.py --project shop_daily [--rebuild]
+    python event_log.py --tail NAME          # print events after NAME's offset and commit it
+    python event_log.py --prune              # drop segments every consumer has read
+
+Settings (app.config):
+    EVENT_LOG_DIR             directory of the log (default: none, the log is off)
+    EVENT_LOG_SEGMENT_BYTES   size at which a segment is closed (default 64 MiB)
+    EVENT_LOG_FLUSH_INTERVAL  seconds a batch waits for more events (default 0.005)
+    EVENT_LOG_SYNC            requests wait for their fsync (default false)
+"""
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from metrics import METRICS, metrics
+
+METRICS['minimart_event_log_pending_events'] = ('gauge', 'Events buffered for the event log in this process')
+METRICS['minimart_event_log_appended_total'] = ('counter', 'Events appended to the event log, by type')
+METRICS['minimart_event_log_fsyncs_total'] = ('counter', 'Batches written and fsynced to the event log')
+
+SEGMENT_SUFFIX = '.log'
+OFFSET_DIGITS = 20
+READ_BYTES = 1024 * 1024
+
+
+class LogTruncated(Exception):
+    """A consumer's offset is in a segment that was pruned"""
+
+
+def _segments(directory):
+    """Base offsets of the segments in `directory`, oldest first"""
+    return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+                  if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+
+
+def _segment_path(directory, base):
+    return os.path.join(directory, f"{base:0{OFFSET_DIGITS}d}{SEGMENT_SUFFIX}")
+
+
+def _write_json(path, value):
+    """Replace `path` atomically with `value` as JSON"""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as file:
+        json.dump(value, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+def _fsync_directory(directory):
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class EventLog:
+    """This process's appender: a buffer and the writer thread that group-commits it"""
+
+    def __init__(self):
+        self.directory = None
+        self.segment_bytes = 64 * 1024 * 1024
+        self.flush_interval = 0.005
+        self.sync = False
+        self._reset_after_fork()
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def configure(self, config):
+        self.directory = config.get('EVENT_LOG_DIR')
+        self.segment_bytes = int(config.get('EVENT_LOG_SEGMENT_BYTES', 64 * 1024 * 1024))
+        self.flush_interval = float(config.get('EVENT_LOG_FLUSH_INTERVAL', 0.005))
+        self.sync = bool(config.get('EVENT_LOG_SYNC', False))
+        if self.directory:
+            os.makedirs(os.path.join(self.directory, 'consumers'), exist_ok=True)
+
+    def _reset_after_fork(self):
+        # Events buffered before the fork belong to (and are written by) the parent
+        self._lock = threading.Condition()
+        self._pending = []
+        self._appended = 0   # Events handed to append() in this process
+        self._written = 0    # Of those, events written and fsynced
+        self._writer_pid = None
+
+    def append(self, events, wait=None):
+        """
+        Buffer [(type, data)] for the writer; call after the commit that made
+        them true. With `wait` (default EVENT_LOG_SYNC) return once they are
+        on disk.
+        """
+        if not self.directory or not events:
+            return
+        at = datetime.utcnow().isoformat()
+        lines = [json.dumps({'type': type, 'at': at, 'data': data}, default=str).encode() + b'\n'
+                 for type, data in events]
+        for type, _ in events:
+            metrics.inc('minimart_event_log_appended_total', {'type': type})
+        self._start_writer()
+        with self._lock:
+            self._pending.extend(lines)
+            self._appended += len(lines)
+            mine = self._appended
+            self._lock.notify_all()
+            if wait if wait is not None else self.sync:
+                while self._written < mine:
+                    self._lock.wait()
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self, timeout=None):
+        """Wait until every event appended so far is on disk; False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            target = self._appended
+            while self._written < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._lock.wait(remaining)
+        return True
+
+    def _start_writer(self):
+        """Start the writer thread once per process (lazily, so it survives forks)"""
+        if self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+        threading.Thread(target=self._write_forever, name='event-log-writer', daemon=True).start()
+
+    def _write_forever(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._lock.wait()
+            time.sleep(self.flush_interval)  # Let concurrent requests join the batch
+            with self._lock:
+                batch = self._pending
+                self._pending = []
+            try:
+                write_batch(self.directory, b''.join(batch), self.segment_bytes)
+            except Exception as e:
+                print(f"Error writing the event log: {e}")
+                with self._lock:
+                    self._pending[:0] = batch  # Retried with the next batch
+                time.sleep(1)
+                continue
+            metrics.inc('minimart_event_log_fsyncs_total')
+            with self._lock:
+                self._written += len(batch)
+                self._lock.notify_all()
+
+
+def write_batch(directory, data, segment_bytes):
+    """Append `data` (whole lines) to the active segment, rolling it if full; one fsync"""
+    with open(os.path.join(directory, 'append.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            segments = _segments(directory)
+            base = segments[-1] if segments else 0
+            with open(_segment_path(directory, base), 'ab') as segment:
+                size = _repair_tail(segment, os.fstat(segment.fileno()).st_size)
+                if size >= segment_bytes:
+                    segment.close()
+                    base += size
+                    segment = open(_segment_path(directory, base), 'ab')
+                    _fsync_directory(directory)
+                with segment:
+                    segment.write(data)
+                    segment.flush()
+                    os.fsync(segment.fileno())
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _repair_tail(segment, size):
+    """Cut off a half-written line a crashed writer left at the end of a segment; returns its size"""
+    if not size:
+        return size
+    with open(segment.name, 'rb') as reader:
+        reader.seek(size - 1)
+        if reader.read(1) == b'\n':
+            return size
+        # Scan back a block at a time: the torn line can be longer than one read
+        end = size
+        while end:
+            start = max(0, end - READ_BYTES)
+            reader.seek(start)
+            newline = reader.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+    segment.truncate(end)
+    return end
+
+
+def read(directory, offset, max_events=1000):
+    """
+    [(offset, event)] of up to `max_events` events from `offset` on, and the
+    offset after the last one. A half-written last line is left for later.
+    """
+    segments = _segments(directory)
+    if not segments:
+        return [], offset
+    if offset < segments[0]:
+        raise LogTruncated(f"offset {offset} was pruned; the log starts at {segments[0]}")
+    events = []
+    for index, base in enumerate(segments):
+        end = segments[index + 1] if index + 1 < len(segments) else None
+        if end is not None and offset >= end:
+            continue
+        with open(_segment_path(directory, base), 'rb') as segment:
+            segment.seek(offset - base)
+            for line in iter(segment.readline, b''):
+                if not line.endswith(b'\n'):
+                    return events, offset
+                events.append((offset, json.loads(line)))
+                offset += len(line)
+                if len(events) >= max_events:
+                    return events, offset
+    return events, offset
+
+
+class Consumer:
+    """A named reader of the log whose committed offset is kept in consumers/<name>.json"""
+
+    def __init__(self, directory, name):
+        self.directory = directory
+        self.path = os.path.join(directory, 'consumers', f"{name}.json")
+        self.position = self.committed()
+
+    def committed(self):
+        try:
+            with open(self.path) as file:
+                return json.load(file)['offset']
+        except FileNotFoundError:
+            return 0
+
+    def poll(self, max_events=1000):
+        """The next events after the position, which moves past them"""
+        events, self.position = read(self.directory, self.position, max_events)
+        return events
+
+    def commit(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        _write_json(self.path, {'offset': self.position, 'committed_at': datetime.utcnow().isoformat()})
+
+
+class ShopDailyProjection:
+    """
+    Per shop and day: orders placed, units sold, revenue, and orders
+    cancelled (counted on the day of cancellation). The state and the offset
+    it has read up to are saved together, so replays never count twice.
+    """
+    name = 'shop_daily'
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, 'projections', f"{self.name}.json")
+        try:
+            with open(self.path) as file:
+                saved = json.load(file)
+        except FileNotFoundError:
+            saved = {'offset': 0, 'shops': {}}
+        self.offset, self.shops = saved['offset'], saved['shops']
+
+    def _day(self, shop_id, at):
+        days = self.shops.setdefault(str(shop_id), {})
+        return days.setdefault(at[:10], {'orders': 0, 'units': 0, 'revenue': 0.0, 'cancelled_orders': 0})
+
+    def apply(self, event):
+        data = event['data']
+        if event['type'] == 'order_placed':
+            for shop_id in {line['shop_id'] for line in data['lines']}:
+                self._day(shop_id, event['at'])['orders'] += 1
+            for line in data['lines']:
+                day = self._day(line['shop_id'], event['at'])
+                day['units'] += line['quantity']
+                day['revenue'] = round(day['revenue'] + (line['unit_price'] or 0) * line['quantity'], 2)
+        elif event['type'] == 'order_status_changed' and data['status'] == 'Cancelled':
+            for shop_id in data['shop_ids']:
+                self._day(shop_id, event['at'])['cancelled_orders'] += 1
+
+    def catch_up(self, batch_events=10000):
+        """Apply every event after the saved offset and save; returns the number applied"""
+        applied = 0
+        while True:
+            events, offset = read(self.directory, self.offset, batch_events)
+            for _, event in events:
+                self.apply(event)
+            self.offset = offset
+            applied += len(events)
+            if len(events) < batch_events:
+                break
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        _write_json(self.path, {'offset': self.offset, 'shops': self.shops})
+        return applied
+
+    def rebuild(self):
+        self.offset, self.shops = 0, {}
+        return self.catch_up()
+
+
+PROJECTIONS = {ShopDailyProjection.name: ShopDailyProjection}
+
+
+def prune(directory):
+    """
+    Delete segments that every consumer and projection has read past (never
+    the active one); returns the number deleted
+    """
+    offsets = []
+    for folder in ('consumers', 'projections'):
+        path = os.path.join(directory, folder)
+        for name in os.listdir(path) if os.path.isdir(path) else []:
+            if name.endswith('.json'):
+                with open(os.path.join(path, name)) as file:
+                    offsets.append(json.load(file)['offset'])
+    if not offsets:
+        return 0
+    segments = _segments(directory)
+    done = [base for base, end in zip(segments, segments[1:]) if end <= min(offsets)]
+    for base in done:
+        os.remove(_segment_path(directory, base))
+    return len(done)
+
+
+event_log = EventLog()
+
+
+def init_event_log(app):
+    """Configure the appender from `app` and write what is still buffered at exit"""
+    event_log.configure(app.config)
+    metrics.register_collector(lambda: [('minimart_event_log_pending_events', None, event_log.pending())])
+
+    def flush_at_exit():
+        if not event_log.flush(timeout=5):
+            print(f"Event log: {event_log.pending()} event(s) not written at exit")
+
+    atexit.register(flush_at_exit)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Read and maintain the order event log')
+    parser.add_argument('--project', choices=sorted(PROJECTIONS), help='catch a projection up and print it')
+    parser.add_argument('--rebuild', action='store_true', help='with --project: replay the log from the start')
+    parser.add_argument('--tail', metavar='NAME', help="print the events after consumer NAME's offset and commit it")
+    parser.add_argument('--prune', action='store_true', help='delete segments every consumer has read')
+    args = parser.parse_args()
+    if not (args.project or args.tail or args.prune):
+        parser.error('nothing to do; pass --project, --tail or --prune')
+
+    from app import app
+
+    directory = app.config.get('EVENT_LOG_DIR')
+    if not directory:
+        parser.error('EVENT_LOG_DIR is not set')
+    if args.project:
+        projection = PROJECTIONS[args.project](directory)
+        applied = projection.rebuild() if args.rebuild else projection.catch_up()
+        print(json.dumps(projection.shops, indent=2, sort_keys=True))
+        print(f"Applied {applied} event(s); {args.project} is at offset {projection.offset}")
+    if args.tail:
+        consumer = Consumer(directory, args.tail)
+        while True:
+            events = consumer.poll()
+            for offset, event in events:
+                print(offset, json.dumps(event))
+            if not events:
+                break
+        consumer.commit()
+    if args.prune:
+        print(f"Pruned {prune(directory)} segment(s)")
@@ -0,0 +1,477 @@
+# backend/fact_store.py
+"""
+Columnar, memory-mapped copy of order lines for platform-wide analytics.
+
+Cross-shop reports (revenue per city, category mix, hour-of-day demand) scan
+every order line, which the OLTP tables are not laid out for. The exporter
+copies order lines into one fixed-width array file per column under
+FACT_STORE_DIR; reports memory-map those files and answer with NumPy masks
+and bincounts, without touching the database.
+
+    <column>.bin    little-endian array per column; row i of every file is the same order line
+    manifest.json   row count, last exported order id, the city and category dictionaries
+    export.lock     held while an export runs
+
+City (the shop's) and category are dictionary-encoded: the files hold small
+integer codes and the manifest the strings. Rows are appended in order id
+order and never move, so order_id is sorted and an order's lines are
+contiguous. The manifest is replaced atomically once the column files are
+flushed, and readers only look at its first `rows` rows, so an interrupted
+export is never half visible (the next one truncates the leftover tail).
+
+Export with `python fact_store.py --export` from cron (or `--loop 60`). New
+orders are appended once they are --settle-seconds old, so an order that
+commits after a later one is not skipped. Orders have no change timestamp,
+so statuses of the last --status-days of orders are re-read and patched in
+place. Amounts are what each line was charged (order_items.unit_price); lines
+from before unit_price was recorded use the discounted list price at export
+time, like the shop analytics.
+
+Large stores are scanned in FACT_STORE_WORKERS processes, each mapping the
+same files (the page cache is shared) and aggregating a range of orders.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, select
+
+COLUMNS = {
+    'order_id': '<i8',
+    'created_at': '<i8',   # Seconds since the epoch, UTC
+    'shop_id': '<i4',
+    'product_id': '<i4',
+    'customer_id': '<i4',
+    'quantity': '<i4',
+    'amount': '<f8',       # Price * quantity at export time
+    'status': 'u1',        # Index into STATUSES
+    'city': '<u2',         # Index into the manifest's cities
+    'category': '<u2',     # Index into the manifest's categories
+}
+STATUSES = ('Pending', 'Processing', 'Shipped', 'Delivered', 'Cancelled')
+MAX_DICTIONARY = 65535
+
+GROUPS = ('city', 'category', 'shop', 'status', 'hour', 'weekday', 'day', 'month')
+MAX_GROUP_BY = 2
+MAX_GROUP_KEYS = 1 << 32
+DENSE_GROUP_KEYS = 1 << 20     # Up to this many possible keys, bincount over all of them
+PARALLEL_MIN_ROWS = 1_000_000  # Smaller stores are scanned in the request thread
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+class FactQueryError(ValueError):
+    pass
+
+
+class FactStoreMissing(Exception):
+    pass
+
+
+def empty_manifest():
+    return {'rows': 0, 'last_order_id': 0, 'exported_at': None,
+            'first_created_at': None, 'last_created_at': None, 'max_shop_id': 0,
+            'cities': [], 'categories': []}
+
+
+class FactStore:
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def manifest(self):
+        try:
+            with open(self.path('manifest.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def columns(self, rows, names=COLUMNS, mode='r'):
+        """Memory maps of the first `rows` rows of the named columns"""
+        if not rows:
+            return {name: np.zeros(0, COLUMNS[name]) for name in names}
+        return {name: np.memmap(self.path(f"{name}.bin"), dtype=COLUMNS[name], mode=mode, shape=(rows,))
+                for name in names}
+
+    @contextmanager
+    def export_lock(self):
+        """Exclusive export lock; raises BlockingIOError if another export holds it"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path('export.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write_manifest(self, manifest):
+        temporary = self.path(f"manifest.json.{os.getpid()}.tmp")
+        with open(temporary, 'w') as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path('manifest.json'))
+
+    def append(self, manifest, arrays):
+        """Append equally long column arrays after manifest['rows'] and publish the new manifest"""
+        rows = manifest['rows']
+        added = len(arrays['order_id'])
+        for name, dtype in COLUMNS.items():
+            itemsize = np.dtype(dtype).itemsize
+            path = self.path(f"{name}.bin")
+            with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+                f.truncate(rows * itemsize)  # Drop a tail left by an interrupted export
+                f.seek(rows * itemsize)
+                f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        manifest['rows'] = rows + added
+        self._write_manifest(manifest)
+
+    def patch_statuses(self, manifest, order_ids, statuses):
+        """Overwrite in place the status of every line of the given (exported) orders"""
+        columns = self.columns(manifest['rows'], ('order_id', 'status'), mode='r+')
+        starts = np.searchsorted(columns['order_id'], order_ids, side='left')
+        stops = np.searchsorted(columns['order_id'], order_ids, side='right')
+        for start, stop, status in zip(starts, stops, statuses):
+            columns['status'][start:stop] = status
+        columns['status'].flush()
+
+
+def _encode(values, dictionary):
+    """Codes of `values` in `dictionary`, extending it with unseen values"""
+    index = {value: code for code, value in enumerate(dictionary)}
+    codes = []
+    for value in values:
+        code = index.get(value)
+        if code is None:
+            if len(dictionary) >= MAX_DICTIONARY:
+                raise OverflowError(f"more than {MAX_DICTIONARY} distinct values")
+            code = index[value] = len(dictionary)
+            dictionary.append(value)
+        codes.append(code)
+    return codes
+
+
+def _seconds(value):
+    return int((value - datetime(1970, 1, 1)).total_seconds())
+
+
+def export(db, store, settle_seconds=60, status_days=30, batch_orders=5000, log=print):
+    """
+    Append orders placed since the last export (older than settle_seconds) and
+    patch the statuses of the last status_days of exported orders.
+    Returns (orders appended, lines appended, statuses patched).
+    """
+    tables = db.metadata.tables
+    orders, products, shops = tables['orders'], tables['products'], tables['shops']
+    # Orders older than the store can still be in the archive (see order_archive.py), e.g. on a first export
+    sources = ((orders, tables['order_items']), (tables['orders_archive'], tables['order_items_archive']))
+    status_codes = {status: code for code, status in enumerate(STATUSES)}
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=settle_seconds)
+    appended_orders = appended_lines = 0
+
+    with store.export_lock():
+        manifest = store.manifest() or empty_manifest()
+        while True:
+            batch = sorted((order for source, _ in sources for order in db.session.execute(
+                select(source.c.id, source.c.created_at, source.c.customer_id, source.c.status).
+                where(source.c.id > manifest['last_order_id']).order_by(source.c.id).limit(batch_orders))),
+                key=lambda order: order.id)[:batch_orders]
+            settled = []
+            for order in batch:
+                if order.created_at > cutoff:
+                    break  # Stop at the first unsettled order so none behind it is skipped
+                settled.append(order)
+            if not settled:
+                break
+            by_id = {order.id: order for order in settled}
+            lines = sorted((line for _, order_items in sources for line in db.session.execute(
+                select(order_items.c.order_id, order_items.c.shop_id, order_items.c.product_id,
+                       order_items.c.quantity, products.c.category, shops.c.city,
+                       func.coalesce(order_items.c.unit_price, products.c.price *
+                                     (100 - func.coalesce(products.c.discount_percentage, 0)) / 100).label('price')).
+                join(products, products.c.id == order_items.c.product_id).
+                join(shops, shops.c.id == order_items.c.shop_id).
+                where(order_items.c.order_id.in_(list(by_id))))),
+                key=lambda line: (line.order_id, line.product_id))
+            if lines:
+                created = [_seconds(by_id[line.order_id].created_at) for line in lines]
+                store.append(manifest, {
+                    'order_id': [line.order_id for line in lines],
+                    'created_at': created,
+                    'shop_id': [line.shop_id for line in lines],
+                    'product_id': [line.product_id for line in lines],
+                    'customer_id': [by_id[line.order_id].customer_id for line in lines],
+                    'quantity': [line.quantity for line in lines],
+                    'amount': [line.price * line.quantity for line in lines],
+                    'status': [status_codes.get(by_id[line.order_id].status, 0) for line in lines],
+                    'city': _encode([line.city for line in lines], manifest['cities']),
+                    'category': _encode([line.category for line in lines], manifest['categories']),
+                })
+                manifest['first_created_at'] = min(created + [manifest['first_created_at'] or created[0]])
+                manifest['last_created_at'] = max(created + [manifest['last_created_at'] or 0])
+                manifest['max_shop_id'] = max([manifest['max_shop_id']] + [line.shop_id for line in lines])
+            manifest['last_order_id'] = settled[-1].id
+            appended_orders += len(settled)
+            appended_lines += len(lines)
+            log(f"Exported orders up to {manifest['last_order_id']} ({manifest['rows']} lines in the store)")
+            if len(settled) < len(batch) or len(batch) < batch_orders:
+                break
+
+        patched = 0
+        if manifest['rows']:
+            recent = db.session.execute(
+                select(orders.c.id, orders.c.status).
+                where(orders.c.id <= manifest['last_order_id'],
+                      orders.c.created_at >= now - timedelta(days=status_days)).
+                order_by(orders.c.id)).all()
+            if recent:
+                columns = store.columns(manifest['rows'], ('order_id', 'status'))
+                ids = np.array([order.id for order in recent], dtype=np.int64)
+                current = np.array([status_codes.get(order.status, 0) for order in recent], dtype=np.uint8)
+                positions = np.searchsorted(columns['order_id'], ids)
+                exported = (positions < manifest['rows']) & \
+                    (columns['order_id'][np.minimum(positions, manifest['rows'] - 1)] == ids)
+                changed = exported.copy()
+                changed[exported] = columns['status'][positions[exported]] != current[exported]
+                if changed.any():
+                    store.patch_statuses(manifest, ids[changed], current[changed])
+                    patched = int(changed.sum())
+        manifest['exported_at'] = now.isoformat()
+        store._write_manifest(manifest)
+    return appended_orders, appended_lines, patched
+
+
+# --- Queries ---
+
+def _group_size(name, manifest):
+    """Number of possible codes of a group_by dimension"""
+    if name in ('city', 'category'):
+        return max(len(manifest['cities' if name == 'city' else 'categories']), 1)
+    if name == 'status':
+        return len(STATUSES)
+    if name == 'shop':
+        return manifest['max_shop_id'] + 1
+    if name == 'hour':
+        return 24
+    if name == 'weekday':
+        return 7
+    first, last = manifest['first_created_at'] or 0, manifest['last_created_at'] or 0
+    if name == 'day':
+        return last // 86400 - first // 86400 + 1
+    return int(_month(last) - _month(first)) + 1
+
+
+def _month(seconds):
+    """Months since 1970-01 of epoch seconds (scalar or array)"""
+    return np.asarray(seconds).astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+
+
+def _group_codes(name, columns, manifest):
+    """Code per row, in 0 .. _group_size(name) - 1, for a group_by dimension"""
+    if name in ('city', 'category', 'status'):
+        return columns[name].astype(np.int64)
+    if name == 'shop':
+        return columns['shop_id'].astype(np.int64)
+    created = columns['created_at']
+    if name == 'hour':
+        return created % 86400 // 3600
+    if name == 'weekday':
+        return (created // 86400 + 3) % 7  # 1970-01-01 was a Thursday; Monday is 0
+    first = manifest['first_created_at'] or 0
+    if name == 'day':
+        return created // 86400 - first // 86400
+    return _month(created) - _month(first)
+
+
+def _group_label(name, code, manifest):
+    if name == 'city':
+        return manifest['cities'][code]
+    if name == 'category':
+        return manifest['categories'][code]
+    if name == 'status':
+        return STATUSES[code]
+    if name == 'day':
+        return str(np.datetime64(manifest['first_created_at'] // 86400 + code, 'D'))
+    if name == 'month':
+        return str(np.datetime64(int(_month(manifest['first_created_at'])) + code, 'M'))
+    return int(code)
+
+
+def _first_of_runs(values):
+    """Mask of the rows of a sorted array that differ from the row before"""
+    first = np.ones(len(values), dtype=bool)
+    first[1:] = values[1:] != values[:-1]
+    return first
+
+
+def scan(directory, manifest, start, stop, filters, group_by):
+    """
+    Aggregate rows [start, stop) of the store; runs in a pool process or inline.
+    Returns (keys, revenue, quantity, lines, orders, total orders) with one
+    entry per group key present.
+    """
+    columns = {name: column[start:stop]
+               for name, column in FactStore(directory).columns(manifest['rows']).items()}
+    mask = np.ones(stop - start, dtype=bool)
+    if filters.get('start') is not None:
+        mask &= columns['created_at'] >= filters['start']
+    if filters.get('end') is not None:
+        mask &= columns['created_at'] <= filters['end']
+    for name, column in (('city', 'city'), ('category', 'category'), ('shop_id', 'shop_id'), ('status', 'status')):
+        if filters.get(name) is not None:
+            mask &= np.isin(columns[column], filters[name])
+
+    key = np.zeros(stop - start, dtype=np.int64)
+    size = 1
+    for name in group_by:
+        dimension = _group_size(name, manifest)
+        key = key * dimension + _group_codes(name, columns, manifest)
+        size *= dimension
+
+    key = key[mask]
+    amount = columns['amount'][mask]
+    quantity = columns['quantity'][mask].astype(np.float64)
+    order_ids = columns['order_id'][mask]
+    if size <= DENSE_GROUP_KEYS:
+        lines = np.bincount(key, minlength=size)
+        keys = np.flatnonzero(lines)
+        revenue = np.bincount(key, weights=amount, minlength=size)[keys]
+        quantity = np.bincount(key, weights=quantity, minlength=size)[keys]
+        lines = lines[keys]
+    else:
+        keys, inverse = np.unique(key, return_inverse=True)
+        lines = np.bincount(inverse, minlength=len(keys))
+        revenue = np.bincount(inverse, weights=amount, minlength=len(keys))
+        quantity = np.bincount(inverse, weights=quantity, minlength=len(keys))
+    # An order counts once per group it has lines in; chunks never split an order.
+    # Rows are in order id order, so (order, key) pairs are sorted but for the
+    # few lines within each order, which a stable sort (timsort) handles in one pass.
+    pairs = np.sort(order_ids * size + key, kind='stable')
+    order_keys = pairs[_first_of_runs(pairs)] % size
+    orders = np.bincount(np.searchsorted(keys, order_keys), minlength=len(keys))
+    total_orders = int(_first_of_runs(order_ids).sum())
+    return keys, revenue, quantity, lines, orders, total_orders
+
+
+def _executor(max_workers):
+    """Process-wide pool, recreated after a fork"""
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool_pid != os.getpid():
+                _pool = ProcessPoolExecutor(max_workers=max_workers)
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def chunk_bounds(order_ids, chunks):
+    """Row offsets splitting the store into about `chunks` ranges without splitting an order"""
+    rows = len(order_ids)
+    bounds = [0]
+    for i in range(1, chunks):
+        bound = int(np.searchsorted(order_ids, order_ids[rows * i // chunks], side='left'))
+        if bound > bounds[-1]:
+            bounds.append(bound)
+    bounds.append(rows)
+    return bounds
+
+
+def query(store, filters, group_by, workers=1, parallel_min_rows=PARALLEL_MIN_ROWS):
+    """
+    Group the store's order lines by up to MAX_GROUP_BY dimensions of GROUPS.
+    `filters` holds start/end (datetimes) and lists of city, category, shop_id
+    and status values; returns (manifest, groups, totals).
+    """
+    if len(group_by) > MAX_GROUP_BY or len(set(group_by)) != len(group_by):
+        raise FactQueryError(f"group_by takes up to {MAX_GROUP_BY} different dimensions")
+    for name in group_by:
+        if name not in GROUPS:
+            raise FactQueryError(f"group_by must be among: {', '.join(GROUPS)}")
+    manifest = store.manifest()
+    if manifest is None:
+        raise FactStoreMissing()
+
+    # Filter values become codes; an unknown city or category simply matches nothing
+    codes = {}
+    for name, dictionary in (('city', manifest['cities']), ('category', manifest['categories']), ('status', STATUSES)):
+        if filters.get(name) is not None:
+            codes[name] = [dictionary.index(value) for value in filters[name] if value in dictionary]
+    if filters.get('shop_id') is not None:
+        codes['shop_id'] = filters['shop_id']
+    for name in ('start', 'end'):
+        if filters.get(name) is not None:
+            codes[name] = _seconds(filters[name])
+
+    dimensions = [_group_size(name, manifest) for name in group_by]
+    if np.prod(dimensions, dtype=np.float64) > MAX_GROUP_KEYS:
+        raise FactQueryError("Too many possible groups; group by fewer or coarser dimensions")
+
+    rows = manifest['rows']
+    if rows >= parallel_min_rows and workers > 1:
+        bounds = chunk_bounds(store.columns(rows, ('order_id',))['order_id'], workers * 2)
+        futures = [_executor(workers).submit(scan, store.directory, manifest, start, stop, codes, group_by)
+                   for start, stop in zip(bounds, bounds[1:])]
+        partials = [future.result() for future in futures]
+    else:
+        partials = [scan(store.directory, manifest, 0, rows, codes, group_by)]
+
+    keys, inverse = np.unique(np.concatenate([p[0] for p in partials]), return_inverse=True)
+    merged = [np.bincount(inverse, weights=np.concatenate([p[i] for p in partials]), minlength=len(keys))
+              for i in range(1, 5)]
+    total_orders = sum(p[5] for p in partials)
+
+    groups = []
+    for key, revenue, quantity, lines, orders in zip(keys.tolist(), *(m.tolist() for m in merged)):
+        group = {}
+        for name, dimension in zip(reversed(group_by), reversed(dimensions)):
+            key, code = divmod(key, dimension)
+            group[name] = _group_label(name, code, manifest)
+        group = {name: group[name] for name in group_by}
+        group.update(revenue=round(revenue, 2), quantity=int(quantity), lines=int(lines), orders=int(orders))
+        groups.append(group)
+    totals = {'revenue': round(float(merged[0].sum()), 2), 'quantity': int(merged[1].sum()),
+              'lines': int(merged[2].sum()), 'orders': int(total_orders)}
+    return manifest, groups, totals
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export orders into the columnar fact store')
+    parser.add_argument('--export', action='store_true', help='append new orders and refresh recent statuses')
+    parser.add_argument('--loop', type=float, metavar='SECONDS', help='with --export: keep exporting at this interval')
+    parser.add_argument('--settle-seconds', type=float, default=60,
+                        help='only append orders at least this old (default 60)')
+    parser.add_argument('--status-days', type=float, default=30,
+                        help='re-read statuses of orders from this many days back (default 30)')
+    args = parser.parse_args()
+    if not args.export:
+        parser.error('nothing to do; pass --export')
+
+    from app import app, db
+
+    store = FactStore(app.config['FACT_STORE_DIR'])
+    with app.app_context():
+        while True:
+            try:
+                appended, lines, patched = export(db, store, args.settle_seconds, args.status_days)
+                print(f"Appended {appended} order(s) ({lines} lines), patched {patched} status(es)")
+            except BlockingIOError:
+                print("Another export is running")
+            db.session.remove()
+            if not args.loop:
+                break
+            time.sleep(args.loop)
@@ -0,0 +1,128 @@
+# backend/images.py
+"""
+Product image storage: originals stored by content hash, resized copies made
+off the request thread.
+
+An upload is stored once under IMAGE_DIR/<ab>/<sha256>/original.<ext>, where
+<ab> is the first two hex digits of the hash, and a process pool writes a
+WebP and a JPEG of it for every size in THUMBNAIL_SIZES next to it. The same
+bytes uploaded twice (or for two products) share one directory. Since a
+file's name is its content, /media responses are cacheable forever.
+
+Resizing needs Pillow, which is only imported in the pool's processes.
+
+Settings (app.config):
+    IMAGE_DIR        where images are stored (default backend/media)
+    MEDIA_URL        URL prefix the files are served under (default /media;
+                     set an absolute URL when a CDN or nginx serves IMAGE_DIR)
+    IMAGE_MAX_BYTES  largest accepted upload (default 10 MB)
+    IMAGE_WORKERS    resizing processes per worker (default 2)
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# name -> longest side in pixels
+THUMBNAIL_SIZES = {'thumb': 160, 'card': 400, 'detail': 1000}
+THUMBNAIL_FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 4}),
+                     'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})}
+
+# Leading bytes -> extension of the accepted formats
+SIGNATURES = ((b'\xff\xd8\xff', 'jpg'), (b'\x89PNG\r\n\x1a\n', 'png'), (b'GIF87a', 'gif'), (b'GIF89a', 'gif'))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def sniff_extension(data):
+    """Extension for the image in `data`, from its magic bytes rather than the client's filename"""
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    for signature, extension in SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    raise InvalidImage("Image must be a JPEG, PNG, GIF or WebP file")
+
+
+def image_dir(root, image_hash):
+    return os.path.join(root, image_hash[:2], image_hash)
+
+
+def image_urls(media_url, image_hash, extension):
+    """URLs of the original and every resized copy, e.g. urls['card']['webp']"""
+    base = f"{media_url}/{image_hash[:2]}/{image_hash}"
+    urls = {name: {fmt: f"{base}/{name}.{fmt}" for fmt in THUMBNAIL_FORMATS} for name in THUMBNAIL_SIZES}
+    urls['original'] = f"{base}/original.{extension}"
+    return urls
+
+
+def store_original(root, data):
+    """
+    Write `data` under its content hash unless it is already there.
+    Returns (hash, extension, whether the resized copies are all present).
+    """
+    extension = sniff_extension(data)
+    image_hash = hashlib.sha256(data).hexdigest()
+    directory = image_dir(root, image_hash)
+    path = os.path.join(directory, f"original.{extension}")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, path)  # Readers never see a half-written file
+    ready = all(os.path.exists(os.path.join(directory, f"{name}.{fmt}"))
+                for name in THUMBNAIL_SIZES for fmt in THUMBNAIL_FORMATS)
+    return image_hash, extension, ready
+
+
+def make_thumbnails(directory, extension):
+    """Runs in a pool process: write every size and format of the original in `directory`"""
+    from PIL import Image, ImageOps
+
+    with Image.open(os.path.join(directory, f"original.{extension}")) as original:
+        original = ImageOps.exif_transpose(original)  # Phone photos carry their rotation in EXIF
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA')
+        for name, side in THUMBNAIL_SIZES.items():
+            image = original.copy()
+            image.thumbnail((side, side), Image.LANCZOS)  # Only ever shrinks
+            for fmt, (pil_format, options) in THUMBNAIL_FORMATS.items():
+                out = image
+                if pil_format == 'JPEG' and out.mode == 'RGBA':
+                    out = Image.new('RGB', image.size, (255, 255, 255))
+                    out.paste(image, mask=image.getchannel('A'))
+                path = os.path.join(directory, f"{name}.{fmt}")
+                temporary = f"{path}.{os.getpid()}.tmp"
+                out.save(temporary, pil_format, **options)
+                os.replace(temporary, path)
+    return directory
+
+
+def _executor(max_workers):
+    """Process-wide pool, recreated after a fork"""
+    global _pool, _pool_pid
+    if _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool_pid != os.getpid():
+                _pool = ProcessPoolExecutor(max_workers=max_workers)
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _report(future):
+    if future.exception() is not None:
+        print(f"Error resizing image: {future.exception()}")
+
+
+def submit_thumbnails(root, image_hash, extension, max_workers=2):
+    """Queue the resized copies of a stored original; returns the Future"""
+    future = _executor(max_workers).submit(make_thumbnails, image_dir(root, image_hash), extension)
+    future.add_done_callback(_report)
+    return future
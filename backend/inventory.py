@@ -0,0 +1,207 @@
+# backend/inventory.py
+"""
+Append-only inventory ledger (the inventory_movements table).
+
+Every change to a product's sellable stock is written here in the same
+transaction as the change itself, with the order it belongs to:
+
+    opening         starting balance for stock that predates the ledger
+    sale            units taken by place_order
+    cancel_restock  units returned when an order is cancelled
+    adjustment      an admin setting the quantity (or adding a product)
+    shipment        units leaving with a shipped order; no effect on sellable stock
+
+`quantity` is the number of units moved and `stock_delta` its effect on
+sellable stock, so a product's stock at any moment is the sum of its
+stock_delta up to then. verify_inventory() compares that sum with what the
+products (and stock shards) hold and, with fix=True, resets them to the
+ledger; run it nightly with `python inventory.py --verify [--fix]`.
+
+All functions work inside the caller's db.session transaction unless noted.
+"""
+from datetime import datetime
+
+from sqlalchemy import case, false, func, literal, select, true
+
+KINDS = ('opening', 'sale', 'cancel_restock', 'adjustment', 'shipment')
+
+
+def _tables(db):
+    tables = db.metadata.tables
+    return tables['inventory_movements'], tables['products'], tables['order_items'], tables['product_stock_shards']
+
+
+def record_sales(db, order_id, lines):
+    """Ledger rows for the lines of a newly placed order"""
+    movements = _tables(db)[0]
+    now = datetime.utcnow()
+    db.session.execute(movements.insert(), [
+        {'product_id': line['product_id'], 'order_id': order_id, 'kind': 'sale',
+         'quantity': line['quantity'], 'stock_delta': -line['quantity'], 'created_at': now}
+        for line in lines])
+
+
+def record_adjustment(db, product_id, stock_delta):
+    if stock_delta:
+        movements = _tables(db)[0]
+        db.session.execute(movements.insert().values(
+            product_id=product_id, order_id=None, kind='adjustment', quantity=abs(stock_delta),
+            stock_delta=stock_delta, created_at=datetime.utcnow()))
+
+
+def _from_order_items(db, order_ids, kind, sign):
+    """INSERT ... SELECT one ledger row per order line of `order_ids`"""
+    movements, _, order_items, _ = _tables(db)
+    lines = select(order_items.c.product_id, order_items.c.order_id, literal(kind), order_items.c.quantity,
+                   order_items.c.quantity * sign, literal(datetime.utcnow())).\
+        where(order_items.c.order_id.in_(order_ids))
+    db.session.execute(movements.insert().from_select(
+        ['product_id', 'order_id', 'kind', 'quantity', 'stock_delta', 'created_at'], lines))
+
+
+def restock_cancelled(db, order_ids):
+    """
+    Put the units of cancelled orders back on sale: one UPDATE for products
+    that keep their stock in products.quantity, one for sharded products (into
+    their first shard), and one INSERT ... SELECT for the ledger. Call it only
+    for orders whose status this transaction actually changed to Cancelled.
+    """
+    movements, products, order_items, shards = _tables(db)
+    returned = select(func.sum(order_items.c.quantity)).\
+        where(order_items.c.order_id.in_(order_ids), order_items.c.product_id == products.c.id).scalar_subquery()
+    cancelled_products = select(order_items.c.product_id).where(order_items.c.order_id.in_(order_ids))
+    db.session.execute(products.update().
+                       where(products.c.id.in_(cancelled_products), products.c.sharded_stock == false()).
+                       values(quantity=products.c.quantity + returned))
+
+    returned_to_shard = select(func.sum(order_items.c.quantity)).\
+        where(order_items.c.order_id.in_(order_ids), order_items.c.product_id == shards.c.product_id).scalar_subquery()
+    sharded_products = select(products.c.id).where(products.c.id.in_(cancelled_products), products.c.sharded_stock == true())
+    db.session.execute(shards.update().
+                       where(shards.c.product_id.in_(sharded_products), shards.c.shard == 0).
+                       values(quantity=shards.c.quantity + returned_to_shard))
+
+    _from_order_items(db, order_ids, 'cancel_restock', 1)
+
+
+def record_shipments(db, order_ids):
+    _from_order_items(db, order_ids, 'shipment', 0)
+
+
+def ledger_stock_query(db, at=None):
+    """(product_id, stock) from the ledger, optionally as of `at`"""
+    movements = _tables(db)[0]
+    query = select(movements.c.product_id, func.sum(movements.c.stock_delta).label('stock')).\
+        group_by(movements.c.product_id)
+    if at is not None:
+        query = query.where(movements.c.created_at <= at)
+    return query
+
+
+def stock_at(db, at, product_ids=None):
+    """{product_id: sellable stock at `at`} according to the ledger"""
+    query = ledger_stock_query(db, at)
+    if product_ids is not None:
+        query = query.where(_tables(db)[0].c.product_id.in_(product_ids))
+    return dict(db.session.execute(query).all())
+
+
+def record_opening_balances(db):
+    """
+    Write an `opening` row with the current stock for every product that has
+    no ledger rows yet (run once after adding the ledger to an existing
+    database). Returns the number of products opened. Commits.
+    """
+    movements, products, _, shards = _tables(db)
+    shard_total = select(func.coalesce(func.sum(shards.c.quantity), 0)).\
+        where(shards.c.product_id == products.c.id).scalar_subquery()
+    current = case((products.c.sharded_stock == true(), shard_total), else_=products.c.quantity)
+    unopened = select(products.c.id, literal(None), literal('opening'), current, current, literal(datetime.utcnow())).\
+        where(~products.c.id.in_(select(movements.c.product_id)))
+    result = db.session.execute(movements.insert().from_select(
+        ['product_id', 'order_id', 'kind', 'quantity', 'stock_delta', 'created_at'], unopened))
+    db.session.commit()
+    return result.rowcount
+
+
+def unopened_products(db):
+    """Ids of products with no ledger rows at all (see record_opening_balances)"""
+    movements, products, _, _ = _tables(db)
+    return db.session.execute(select(products.c.id).where(~products.c.id.in_(select(movements.c.product_id))).
+                              order_by(products.c.id)).scalars().all()
+
+
+def verify_inventory(db, fix=False):
+    """
+    Products whose stock differs from their ledger balance, as a list of
+    (product_id, stored, ledger). With fix=True the stored stock is reset to the
+    ledger balance (one UPDATE for all plain products, one per sharded product)
+    and the change committed. Products with no ledger rows have no balance to
+    compare with and are skipped, never reset to 0; see unopened_products().
+    """
+    movements, products, _, shards = _tables(db)
+    ledger = ledger_stock_query(db).subquery()
+    shard_totals = select(shards.c.product_id, func.sum(shards.c.quantity).label('stock')).\
+        group_by(shards.c.product_id).subquery()
+    stored = func.coalesce(shard_totals.c.stock, 0)
+    rows = db.session.execute(
+        select(products.c.id, products.c.sharded_stock, products.c.quantity, stored, ledger.c.stock).
+        select_from(products.join(ledger, ledger.c.product_id == products.c.id).
+                    outerjoin(shard_totals, shard_totals.c.product_id == products.c.id))).all()
+
+    mismatches = []
+    for product_id, sharded, quantity, shard_stock, ledger_stock in rows:
+        current = shard_stock if sharded else quantity
+        if current != ledger_stock:
+            mismatches.append((product_id, current, ledger_stock))
+    if not fix or not mismatches:
+        return mismatches
+
+    balance = select(func.coalesce(func.sum(movements.c.stock_delta), 0)).\
+        where(movements.c.product_id == products.c.id).scalar_subquery()
+    wrong_ids = [product_id for product_id, _, _ in mismatches]
+    db.session.execute(products.update().
+                       where(products.c.id.in_(wrong_ids), products.c.sharded_stock == false()).
+                       values(quantity=balance))
+    # Sharded products: shard 0 absorbs the difference, the other shards keep theirs
+    differences = {product_id: ledger_stock - current for product_id, current, ledger_stock in mismatches}
+    sharded_ids = db.session.execute(select(products.c.id).
+                                     where(products.c.id.in_(wrong_ids), products.c.sharded_stock == true())).scalars().all()
+    for product_id in sharded_ids:
+        db.session.execute(shards.update().
+                           where(shards.c.product_id == product_id, shards.c.shard == 0).
+                           values(quantity=shards.c.quantity + differences[product_id]))
+    db.session.commit()
+    return mismatches
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inventory ledger maintenance')
+    parser.add_argument('--open-balances', action='store_true',
+                        help='write opening ledger rows for products that have none yet')
+    parser.add_argument('--verify', action='store_true', help='compare stored stock with the ledger')
+    parser.add_argument('--fix', action='store_true', help='with --verify: reset stored stock to the ledger balance')
+    parser.add_argument('--stock-at', metavar='ISO_DATETIME', help='print every product\'s stock at this UTC time')
+    args = parser.parse_args()
+    if not (args.open_balances or args.verify or args.stock_at):
+        parser.error('nothing to do; pass --open-balances, --verify or --stock-at')
+
+    from app import app, db
+
+    with app.app_context():
+        if args.open_balances:
+            print(f"Opened ledger balances for {record_opening_balances(db)} product(s)")
+        if args.verify:
+            mismatches = verify_inventory(db, fix=args.fix)
+            for product_id, stored, ledger in mismatches:
+                print(f"  product {product_id}: stored {stored}, ledger {ledger}")
+            print(f"{len(mismatches)} product(s) differ from the ledger" + (" (fixed)" if args.fix and mismatches else ""))
+            unopened = unopened_products(db)
+            if unopened:
+                print(f"{len(unopened)} product(s) have no ledger rows and were not checked; "
+                      f"run --open-balances to open them")
+        if args.stock_at:
+            for product_id, stock in sorted(stock_at(db, datetime.fromisoformat(args.stock_at)).items()):
+                print(f"  product {product_id}: {stock}")
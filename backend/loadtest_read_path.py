@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# backend/loadtest_read_path.py
+"""
+Load test comparing the sync (gunicorn + Flask) and async (uvicorn + asgi_app)
+read paths on the public catalog endpoints.
+
+Both servers are started against the same DATABASE_URL with the same number of
+workers, driven with the same concurrency, and their resident memory (summed
+over the master and all workers) is sampled while the load runs. The headline
+number is requests/sec per MB of RSS.
+
+Usage:
+    DATABASE_URL=sqlite:////tmp/mini_mart.db python loadtest_read_path.py --workers 2 --duration 15
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SERVERS = {
+    'sync': lambda port, workers: [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}', 'app:app'],
+    'async': lambda port, workers: [sys.executable, '-m', 'uvicorn', 'asgi_app:application', '--workers', str(workers),
+                                    '--port', str(port), '--log-level', 'warning'],
+}
+
+def process_tree_rss_kb(pid):
+    """Sum VmRSS over a process and all of its descendants (Linux /proc only)"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+                        break
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pending.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total
+
+def wait_until_ready(base_url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/api/products', timeout=2).read()
+            return
+        except urllib.error.HTTPError:
+            return  # Server is up, the catalog may simply be empty
+        except Exception:
+            time.sleep(0.25)
+    raise RuntimeError(f"Server at {base_url} did not come up within {timeout}s")
+
+def drive(base_url, paths, concurrency, duration, headers):
+    """Hammer `paths` round-robin from `concurrency` threads, returning (ok, errors)"""
+    counts = {'ok': 0, 'errors': 0}
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def worker(offset):
+        ok = errors = 0
+        i = offset
+        while time.time() < stop_at:
+            req = urllib.request.Request(base_url + paths[i % len(paths)], headers=headers)
+            i += 1
+            try:
+                urllib.request.urlopen(req, timeout=30).read()
+                ok += 1
+            except urllib.error.HTTPError as e:
+                # 404s for an empty city are still served requests
+                ok, errors = (ok + 1, errors) if e.code == 404 else (ok, errors + 1)
+            except Exception:
+                errors += 1
+        with lock:
+            counts['ok'] += ok
+            counts['errors'] += errors
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return counts['ok'], counts['errors']
+
+def run_one(mode, args, env):
+    port = args.port if mode == 'sync' else args.port + 1
+    base_url = f'http://127.0.0.1:{port}'
+    proc = subprocess.Popen(SERVERS[mode](port, args.workers), cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(base_url)
+        headers = {'Authorization': f'Bearer {args.token}'} if args.token else {}
+        samples = []
+        sampling = threading.Event()
+
+        def sample_rss():
+            while not sampling.is_set():
+                samples.append(process_tree_rss_kb(proc.pid))
+                time.sleep(0.5)
+
+        sampler = threading.Thread(target=sample_rss)
+        sampler.start()
+        started = time.time()
+        ok, errors = drive(base_url, args.paths, args.concurrency, args.duration, headers)
+        elapsed = time.time() - started
+        sampling.set()
+        sampler.join()
+
+        peak_mb = max(samples) / 1024 if samples else 0
+        rps = ok / elapsed
+        return {
+            'mode': mode,
+            'workers': args.workers,
+            'concurrency': args.concurrency,
+            'requests': ok,
+            'errors': errors,
+            'requests_per_sec': round(rps, 1),
+            'peak_rss_mb': round(peak_mb, 1),
+            'requests_per_sec_per_mb': round(rps / peak_mb, 3) if peak_mb else None,
+        }
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=15, help="Seconds of load per server")
+    parser.add_argument('--port', type=int, default=5100, help="Sync server port; the async one uses port + 1")
+    parser.add_argument('--city', default='Pune')
+    parser.add_argument('--shop-id', type=int, default=1)
+    parser.add_argument('--token', default=os.environ.get('LOADTEST_TOKEN'),
+                        help="JWT for /api/shops/city/<city>, which is skipped without one")
+    parser.add_argument('--modes', nargs='+', default=['sync', 'async'], choices=sorted(SERVERS))
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    args.paths = ['/api/products', f'/api/products/city/{args.city}', f'/api/shops/{args.shop_id}/products']
+    if args.token:
+        args.paths.append(f'/api/shops/city/{args.city}')
+
+    env = dict(os.environ)
+    results = [run_one(mode, args, env) for mode in args.modes]
+
+    print(f"{'mode':<6} {'req/s':>9} {'peak RSS MB':>12} {'req/s per MB':>13} {'errors':>7}")
+    for r in results:
+        print(f"{r['mode']:<6} {r['requests_per_sec']:>9} {r['peak_rss_mb']:>12} {r['requests_per_sec_per_mb']!s:>13} {r['errors']:>7}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
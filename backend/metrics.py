@@ -0,0 +1,325 @@
+# backend/metrics.py
+"""
+Prometheus metrics for the backend, served from GET /metrics.
+
+Hot-path updates go to a per-thread shard, so recording a request never takes a
+lock; shards are only merged when /metrics is scraped. With METRICS_DIR set,
+every worker process also writes its merged snapshot to a file in that
+directory (on an interval and on every scrape), and /metrics sums the files of
+all workers, so any worker can answer for the whole server. Gauges that
+describe a live process (in-flight requests, DB pool) are only summed for
+workers that are still running.
+
+Usage elsewhere in the app:
+    metrics.inc('minimart_orders_placed_total', {'outcome': 'success'})
+    metrics.cache_lookup('catalog', hit=True)
+"""
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import weakref
+
+from flask import Response, request
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help)
+METRICS = {
+    'minimart_http_requests_total': ('counter', 'HTTP requests by route, method and status code'),
+    'minimart_http_request_duration_seconds': ('histogram', 'HTTP request latency by route and method'),
+    'minimart_http_requests_in_flight': ('gauge', 'HTTP requests currently being served'),
+    'minimart_db_pool_size': ('gauge', 'Configured size of the SQLAlchemy connection pool'),
+    'minimart_db_pool_checked_out': ('gauge', 'Connections currently checked out of the pool'),
+    'minimart_db_pool_overflow': ('gauge', 'Connections opened beyond the pool size'),
+    'minimart_cache_requests_total': ('counter', 'Cache lookups by cache and result (hit or miss)'),
+    'minimart_cache_hit_ratio': ('gauge', 'Share of cache lookups that were hits'),
+    'minimart_orders_placed_total': ('counter', 'Order placement attempts by outcome'),
+}
+
+
+class _Shard:
+    """Metric values written by a single thread"""
+    __slots__ = ('counters', 'gauges', 'histograms', 'thread')
+
+    def __init__(self):
+        self.counters = {}    # (name, labels) -> value
+        self.gauges = {}      # (name, labels) -> value, additive across shards
+        self.histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self.thread = weakref.ref(threading.current_thread())
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()  # Totals folded in from threads that have exited
+        self._collectors = []     # Callables returning [(name, labels, value)] at scrape time
+        self.directory = None
+        self.flush_interval = 5.0
+        self._flusher_pid = None
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # A forked worker starts from zero; the parent's values stay with the parent
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()
+        self._flusher_pid = None
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+                if len(self._shards) % 256 == 0:
+                    self._retire_dead_shards()
+        return shard
+
+    def _retire_dead_shards(self):
+        """Fold shards of exited threads into the retired totals. Caller holds the lock."""
+        alive = []
+        for shard in self._shards:
+            if shard.thread() is not None and shard.thread().is_alive():
+                alive.append(shard)
+                continue
+            _merge_into(self._retired, shard.counters, shard.gauges, shard.histograms)
+        self._shards = alive
+
+    # --- Recording (lock-free, thread-local) ---
+    def inc(self, name, labels=None, value=1):
+        key = (name, _label_key(labels))
+        counters = self._shard().counters
+        counters[key] = counters.get(key, 0) + value
+
+    def gauge_add(self, name, value, labels=None):
+        key = (name, _label_key(labels))
+        gauges = self._shard().gauges
+        gauges[key] = gauges.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        key = (name, _label_key(labels))
+        histograms = self._shard().histograms
+        series = histograms.get(key)
+        if series is None:
+            series = histograms[key] = [0] * (len(LATENCY_BUCKETS) + 3)
+        series[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def cache_lookup(self, cache, hit):
+        self.inc('minimart_cache_requests_total', {'cache': cache, 'result': 'hit' if hit else 'miss'})
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    # --- Aggregation ---
+    def snapshot(self):
+        """Merge every shard of this process into plain dicts"""
+        merged = _Shard()
+        with self._lock:
+            self._retire_dead_shards()
+            shards = [self._retired] + list(self._shards)
+        for shard in shards:
+            # dict.copy() is atomic under the GIL, so writers never need a lock
+            _merge_into(merged, shard.counters.copy(), shard.gauges.copy(), shard.histograms.copy())
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                key = (name, _label_key(labels))
+                merged.gauges[key] = merged.gauges.get(key, 0) + value
+        return merged
+
+    def flush_to_file(self, merged=None):
+        """Write this process's snapshot to METRICS_DIR for other workers to aggregate"""
+        if not self.directory:
+            return
+        merged = merged or self.snapshot()
+        payload = {
+            'pid': os.getpid(),
+            'written_at': time.time(),
+            'counters': [[n, list(l), v] for (n, l), v in merged.counters.items()],
+            'gauges': [[n, list(l), v] for (n, l), v in merged.gauges.items()],
+            'histograms': [[n, list(l), v] for (n, l), v in merged.histograms.items()],
+        }
+        path = os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+
+    def start_flusher(self):
+        """Start the background file writer once per process (lazily, so it survives forks)"""
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+
+        def flush_forever():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush_to_file()
+                except OSError as e:
+                    print(f"Error writing metrics snapshot: {e}")
+
+        threading.Thread(target=flush_forever, name='metrics-flusher', daemon=True).start()
+
+    def collect(self):
+        """Values for the whole server: this process plus, with METRICS_DIR, every other worker"""
+        local = self.snapshot()
+        if not self.directory:
+            return local
+        self.flush_to_file(local)
+
+        total = _Shard()
+        _merge_into(total, local.counters, local.gauges, local.histograms)
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue  # Being replaced right now; it is picked up on the next scrape
+            if data['pid'] == os.getpid():
+                continue
+            counters = {(n, _tuple_labels(l)): v for n, l, v in data['counters']}
+            histograms = {(n, _tuple_labels(l)): v for n, l, v in data['histograms']}
+            # Process-level gauges of exited workers no longer describe anything
+            gauges = {(n, _tuple_labels(l)): v for n, l, v in data['gauges']} if _pid_alive(data['pid']) else {}
+            _merge_into(total, counters, gauges, histograms)
+        return total
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        merged = self.collect()
+        _add_cache_hit_ratios(merged)
+
+        series = {}
+        for kind, values in (('counters', merged.counters), ('gauges', merged.gauges), ('histograms', merged.histograms)):
+            for (name, labels), value in values.items():
+                series.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name in sorted(series):
+            kind, help_text = METRICS.get(name, ('untyped', name))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(series[name]):
+                if kind != 'histogram':
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), value[:-2]):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", le),))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value[-2])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {value[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items())) if labels else ()
+
+def _tuple_labels(labels):
+    return tuple(tuple(pair) for pair in labels)
+
+def _merge_into(target, counters, gauges, histograms):
+    for key, value in counters.items():
+        target.counters[key] = target.counters.get(key, 0) + value
+    for key, value in gauges.items():
+        target.gauges[key] = target.gauges.get(key, 0) + value
+    for key, value in histograms.items():
+        existing = target.histograms.get(key)
+        target.histograms[key] = list(value) if existing is None else [a + b for a, b in zip(existing, value)]
+
+def _add_cache_hit_ratios(merged):
+    lookups = {}
+    for (name, labels), value in merged.counters.items():
+        if name == 'minimart_cache_requests_total':
+            label_map = dict(labels)
+            hits_total = lookups.setdefault(label_map['cache'], [0, 0])
+            hits_total[0] += value if label_map['result'] == 'hit' else 0
+            hits_total[1] += value
+    for cache, (hits, total) in lookups.items():
+        if total:
+            merged.gauges[('minimart_cache_hit_ratio', (('cache', cache),))] = hits / total
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape_label_value(v)}"' for k, v in labels) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+metrics = MetricsRegistry()
+
+
+def init_metrics(app, db):
+    """Record per-route request metrics for `app` and expose them at /metrics"""
+    metrics.directory = app.config.get('METRICS_DIR')
+    metrics.flush_interval = float(app.config.get('METRICS_FLUSH_INTERVAL', 5))
+    if metrics.directory:
+        os.makedirs(metrics.directory, exist_ok=True)
+
+    def collect_pool_stats():
+        with app.app_context():
+            pool = db.engine.pool
+        if not hasattr(pool, 'checkedout'):
+            return []  # SQLite's single-connection pools have nothing to report
+        return [
+            ('minimart_db_pool_size', None, pool.size()),
+            ('minimart_db_pool_checked_out', None, pool.checkedout()),
+            ('minimart_db_pool_overflow', None, max(pool.overflow(), 0)),
+        ]
+
+    metrics.register_collector(collect_pool_stats)
+
+    # Per-request state lives in the WSGI environ rather than on g, because sub-requests
+    # dispatched inside another request (POST /api/batch) share the outer request's g
+    @app.before_request
+    def start_request_metrics():
+        metrics.start_flusher()
+        request.environ['metrics.started'] = time.perf_counter()
+        request.environ['metrics.in_flight'] = True
+        metrics.gauge_add('minimart_http_requests_in_flight', 1)
+
+    @app.after_request
+    def record_request_metrics(response):
+        started = request.environ.pop('metrics.started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            metrics.inc('minimart_http_requests_total',
+                        {'route': route, 'method': request.method, 'status': str(response.status_code)})
+            metrics.observe('minimart_http_request_duration_seconds', time.perf_counter() - started,
+                            {'route': route, 'method': request.method})
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        if request.environ.pop('metrics.in_flight', False):
+            metrics.gauge_add('minimart_http_requests_in_flight', -1)
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
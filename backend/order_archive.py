@@ -0,0 +1,111 @@
+# backend/order_archive.py
+"""
+Cold order history in archive tables.
+
+orders and order_items only ever grow, and every shop and customer read walks
+their indexes. Orders that are finished (Delivered or Cancelled) and older
+than ORDER_ARCHIVE_DAYS (default 365) never change again, so archive_orders()
+moves them, a batch of orders at a time, into orders_archive and
+order_items_archive: same columns, no foreign keys. The hot tables keep only
+recent and unfinished orders, small enough to stay in the buffer pool.
+
+Only rows older than the horizon are ever moved, so a read whose range starts
+within the horizon (reaches_archive() is False) needs the hot tables alone.
+History reads in app.py run against the archive as well only when their range
+starts before it, or is unbounded; see order_sources() there. Web workers and
+this job must therefore see the same ORDER_ARCHIVE_DAYS.
+
+Each batch is copied and deleted in one transaction, so an interrupted run
+leaves every order in exactly one place.
+
+    python order_archive.py --archive          # from cron, e.g. nightly
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+ARCHIVED_STATUSES = ('Delivered', 'Cancelled')  # Orders in these states never change again
+MIN_HORIZON_DAYS = 60  # Fact store status patches and stock alert summaries look back less than this
+
+
+def _tables(db):
+    tables = db.metadata.tables
+    return tables['orders'], tables['order_items'], tables['orders_archive'], tables['order_items_archive']
+
+
+def archive_cutoff(horizon_days, now=None):
+    """Orders created before this may be in the archive"""
+    return (now or datetime.utcnow()) - timedelta(days=horizon_days)
+
+
+def reaches_archive(start, horizon_days, now=None):
+    """Whether orders created from `start` on (None: any time) can include archived ones"""
+    return start is None or start < archive_cutoff(horizon_days, now)
+
+
+def archive_orders(db, horizon_days, batch_orders=1000, log=print):
+    """Move finished orders older than `horizon_days` to the archive tables; returns the number moved"""
+    if horizon_days < MIN_HORIZON_DAYS:
+        raise ValueError(f"The archive horizon must be at least {MIN_HORIZON_DAYS} days")
+    orders, order_items, orders_archive, order_items_archive = _tables(db)
+    cutoff = archive_cutoff(horizon_days)
+    moved = 0
+    while True:
+        ids = db.session.execute(select(orders.c.id).
+                                 where(orders.c.created_at < cutoff, orders.c.status.in_(ARCHIVED_STATUSES)).
+                                 order_by(orders.c.id).limit(batch_orders)).scalars().all()
+        if not ids:
+            return moved
+        order_columns = [column.name for column in orders_archive.c]
+        item_columns = [column.name for column in order_items_archive.c]
+        db.session.execute(orders_archive.insert().from_select(
+            order_columns, select(*[orders.c[name] for name in order_columns]).where(orders.c.id.in_(ids))))
+        db.session.execute(order_items_archive.insert().from_select(
+            item_columns, select(*[order_items.c[name] for name in item_columns]).where(order_items.c.order_id.in_(ids))))
+        db.session.execute(order_items.delete().where(order_items.c.order_id.in_(ids)))
+        db.session.execute(orders.delete().where(orders.c.id.in_(ids)))
+        db.session.commit()
+        moved += len(ids)
+        log(f"Archived orders up to {ids[-1]} ({moved} so far)")
+        if len(ids) < batch_orders:
+            return moved
+
+
+def restore_orders(db, order_ids):
+    """Move archived orders back to the hot tables (e.g. to correct one); returns the number moved. Commits."""
+    orders, order_items, orders_archive, order_items_archive = _tables(db)
+    order_columns = [column.name for column in orders_archive.c]
+    item_columns = [column.name for column in order_items_archive.c]
+    db.session.execute(orders.insert().from_select(
+        order_columns, select(*[orders_archive.c[name] for name in order_columns]).
+        where(orders_archive.c.id.in_(order_ids))))
+    db.session.execute(order_items.insert().from_select(
+        item_columns, select(*[order_items_archive.c[name] for name in item_columns]).
+        where(order_items_archive.c.order_id.in_(order_ids))))
+    db.session.execute(order_items_archive.delete().where(order_items_archive.c.order_id.in_(order_ids)))
+    restored = db.session.execute(orders_archive.delete().where(orders_archive.c.id.in_(order_ids))).rowcount
+    db.session.commit()
+    return restored
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Move cold order history to the archive tables')
+    parser.add_argument('--archive', action='store_true',
+                        help='archive finished orders older than ORDER_ARCHIVE_DAYS')
+    parser.add_argument('--restore', type=int, nargs='+', metavar='ORDER_ID',
+                        help='move these orders back to the hot tables')
+    parser.add_argument('--batch-orders', type=int, default=1000, help='orders moved per transaction (default 1000)')
+    args = parser.parse_args()
+    if not (args.archive or args.restore):
+        parser.error('nothing to do; pass --archive or --restore')
+
+    from app import app, db
+
+    with app.app_context():
+        if args.restore:
+            print(f"Restored {restore_orders(db, args.restore)} order(s)")
+        if args.archive:
+            horizon = app.config['ORDER_ARCHIVE_DAYS']
+            print(f"Archived {archive_orders(db, horizon, args.batch_orders)} order(s) older than {horizon} days")
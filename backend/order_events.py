@@ -0,0 +1,285 @@
+# backend/order_events.py
+"""
+Live order events for shop dashboards, pushed over Server-Sent Events by
+GET /api/orders/shop/stream instead of the dashboard polling the order list.
+
+place_order publishes an `order_created` event for every shop in the order
+and the status routes publish `order_status_changed`, always after their
+commit. Events go through a bus to the broker of every worker process, which
+keeps the last ORDER_EVENTS_BACKLOG of them and hands them to that process's
+open streams:
+
+    LocalBus  (default) events stay in the publishing process; fine for one
+              worker or a dev server.
+    FileBus   (ORDER_EVENTS_DIR set) events are appended to a shared log file
+              that every worker tails, a stand-in for Redis pub/sub on one
+              host. The log is not rotated; remove it while the app is down.
+
+Event ids are "<epoch>-<sequence>". A reconnecting EventSource sends the last
+one it saw as Last-Event-ID and gets the events it missed from the backlog;
+if they are no longer there (or the id is from another epoch, e.g. a restart)
+it gets a `reset` event and should reload the order list.
+
+Every stream has a bounded queue (ORDER_EVENTS_QUEUE_SIZE). A client that
+reads slower than events arrive fills it and its stream is closed; the
+browser reconnects and resumes from Last-Event-ID. Streams also end after
+ORDER_EVENTS_STREAM_SECONDS so sync workers get their threads back.
+
+Settings (app.config):
+    ORDER_EVENTS_DIR             directory of the shared event log (default: none, LocalBus)
+    ORDER_EVENTS_BACKLOG         events kept for resuming (default 1000)
+    ORDER_EVENTS_QUEUE_SIZE      events buffered per stream (default 256)
+    ORDER_EVENTS_MAX_STREAMS     open streams per process (default 100)
+    ORDER_EVENTS_HEARTBEAT       seconds between keep-alive comments (default 15)
+    ORDER_EVENTS_STREAM_SECONDS  lifetime of one stream (default 300)
+"""
+import collections
+import fcntl
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+
+from metrics import METRICS, metrics
+
+METRICS['minimart_order_event_streams'] = ('gauge', 'Open order event streams in this process')
+METRICS['minimart_order_events_published_total'] = ('counter', 'Order events published, by type')
+METRICS['minimart_order_event_streams_dropped_total'] = ('counter', 'Streams closed because the client fell behind')
+
+FILE_BUS_POLL_SECONDS = 0.2
+FILE_BUS_PRELOAD_BYTES = 256 * 1024
+
+
+class TooManyStreams(Exception):
+    pass
+
+
+class Event:
+    __slots__ = ('seq', 'shop_id', 'type', 'data')
+
+    def __init__(self, seq, shop_id, type, data):
+        self.seq = seq
+        self.shop_id = shop_id
+        self.type = type
+        self.data = data  # JSON text
+
+
+class LocalBus:
+    """Delivers events straight to this process's broker"""
+
+    def __init__(self):
+        self.deliver = None
+        self.reset()
+
+    def reset(self):
+        # Sequences are per process, so a forked worker starts its own epoch
+        self.epoch = f"{os.getpid()}.{int(time.time() * 1000)}"
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self):
+        pass
+
+    def publish(self, events):
+        with self._lock:
+            delivered = [Event(next(self._seq), shop_id, type, data) for shop_id, type, data in events]
+            # Under the lock so every stream sees events in sequence order
+            self.deliver(delivered)
+
+
+class FileBus:
+    """
+    Events appended as JSON lines to a log file shared by the workers; the
+    sequence is the line's byte offset. Every process (the publisher too)
+    receives them from a tail thread, so all workers see one order.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'order-events.log')
+        open(self.path, 'a').close()
+        self.epoch = f"f{os.stat(self.path).st_ino}"
+        self.deliver = None
+        self.reset()
+
+    def reset(self):
+        self._tail_pid = None
+        self._lock = threading.Lock()
+
+    def publish(self, events):
+        self.start()
+        lines = b''.join(json.dumps({'shop_id': shop_id, 'type': type, 'data': data}).encode() + b'\n'
+                         for shop_id, type, data in events)
+        with open(self.path, 'ab') as log:
+            fcntl.flock(log, fcntl.LOCK_EX)
+            try:
+                log.write(lines)
+            finally:
+                fcntl.flock(log, fcntl.LOCK_UN)
+
+    def start(self):
+        """
+        Load the end of the log into the backlog, so recent Last-Event-IDs can
+        be resumed after a restart, and start this process's tail thread
+        (again after a fork).
+        """
+        if self._tail_pid == os.getpid():
+            return
+        with self._lock:
+            if self._tail_pid == os.getpid():
+                return
+            log = open(self.path, 'rb')
+            offset = max(0, os.path.getsize(self.path) - FILE_BUS_PRELOAD_BYTES)
+            log.seek(offset)
+            if offset:
+                offset += len(log.readline())  # Skip the partial first line
+            first = offset
+            events, offset = self._read(log, offset)
+            self.deliver(events, live=False, floor=first)
+            self._tail_pid = os.getpid()
+            threading.Thread(target=self._tail, args=(log, offset), name='order-events-tail', daemon=True).start()
+
+    def _read(self, log, offset):
+        events = []
+        for line in iter(log.readline, b''):
+            if not line.endswith(b'\n'):
+                log.seek(offset)  # Half-written line, read it again next time
+                break
+            record = json.loads(line)
+            events.append(Event(offset, record['shop_id'], record['type'], record['data']))
+            offset += len(line)
+        return events, offset
+
+    def _tail(self, log, offset):
+        while True:
+            time.sleep(FILE_BUS_POLL_SECONDS)
+            events, offset = self._read(log, offset)
+            if events:
+                self.deliver(events)
+
+
+class Subscription:
+    def __init__(self, shop_id, queue_size):
+        self.shop_id = shop_id
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+
+class OrderEventBroker:
+    def __init__(self):
+        self.configure({})
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def configure(self, config):
+        directory = config.get('ORDER_EVENTS_DIR')
+        self.bus = FileBus(directory) if directory else LocalBus()
+        self.bus.deliver = self._deliver
+        self.backlog_size = int(config.get('ORDER_EVENTS_BACKLOG', 1000))
+        self.queue_size = int(config.get('ORDER_EVENTS_QUEUE_SIZE', 256))
+        self.max_streams = int(config.get('ORDER_EVENTS_MAX_STREAMS', 100))
+        self.heartbeat = float(config.get('ORDER_EVENTS_HEARTBEAT', 15))
+        self.stream_seconds = float(config.get('ORDER_EVENTS_STREAM_SECONDS', 300))
+        self._reset_after_fork()
+
+    def _reset_after_fork(self):
+        self.bus.reset()
+        self._lock = threading.Lock()
+        self._backlog = collections.deque(maxlen=self.backlog_size)
+        self._evicted_through = 0  # Highest sequence no longer in the backlog
+        self._subscribers = set()
+
+    def publish(self, events):
+        """Publish [(shop_id, type, data)]; call after the commit that made them true"""
+        if not events:
+            return
+        for _, type, _ in events:
+            metrics.inc('minimart_order_events_published_total', {'type': type})
+        self.bus.publish([(shop_id, type, json.dumps(data, default=str)) for shop_id, type, data in events])
+
+    def _deliver(self, events, live=True, floor=0):
+        with self._lock:
+            self._evicted_through = max(self._evicted_through, floor)
+            for event in events:
+                if len(self._backlog) == self._backlog.maxlen:
+                    self._evicted_through = self._backlog[0].seq
+                self._backlog.append(event)
+                if not live:
+                    continue
+                for subscription in self._subscribers:
+                    if subscription.shop_id == event.shop_id:
+                        subscription.offer(event)
+
+    def event_id(self, seq):
+        return f"{self.bus.epoch}-{seq}"
+
+    def subscribe(self, shop_id, last_event_id=None):
+        """
+        (subscription, replay) where replay is the backlog events after
+        last_event_id, or None if they cannot be replayed and the client
+        has to reset.
+        """
+        self.bus.start()
+        subscription = Subscription(shop_id, self.queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_streams:
+                raise TooManyStreams()
+            self._subscribers.add(subscription)
+            replay = []
+            if last_event_id:
+                epoch, _, seq = last_event_id.rpartition('-')
+                if epoch != self.bus.epoch or not seq.isdigit() or int(seq) < self._evicted_through:
+                    replay = None
+                else:
+                    replay = [e for e in self._backlog if e.seq > int(seq) and e.shop_id == shop_id]
+        return subscription, replay
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def latest_seq(self):
+        with self._lock:
+            return self._backlog[-1].seq if self._backlog else self._evicted_through
+
+    def stream(self, subscription, replay):
+        """The text/event-stream body for one subscription"""
+        def message(event):
+            return f"id: {self.event_id(event.seq)}\nevent: {event.type}\ndata: {event.data}\n\n"
+
+        deadline = time.monotonic() + self.stream_seconds
+        try:
+            yield f"retry: 3000\n: shop {subscription.shop_id}\n\n"
+            if replay is None:
+                yield f"id: {self.event_id(self.latest_seq())}\nevent: reset\ndata: {{}}\n\n"
+            else:
+                for event in replay:
+                    yield message(event)
+            while time.monotonic() < deadline:
+                if subscription.overflowed:
+                    # Client is behind; it reconnects and resumes from its Last-Event-ID
+                    metrics.inc('minimart_order_event_streams_dropped_total')
+                    return
+                try:
+                    event = subscription.queue.get(timeout=min(self.heartbeat, max(deadline - time.monotonic(), 0.01)))
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield message(event)
+        finally:
+            self.unsubscribe(subscription)
+
+
+order_events = OrderEventBroker()
+
+
+def init_order_events(app):
+    order_events.configure(app.config)
+    metrics.register_collector(lambda: [('minimart_order_event_streams', None, len(order_events._subscribers))])
@@ -0,0 +1,207 @@
+# backend/pricing.py
+"""
+What a cart costs: the one place that knows how offers, product discounts and
+the COD fee add up. Cart quotes (POST /api/pricing/quote), the checkout
+bootstrap, place_order and the unit_price stored on each order line (which the
+analytics report) all come from quote().
+
+Shop owners define offers (the offers table): a percentage or a flat amount
+off each unit, or buy X get Y free, on one product, one category of their shop
+or the whole shop, optionally only between starts_at and ends_at. A product's
+discount_percentage counts as a percentage offer on that product. Offers do
+not stack: each cart line gets the one that saves the customer the most.
+
+The offers running right now are compiled into a PriceBook, dicts keyed by
+product id, (shop id, category) and shop id, so pricing a line is three
+lookups however many offers exist. The book is recompiled from the table every
+PRICING_REFRESH_SECONDS (default 30), as soon as an offer starts or ends, and
+at once on the worker where an offer is saved; other workers pick saved
+offers up within the refresh interval.
+"""
+import math
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from metrics import metrics
+
+COD_FEE = 40 # ₹40 added to Cash on Delivery orders
+KINDS = ('percentage', 'flat', 'buy_x_get_y')
+DEFAULT_CATEGORY = 'Vegetables' # What products without a category are shown as
+
+Offer = namedtuple('Offer', 'id name kind value buy_quantity free_quantity')
+
+
+class InvalidOffer(ValueError):
+    pass
+
+
+def saving(offer, price, quantity):
+    """Amount `offer` takes off `quantity` units at `price`"""
+    if offer.kind == 'percentage':
+        return price * quantity * min(offer.value, 100) / 100
+    if offer.kind == 'flat':
+        return min(offer.value, price) * quantity
+    return price * (quantity // (offer.buy_quantity + offer.free_quantity) * offer.free_quantity)
+
+
+def compile_offers(rows, now):
+    """
+    ((by product, by (shop, category), by shop), valid until) from offer rows.
+    Only offers running at `now` are kept; the book is valid until the next
+    starts_at or ends_at after `now` (None if there is none).
+    """
+    by_product, by_category, by_shop = {}, {}, {}
+    valid_until = None
+    for row in rows:
+        for boundary in (row.starts_at, row.ends_at):
+            if boundary is not None and boundary > now and (valid_until is None or boundary < valid_until):
+                valid_until = boundary
+        if (row.starts_at is not None and row.starts_at > now) or (row.ends_at is not None and row.ends_at <= now):
+            continue
+        offer = Offer(row.id, row.name, row.kind, row.value, row.buy_quantity, row.free_quantity)
+        if row.product_id is not None:
+            by_product.setdefault(row.product_id, []).append(offer)
+        elif row.category:
+            by_category.setdefault((row.shop_id, row.category.lower()), []).append(offer)
+        else:
+            by_shop.setdefault(row.shop_id, []).append(offer)
+    freeze = lambda index: {key: tuple(offers) for key, offers in index.items()}
+    return (freeze(by_product), freeze(by_category), freeze(by_shop)), valid_until
+
+
+class PriceBook:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.max_age = 30.0
+        self._compiled = None
+        self._built_at = 0.0
+        self._valid_until = None
+
+    def invalidate(self):
+        self._built_at = 0.0
+
+    def _stale(self, now):
+        return (self._compiled is None or time.monotonic() - self._built_at > self.max_age or
+                (self._valid_until is not None and now >= self._valid_until))
+
+    def refresh(self, load, now=None):
+        """Recompile from `load()` -> offer rows when stale; one caller compiles, others keep the old book"""
+        now = now or datetime.utcnow()
+        stale = self._stale(now)
+        metrics.cache_lookup('price_book', hit=not stale)
+        if stale and self._lock.acquire(blocking=self._compiled is None):
+            try:
+                if self._stale(now):
+                    self._compiled, self._valid_until = compile_offers(load(), now)
+                    self._built_at = time.monotonic()
+            finally:
+                self._lock.release()
+
+    def best_offer(self, product, quantity):
+        """(offer, saving) of the offer saving most on this line, (None, 0) if none applies"""
+        by_product, by_category, by_shop = self._compiled or ({}, {}, {})
+        category = (product.category or DEFAULT_CATEGORY).lower()
+        candidates = (by_product.get(product.id, ()) + by_category.get((product.shop_id, category), ()) +
+                      by_shop.get(product.shop_id, ()))
+        if product.discount_percentage and product.discount_percentage > 0:
+            candidates += (Offer(None, f"{product.discount_percentage:g}% off", 'percentage',
+                                 product.discount_percentage, None, None),)
+        best, best_saving = None, 0.0
+        for offer in candidates:
+            amount = saving(offer, product.price, quantity)
+            if amount > best_saving:
+                best, best_saving = offer, amount
+        return best, best_saving
+
+
+def quote(book, lines, payment_method=None):
+    """Price [(product, quantity)] in one pass: each line with its offer applied, and the cart totals"""
+    priced = []
+    for product, quantity in lines:
+        offer, discount = book.best_offer(product, quantity)
+        subtotal = product.price * quantity
+        total = round(subtotal - discount, 2)
+        priced.append({
+            'product_id': product.id,
+            'quantity': quantity,
+            'price': product.price,
+            'unit_price': total / quantity,
+            'subtotal': round(subtotal, 2),
+            'discount': round(discount, 2),
+            'total': total,
+            'offer': {'id': offer.id, 'name': offer.name, 'kind': offer.kind} if offer else None,
+        })
+    cod_fee = COD_FEE if payment_method == 'cod' else 0
+    total = sum(line['total'] for line in priced)
+    return {
+        'lines': priced,
+        'subtotal': round(sum(line['subtotal'] for line in priced), 2),
+        'discount': round(sum(line['discount'] for line in priced), 2),
+        'cod_fee': cod_fee,
+        'total': round(total + cod_fee, 2),
+    }
+
+
+def _parse_time(value, name):
+    if value in (None, ''):
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise InvalidOffer(f"{name} must be an ISO 8601 date/time")
+    # Stored as naive UTC, like every other timestamp
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+def parse_offer(data):
+    """Offer column values from a request body; InvalidOffer says what is wrong"""
+    name = data.get('name') or ''
+    if not isinstance(name, str) or not name.strip():
+        raise InvalidOffer("name is required")
+    name = name.strip()
+    kind = data.get('kind')
+    if kind not in KINDS:
+        raise InvalidOffer(f"kind must be one of: {', '.join(KINDS)}")
+    values = {'name': name[:100], 'kind': kind, 'value': 0.0, 'buy_quantity': None, 'free_quantity': None}
+    if kind == 'buy_x_get_y':
+        try:
+            values['buy_quantity'], values['free_quantity'] = int(data.get('buy_quantity')), int(data.get('free_quantity'))
+        except (TypeError, ValueError):
+            raise InvalidOffer("buy_quantity and free_quantity are required for buy_x_get_y offers")
+        if values['buy_quantity'] < 1 or values['free_quantity'] < 1:
+            raise InvalidOffer("buy_quantity and free_quantity must be at least 1")
+    else:
+        try:
+            values['value'] = float(data.get('value'))
+        except (TypeError, ValueError):
+            raise InvalidOffer("value is required: the percentage or amount off each unit")
+        if not math.isfinite(values['value']) or values['value'] <= 0 or (kind == 'percentage' and values['value'] > 100):
+            raise InvalidOffer("value must be a number above 0 (and at most 100 for percentage offers)")
+
+    product_id, category = data.get('product_id'), data.get('category')
+    if category is not None and not isinstance(category, str):
+        raise InvalidOffer("category must be a category name")
+    category = (category or '').strip() or None
+    if product_id is not None and category:
+        raise InvalidOffer("An offer applies to a product or a category, not both")
+    if product_id is not None and (not isinstance(product_id, int) or isinstance(product_id, bool)):
+        raise InvalidOffer("product_id must be an integer")
+    values.update(product_id=product_id, category=category)
+
+    values['starts_at'] = _parse_time(data.get('starts_at'), 'starts_at')
+    values['ends_at'] = _parse_time(data.get('ends_at'), 'ends_at')
+    if values['starts_at'] and values['ends_at'] and values['ends_at'] <= values['starts_at']:
+        raise InvalidOffer("ends_at must be after starts_at")
+    values['active'] = bool(data.get('active', True))
+    return values
+
+
+price_book = PriceBook()
+
+
+def init_pricing(app):
+    price_book.max_age = float(app.config.get('PRICING_REFRESH_SECONDS', 30))
@@ -0,0 +1,226 @@
+# backend/recommendations.py
+"""
+"Frequently bought together" products from a co-occurrence matrix of order lines.
+
+product_pair_counts is a sparse, symmetric product x product matrix: how many
+orders contain both products, with the diagonal holding each product's own
+order count. Only products whose shops are in the same city are paired, so
+every recommendation can be bought where the product is. related_products
+keeps each product's top partners keyed (product_id, rank), which is all
+GET /api/products/<id>/related reads.
+
+A product's ranking depends on its own row only (partners by orders together,
+confidence = orders together / orders with the product), so refresh() re-ranks
+just the products that appeared in the new orders. It reads orders after the
+job_watermarks row 'recommendations' and moves the watermark in the same
+transaction as the counts, so a run that dies adds nothing and two runs
+cannot both count an order. Orders newer than settle_seconds are left for the
+next run, so one that commits after a later order is not skipped. Cancelled
+orders count: they still show what customers buy together.
+
+    python recommendations.py --refresh        # from cron, e.g. every 10 minutes
+    python recommendations.py --rebuild        # recount everything from order_items
+"""
+import itertools
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import bindparam, select
+
+WATERMARK = 'recommendations'
+TOP_K = 20
+MIN_ORDERS = 2   # Partners bought together fewer times than this are noise
+ID_BITS = 32     # Pair codes are product_id << ID_BITS | other_product_id
+CHUNK = 500
+
+
+def _tables(db):
+    tables = db.metadata.tables
+    return (tables['product_pair_counts'], tables['related_products'], tables['job_watermarks'],
+            tables['orders'], tables['order_items'], tables['shops'],
+            tables['orders_archive'], tables['order_items_archive'])
+
+
+def _watermark(db):
+    watermarks = _tables(db)[2]
+    last = db.session.execute(select(watermarks.c.last_order_id).
+                              where(watermarks.c.name == WATERMARK)).scalar()
+    if last is None:
+        db.session.execute(watermarks.insert().values(name=WATERMARK, last_order_id=0, updated_at=datetime.utcnow()))
+        db.session.commit()
+        last = 0
+    return last
+
+
+def _advance_watermark(db, previous, last):
+    """Move the watermark from `previous` to `last`; False if another run moved it first"""
+    watermarks = _tables(db)[2]
+    moved = db.session.execute(watermarks.update().
+                               where(watermarks.c.name == WATERMARK, watermarks.c.last_order_id == previous).
+                               values(last_order_id=last, updated_at=datetime.utcnow())).rowcount
+    return moved == 1
+
+
+def order_batches(db, after_order_id, cutoff, batch_orders, archive=False):
+    """
+    Yield (last order id, [(order_id, product_id, city)]) for settled orders
+    after `after_order_id`, from the archive tables if `archive`
+    """
+    _, _, _, orders, order_items, shops, orders_archive, order_items_archive = _tables(db)
+    if archive:
+        orders, order_items = orders_archive, order_items_archive
+    while True:
+        batch = db.session.execute(select(orders.c.id, orders.c.created_at).
+                                   where(orders.c.id > after_order_id).
+                                   order_by(orders.c.id).limit(batch_orders)).all()
+        settled = list(itertools.takewhile(lambda order: order.created_at <= cutoff, batch))
+        if not settled:
+            return
+        after_order_id = settled[-1].id
+        lines = db.session.execute(
+            select(order_items.c.order_id, order_items.c.product_id, shops.c.city).
+            join(shops, shops.c.id == order_items.c.shop_id).
+            where(order_items.c.order_id.between(settled[0].id, after_order_id))).all()
+        yield after_order_id, lines
+        if len(settled) < len(batch) or len(batch) < batch_orders:
+            return
+
+
+def count_pairs(lines):
+    """(pair codes, counts) of the co-occurrences in `lines`, both directions and the diagonal"""
+    baskets = {}
+    for order_id, product_id, city in lines:
+        baskets.setdefault((order_id, city), set()).add(product_id)
+    codes = []
+    for basket in baskets.values():
+        for a in basket:
+            for b in basket:
+                codes.append(a << ID_BITS | b)
+    return np.unique(np.array(codes, dtype=np.int64), return_counts=True)
+
+
+def merge_counts(codes, counts, more_codes, more_counts):
+    merged, inverse = np.unique(np.concatenate([codes, more_codes]), return_inverse=True)
+    return merged, np.bincount(inverse, weights=np.concatenate([counts, more_counts])).astype(np.int64)
+
+
+def rank(codes, counts, top_k=TOP_K, min_orders=MIN_ORDERS):
+    """related_products rows for every product that has a diagonal entry in (codes, counts)"""
+    products, others = codes >> ID_BITS, codes & ((1 << ID_BITS) - 1)
+    diagonal = products == others
+    own_orders = dict(zip(products[diagonal].tolist(), counts[diagonal].tolist()))
+    keep = ~diagonal & (counts >= min_orders)
+    products, others, counts = products[keep], others[keep], counts[keep]
+    order = np.lexsort((others, -counts, products))  # By product, most orders together first
+    products, others, counts = products[order], others[order], counts[order]
+    starts = np.flatnonzero(np.r_[True, products[1:] != products[:-1]]) if len(products) else np.zeros(0, np.int64)
+    ranks = np.arange(len(products)) - np.repeat(starts, np.diff(np.r_[starts, len(products)]))
+    keep = ranks < top_k
+    return [{'product_id': p, 'rank': r, 'related_product_id': o, 'orders': c, 'confidence': round(c / own_orders[p], 4)}
+            for p, r, o, c in zip(products[keep].tolist(), ranks[keep].tolist(),
+                                  others[keep].tolist(), counts[keep].tolist())]
+
+
+def _insert(db, table, rows):
+    for start in range(0, len(rows), 5000):
+        db.session.execute(table.insert(), rows[start:start + 5000])
+
+
+def _apply(db, codes, counts, top_k, min_orders):
+    """Add pair counts to the matrix and re-rank the products in them"""
+    pair_counts, related = _tables(db)[:2]
+    touched = np.unique(codes >> ID_BITS).tolist()
+    update = pair_counts.update().where(pair_counts.c.product_id == bindparam('p'),
+                                        pair_counts.c.other_product_id == bindparam('o')).\
+        values(orders=bindparam('n'))
+    for start in range(0, len(touched), CHUNK):
+        chunk = touched[start:start + CHUNK]
+        existing = db.session.execute(select(pair_counts.c.product_id, pair_counts.c.other_product_id,
+                                             pair_counts.c.orders).
+                                      where(pair_counts.c.product_id.in_(chunk))).all()
+        old_codes = np.array([p << ID_BITS | o for p, o, _ in existing], dtype=np.int64)
+        old_counts = np.array([n for _, _, n in existing], dtype=np.int64)
+        in_chunk = np.isin(codes >> ID_BITS, chunk)
+        new_codes, new_counts = codes[in_chunk], counts[in_chunk]
+
+        present = np.isin(new_codes, old_codes)
+        merged_codes, merged_counts = merge_counts(old_codes, old_counts, new_codes, new_counts)
+        changed = np.isin(merged_codes, new_codes[present])
+        if changed.any():
+            db.session.execute(update, [{'p': c >> ID_BITS, 'o': c & ((1 << ID_BITS) - 1), 'n': n} for c, n in
+                                        zip(merged_codes[changed].tolist(), merged_counts[changed].tolist())])
+        _insert(db, pair_counts, [{'product_id': c >> ID_BITS, 'other_product_id': c & ((1 << ID_BITS) - 1),
+                                   'orders': n}
+                                  for c, n in zip(new_codes[~present].tolist(), new_counts[~present].tolist())])
+        db.session.execute(related.delete().where(related.c.product_id.in_(chunk)))
+        _insert(db, related, rank(merged_codes, merged_counts, top_k, min_orders))
+
+
+def refresh(db, top_k=TOP_K, min_orders=MIN_ORDERS, settle_seconds=60, batch_orders=5000, log=print):
+    """Count orders placed since the last run; returns the number of orders read"""
+    cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+    previous = _watermark(db)
+    read = 0
+    for last, lines in order_batches(db, previous, cutoff, batch_orders):
+        codes, counts = count_pairs(lines)
+        _apply(db, codes, counts, top_k, min_orders)
+        if not _advance_watermark(db, previous, last):
+            db.session.rollback()
+            log("Another refresh counted these orders first; stopping")
+            break
+        db.session.commit()
+        read += len({line.order_id for line in lines})
+        previous = last
+        log(f"Counted orders up to {last}")
+    return read
+
+
+def rebuild(db, top_k=TOP_K, min_orders=MIN_ORDERS, settle_seconds=60, batch_orders=20000, log=print):
+    """Recount the whole matrix from order_items in memory and replace both tables"""
+    pair_counts, related = _tables(db)[:2]
+    cutoff = datetime.utcnow() - timedelta(seconds=settle_seconds)
+    previous = _watermark(db)
+    codes, counts = np.zeros(0, np.int64), np.zeros(0, np.int64)
+    last = 0
+    # Archived orders (see order_archive.py) first; refresh() never sees them again
+    for archive in (True, False):
+        for read, lines in order_batches(db, 0, cutoff, batch_orders, archive):
+            codes, counts = merge_counts(codes, counts, *count_pairs(lines))
+            last = max(last, read)
+            log(f"Read {'archived ' if archive else ''}orders up to {read} ({len(codes)} pairs)")
+    db.session.execute(pair_counts.delete())
+    db.session.execute(related.delete())
+    mask = (1 << ID_BITS) - 1
+    _insert(db, pair_counts, [{'product_id': c >> ID_BITS, 'other_product_id': c & mask, 'orders': n}
+                              for c, n in zip(codes.tolist(), counts.tolist())])
+    _insert(db, related, rank(codes, counts, top_k, min_orders))
+    if not _advance_watermark(db, previous, last):
+        db.session.rollback()
+        raise RuntimeError("A refresh ran during the rebuild; run the rebuild again")
+    db.session.commit()
+    return len(codes)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Maintain the frequently-bought-together tables')
+    parser.add_argument('--refresh', action='store_true', help='count orders placed since the last run')
+    parser.add_argument('--rebuild', action='store_true', help='recount every order from scratch')
+    parser.add_argument('--top-k', type=int, default=TOP_K, help=f'partners kept per product (default {TOP_K})')
+    parser.add_argument('--min-orders', type=int, default=MIN_ORDERS,
+                        help=f'orders together before a partner is recommended (default {MIN_ORDERS})')
+    parser.add_argument('--settle-seconds', type=float, default=60,
+                        help='leave orders younger than this for the next run (default 60)')
+    args = parser.parse_args()
+    if not (args.refresh or args.rebuild):
+        parser.error('nothing to do; pass --refresh or --rebuild')
+
+    from app import app, db
+
+    with app.app_context():
+        if args.rebuild:
+            pairs = rebuild(db, args.top_k, args.min_orders, args.settle_seconds)
+            print(f"Rebuilt the matrix: {pairs} product pairs")
+        else:
+            print(f"Counted {refresh(db, args.top_k, args.min_orders, args.settle_seconds)} new order(s)")
@@ -0,0 +1,78 @@
+# backend/response_cache.py
+"""
+Short-lived caches of serialized responses: public catalog listings and
+customer analytics.
+
+Entries are keyed by route, route arguments and the ?fields= selection, so
+every preset (card, detail, admin) of a listing is cached on its own and the
+small card payloads do not evict or wait for the full ones. The cached value
+is the encoded JSON body, so a hit skips the query and the serialization.
+
+An entry lives CATALOG_CACHE_SECONDS (default 5, 0 turns the cache off) and
+the whole cache is dropped whenever this process adds, changes or deletes a
+product; other workers catch up when their entries expire. Stock shown on a
+cached listing can therefore be that many seconds old; place_order always
+checks live stock.
+
+Entries can also carry a version that lookup() must match, for caches whose
+freshness can be checked with a query much cheaper than the one cached (the
+customer analytics cache keys by customer and versions by a small summary
+of their orders).
+"""
+import threading
+import time
+
+from metrics import metrics
+
+
+class ResponseCache:
+    def __init__(self, name, max_age=5.0, max_entries=1024):
+        self.name = name
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (stored_at, version, payload)
+        self._generation = 0
+
+    def lookup(self, key, version=None):
+        """
+        (payload, generation): the cached payload or None, and the generation
+        to hand back to store() so a listing built before an invalidation is
+        not stored after it. An entry stored with another version is a miss.
+        """
+        if self.max_age <= 0:
+            return None, self._generation
+        entry = self._entries.get(key)
+        hit = entry is not None and time.monotonic() - entry[0] <= self.max_age and entry[1] == version
+        metrics.cache_lookup(self.name, hit=hit)
+        return (entry[2] if hit else None), self._generation
+
+    def store(self, key, payload, generation, version=None):
+        if self.max_age <= 0:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            if len(self._entries) >= self.max_entries and key not in self._entries:
+                # Oldest insertion first; the TTL keeps this from mattering much
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (time.monotonic(), version, payload)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries = {}
+
+    def discard(self, key):
+        """Drop one entry and keep the rest"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+catalog_cache = ResponseCache('catalog')
+customer_analytics_cache = ResponseCache('customer_analytics', max_age=600, max_entries=10000)
+
+
+def init_catalog_cache(app):
+    catalog_cache.max_age = float(app.config.get('CATALOG_CACHE_SECONDS', 5))
+    customer_analytics_cache.max_age = float(app.config.get('CUSTOMER_ANALYTICS_CACHE_SECONDS', 600))
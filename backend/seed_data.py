@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+# backend/seed_data.py
+"""
+Deterministic synthetic data generator for users, shops, products, addresses,
+orders and order_items.
+
+The data is skewed the way production is: a few large cities hold most shops
+and customers, product popularity within a city follows a Zipf distribution,
+and order timestamps spread over several years with volume growing over time
+and an evening peak. Everything is derived from --seed and --end-date, so the
+same arguments always produce the same rows.
+
+Rows are generated in chunks and written with DBAPI executemany, so memory stays
+flat and ~10M order_items load in minutes on MySQL.
+
+Usage:
+    python seed_data.py --database-url sqlite:////tmp/mart.db --reset --orders 3000000
+    python seed_data.py --reset --explain                 # load, then EXPLAIN the hot queries
+
+The benchmark suite calls generate() directly.
+"""
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+CITY_NAMES = [
+    'Mumbai', 'Delhi', 'Bengaluru', 'Hyderabad', 'Chennai', 'Kolkata', 'Pune', 'Ahmedabad', 'Jaipur', 'Surat',
+    'Lucknow', 'Kanpur', 'Nagpur', 'Indore', 'Bhopal', 'Visakhapatnam', 'Patna', 'Vadodara', 'Ludhiana', 'Agra',
+    'Nashik', 'Rajkot', 'Varanasi', 'Srinagar', 'Amritsar', 'Ranchi', 'Coimbatore', 'Vijayawada', 'Madurai', 'Guntur',
+]
+CATEGORIES = ['Vegetables', 'Fruits', 'Dairy', 'Bakery', 'Beverages', 'Snacks', 'Grains', 'Spices']
+CATEGORY_WEIGHTS = [30, 25, 12, 8, 8, 7, 6, 4]
+UNITS = {'Vegetables': 'kg', 'Fruits': 'kg', 'Dairy': 'litre', 'Bakery': 'pack', 'Beverages': 'bottle',
+         'Snacks': 'pack', 'Grains': 'kg', 'Spices': 'g'}
+# Relative order volume per hour of day: quiet nights, a lunch bump and an evening peak
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 6, 7, 7, 8, 9, 10, 9, 7, 6, 7, 9, 12, 14, 13, 10, 6, 3]
+PAYMENT_METHODS = ['cod', 'upi', 'card']
+COD_FEE = 40
+
+
+class Config:
+    def __init__(self, cities=20, shops=400, products_per_shop=60, customers=50_000, orders=300_000,
+                 max_lines=5, years=3, zipf_s=1.1, city_zipf_s=0.9, stock=None, chunk_size=20_000, seed=42, end=None):
+        self.cities = cities
+        self.shops = shops
+        self.products_per_shop = products_per_shop
+        self.customers = customers
+        self.orders = orders
+        self.max_lines = max_lines
+        self.years = years
+        self.zipf_s = zipf_s
+        self.city_zipf_s = city_zipf_s
+        self.stock = stock  # Fixed stock for every product, or None for a random 0-500
+        self.chunk_size = chunk_size
+        self.seed = seed
+        # History ends here; defaults to today's midnight so reruns on the same day match row for row
+        self.end = end or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class Dataset:
+    """What was generated, in a shape callers like the benchmark can drive requests from"""
+
+    def __init__(self):
+        self.cities = []
+        self.admins = []           # {'id', 'email', 'city', 'shop_id'}
+        self.shops = []            # {'id', 'name', 'city', 'owner_id', 'latitude', 'longitude'}
+        self.customers = []        # {'id', 'email', 'city', 'address_id'}
+        self.products_by_city = {} # city -> [{'id', 'shop_id', 'price'}], most popular first
+        self.order_count = 0
+        self.order_item_count = 0
+
+
+def zipf_cum_weights(n, s):
+    total = 0.0
+    cumulative = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** s
+        cumulative.append(total)
+    return cumulative
+
+
+class Loader:
+    """Chunked executemany over a raw DBAPI connection"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.placeholder = '?' if engine.dialect.paramstyle == 'qmark' else '%s'
+        self.connection = engine.raw_connection()
+        # SQLAlchemy stores SQLite datetimes as text in this format; MySQL drivers take datetime objects
+        self.timestamp = (lambda dt: dt.strftime('%Y-%m-%d %H:%M:%S.%f')) if engine.dialect.name == 'sqlite' else (lambda dt: dt)
+
+    def insert(self, table, columns, rows):
+        if not rows:
+            return
+        sql = (f"INSERT INTO {table} ({', '.join(columns)}) "
+               f"VALUES ({', '.join([self.placeholder] * len(columns))})")
+        cursor = self.connection.cursor()
+        cursor.executemany(sql, rows)
+        cursor.close()
+        self.connection.commit()
+
+    def execute_many(self, sql, rows):
+        cursor = self.connection.cursor()
+        cursor.executemany(sql.replace('?', self.placeholder), rows)
+        cursor.close()
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+def generate(engine, config, password_hash, log=print):
+    """Fill the (empty) schema behind `engine` and return a Dataset describing it"""
+    rng = random.Random(config.seed)
+    loader = Loader(engine)
+    data = Dataset()
+    started = time.perf_counter()
+
+    now = config.end
+    span_seconds = config.years * 365 * 86400
+    origin = now - timedelta(seconds=span_seconds)
+
+    # Cities of different sizes: shops and customers are spread by a Zipf weight per city
+    data.cities = [CITY_NAMES[i] if i < len(CITY_NAMES) else f'City {i + 1}' for i in range(config.cities)]
+    city_weights = zipf_cum_weights(config.cities, config.city_zipf_s)
+    # Locations come from their own generator so adding them left the rest of the data unchanged
+    geo_rng = random.Random(config.seed + 1)
+    city_centres = {city: (geo_rng.uniform(12, 30), geo_rng.uniform(72, 88)) for city in data.cities}
+
+    def near(city, spread_degrees):
+        lat, lng = city_centres[city]
+        return round(lat + geo_rng.gauss(0, spread_degrees), 6), round(lng + geo_rng.gauss(0, spread_degrees), 6)
+
+    # --- Admins, shops, products ---
+    user_rows, shop_rows, product_rows, opening_rows = [], [], [], []
+    product_ids_by_city = {city: [] for city in data.cities}
+    product_price = {}
+    # Every city gets at least one shop so every customer can order somewhere
+    shop_cities = data.cities + rng.choices(data.cities, cum_weights=city_weights, k=max(0, config.shops - config.cities))
+    for shop_id, city in enumerate(shop_cities, start=1):
+        email = f'owner{shop_id}@seed.local'
+        user_rows.append((shop_id, f'Owner {shop_id}', email, password_hash, 'admin', city))
+        shop_rows.append((shop_id, f'{city} Fresh Mart {shop_id}', city, shop_id, *near(city, 0.05),
+                          loader.timestamp(origin)))
+        data.admins.append({'id': shop_id, 'email': email, 'city': city, 'shop_id': shop_id})
+        data.shops.append({'id': shop_id, 'name': shop_rows[-1][1], 'city': city, 'owner_id': shop_id,
+                           'latitude': shop_rows[-1][4], 'longitude': shop_rows[-1][5]})
+        for n in range(config.products_per_shop):
+            product_id = len(product_rows) + 1
+            category = rng.choices(CATEGORIES, weights=CATEGORY_WEIGHTS)[0]
+            price = round(rng.uniform(10, 500), 2)
+            discount = rng.choice([0, 0, 0, 0, 5, 10, 15, 20])
+            stock = config.stock if config.stock is not None else rng.randint(0, 500)
+            product_rows.append((product_id, f'{category} item {shop_id}-{n}', price, '', shop_id, stock, category,
+                                 discount, rng.random() < 0.05, 'Fresh and locally sourced', UNITS[category], 0,
+                                 loader.timestamp(origin)))
+            # The ledger opens with the stock the product is loaded with (see inventory.py)
+            opening_rows.append((product_id, 'opening', stock, stock, loader.timestamp(origin)))
+            product_ids_by_city[city].append(product_id)
+            product_price[product_id] = (price, discount, shop_id)
+    admin_count = len(user_rows)
+
+    # --- Customers and their default address ---
+    address_rows = []
+    customer_city = {}
+    for n in range(config.customers):
+        user_id = admin_count + n + 1
+        city = rng.choices(data.cities, cum_weights=city_weights)[0]
+        email = f'customer{n}@seed.local'
+        user_rows.append((user_id, f'Customer {n}', email, password_hash, 'customer', city))
+        address_rows.append((n + 1, user_id, f'Customer {n}', f'Customer {n}', f'{rng.randint(1, 999)} Main Road', '',
+                             city, 'State', '500001', '500001', '9000000000', '9000000000', True,
+                             loader.timestamp(origin), *near(city, 0.08)))
+        customer_city[user_id] = (city, n + 1)
+        data.customers.append({'id': user_id, 'email': email, 'city': city, 'address_id': n + 1})
+
+    for rows, table, columns in (
+        (user_rows, 'users', ('id', 'name', 'email', 'password_hash', 'role', 'city')),
+        (shop_rows, 'shops', ('id', 'name', 'city', 'owner_id', 'latitude', 'longitude', 'updated_at')),
+        (product_rows, 'products', ('id', 'name', 'price', 'image_url', 'shop_id', 'quantity', 'category',
+                                    'discount_percentage', 'featured', 'description', 'unit', 'sold_count', 'updated_at')),
+        (address_rows, 'addresses', ('id', 'user_id', 'name', 'full_name', 'street_address', 'landmark', 'city', 'state',
+                                     'pincode', 'postal_code', 'phone', 'phone_number', 'is_default', 'created_at',
+                                     'latitude', 'longitude')),
+        (opening_rows, 'inventory_movements', ('product_id', 'kind', 'quantity', 'stock_delta', 'created_at')),
+    ):
+        for start in range(0, len(rows), config.chunk_size):
+            loader.insert(table, columns, rows[start:start + config.chunk_size])
+    log(f"Loaded {admin_count} shops, {len(product_rows)} products, {config.customers} customers "
+        f"in {time.perf_counter() - started:.1f}s")
+    del user_rows, shop_rows, product_rows, address_rows, opening_rows
+
+    # Zipf popularity within each city: a random permutation decides which product is rank 1
+    city_popularity = {}
+    for city, ids in product_ids_by_city.items():
+        ranked = ids[:]
+        rng.shuffle(ranked)
+        city_popularity[city] = (ranked, zipf_cum_weights(len(ranked), config.zipf_s))
+        data.products_by_city[city] = [{'id': pid, 'shop_id': product_price[pid][2], 'price': product_price[pid][0]}
+                                       for pid in ranked]
+    customer_ids = list(customer_city)
+
+    # --- Orders and order_items, streamed in chunks ---
+    hour_cum = list(itertools.accumulate(HOUR_WEIGHTS))
+    sold = {}
+    order_id = 0
+    for chunk_start in range(0, config.orders, config.chunk_size):
+        order_rows, item_rows = [], []
+        for i in range(chunk_start, min(config.orders, chunk_start + config.chunk_size)):
+            order_id += 1
+            customer_id = rng.choice(customer_ids)
+            city, address_id = customer_city[customer_id]
+            ranked, cum = city_popularity[city]
+            if not ranked:
+                continue
+
+            # Linear growth in volume: the i-th order's day follows the inverse CDF of t^2
+            day_offset = span_seconds * ((i + rng.random()) / config.orders) ** 0.5
+            day = origin + timedelta(seconds=day_offset)
+            hour = bisect.bisect_right(hour_cum, rng.random() * hour_cum[-1])
+            created_at = min(now, day.replace(hour=hour, minute=rng.randint(0, 59), second=rng.randint(0, 59)))
+            age_days = (now - created_at).days
+
+            if rng.random() < 0.05:
+                status = 'Cancelled'
+            elif age_days > 7:
+                status = 'Delivered'
+            else:
+                status = rng.choice(['Pending', 'Processing', 'Shipped', 'Delivered'])
+
+            line_count = min(len(ranked), rng.randint(1, config.max_lines))
+            chosen = set(rng.choices(ranked, cum_weights=cum, k=line_count))
+            total = 0.0
+            for product_id in chosen:
+                price, discount, shop_id = product_price[product_id]
+                quantity = rng.choices((1, 2, 3, 4), weights=(60, 25, 10, 5))[0]
+                unit_price = price * (1 - discount / 100)
+                total += unit_price * quantity
+                item_rows.append((order_id, product_id, quantity, shop_id, unit_price))
+                if status != 'Cancelled':
+                    sold[product_id] = sold.get(product_id, 0) + quantity
+            method = rng.choice(PAYMENT_METHODS)
+            if method == 'cod':
+                total += COD_FEE
+            order_rows.append((order_id, customer_id, address_id, loader.timestamp(created_at), round(total, 2), status,
+                               method, None))
+
+        loader.insert('orders', ('id', 'customer_id', 'address_id', 'created_at', 'total_amount', 'status',
+                                 'payment_method', 'payment_transaction_id'), order_rows)
+        loader.insert('order_items', ('order_id', 'product_id', 'quantity', 'shop_id', 'unit_price'), item_rows)
+        data.order_count += len(order_rows)
+        data.order_item_count += len(item_rows)
+        if chunk_start // config.chunk_size % 25 == 24:
+            log(f"  {data.order_count} orders / {data.order_item_count} items ({time.perf_counter() - started:.0f}s)")
+
+    sold_rows = [(count, product_id) for product_id, count in sold.items()]
+    for start in range(0, len(sold_rows), config.chunk_size):
+        loader.execute_many("UPDATE products SET sold_count = ? WHERE id = ?", sold_rows[start:start + config.chunk_size])
+    loader.close()
+
+    log(f"Loaded {data.order_count} orders and {data.order_item_count} order items "
+        f"in {time.perf_counter() - started:.1f}s")
+    return data
+
+
+def hot_queries(backend, data):
+    """The statements behind the busiest routes, with representative parameters"""
+    db, Product, Order, Shop, order_items = backend.db, backend.Product, backend.Order, backend.Shop, backend.order_items
+    city = data.cities[0]
+    shop_id = data.shops[0]['id']
+    customer_id = data.customers[0]['id']
+    city_shop_ids = [s['id'] for s in data.shops if s['city'] == city]
+    return {
+        'shops_in_city': backend.shops_in_city_query(city),
+        'catalog_by_city': backend.catalog_query().filter(Product.shop_id.in_(city_shop_ids)),
+        'products_by_shop': db.select(Product).filter_by(shop_id=shop_id),
+        'product_changes': backend.product_changes_query(datetime.utcnow() - timedelta(minutes=5), 0, city, 500),
+        'customer_orders': db.select(Order).filter_by(customer_id=customer_id).order_by(Order.created_at.desc()),
+        'shop_order_ids': db.select(order_items.c.order_id).filter(order_items.c.shop_id == shop_id).distinct(),
+        'order_items_for_order': db.select(order_items).filter(order_items.c.order_id == 1),
+        'recent_orders_window': db.select(Order).filter(Order.created_at >= datetime.utcnow() - timedelta(days=30)),
+    }
+
+
+def explain(backend, data, log=print):
+    """EXPLAIN each hot query against the loaded data"""
+    with backend.app.app_context():
+        engine = backend.db.engine
+        prefix = 'EXPLAIN QUERY PLAN' if engine.dialect.name == 'sqlite' else 'EXPLAIN'
+        with engine.connect() as conn:
+            for name, stmt in hot_queries(backend, data).items():
+                sql = str(stmt.compile(engine, compile_kwargs={'literal_binds': True}))
+                log(f"\n-- {name}\n{sql}")
+                for row in conn.exec_driver_sql(f'{prefix} {sql}'):
+                    log('   ' + ' | '.join(str(v) for v in row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--reset', action='store_true', help="Drop and recreate every table first (required)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--cities', type=int, default=20)
+    parser.add_argument('--shops', type=int, default=400)
+    parser.add_argument('--products-per-shop', type=int, default=60)
+    parser.add_argument('--customers', type=int, default=50_000)
+    parser.add_argument('--orders', type=int, default=300_000)
+    parser.add_argument('--max-lines', type=int, default=5, help="Most distinct products in one order")
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--zipf', type=float, default=1.1, help="Zipf exponent of product popularity")
+    parser.add_argument('--stock', type=int, help="Fixed stock per product instead of a random 0-500")
+    parser.add_argument('--chunk-size', type=int, default=20_000)
+    parser.add_argument('--end-date', type=lambda v: datetime.strptime(v, '%Y-%m-%d'),
+                        help="Last day of order history (YYYY-MM-DD); defaults to today")
+    parser.add_argument('--explain', action='store_true', help="EXPLAIN the hot queries after loading")
+    args = parser.parse_args()
+
+    if not args.reset:
+        parser.error("the generator assigns ids from 1 and needs empty tables; pass --reset to drop and recreate them")
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as backend
+
+    config = Config(cities=args.cities, shops=args.shops, products_per_shop=args.products_per_shop,
+                    customers=args.customers, orders=args.orders, max_lines=args.max_lines, years=args.years,
+                    zipf_s=args.zipf, stock=args.stock, chunk_size=args.chunk_size, seed=args.seed,
+                    end=args.end_date)
+    with backend.app.app_context():
+        backend.db.drop_all()
+        backend.db.create_all()
+        data = generate(backend.db.engine, config, backend.generate_password_hash('password'))
+
+    print("Every seeded account uses the password 'password'")
+    if args.explain:
+        explain(backend, data)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# backend/sharded_stock.py
+"""
+Sharded stock counters for products that sell in bursts (flash sales).
+
+Normally a checkout decrements products.quantity, so every order for the same
+product queues on that one row lock. With sharded stock turned on (per product,
+from update_product), the stock lives in STOCK_SHARDS rows of
+product_stock_shards instead and products.quantity stays at 0. A checkout takes
+its units from one randomly chosen shard with a guarded UPDATE, so concurrent
+checkouts mostly lock different rows; only when that shard runs short does it
+fall back to collecting the units from the other shards. The quantity shown to
+customers (Product.available_quantity) is the sum of the shards.
+
+All functions work inside the caller's db.session transaction.
+"""
+import random
+
+from sqlalchemy import bindparam, func
+
+_random = random.Random()
+
+
+def _shards(db):
+    return db.metadata.tables['product_stock_shards']
+
+
+def _split(quantity, shards):
+    base, extra = divmod(quantity, shards)
+    return [base + (1 if shard < extra else 0) for shard in range(shards)]
+
+
+def enable(db, product, shards):
+    """Move the product's quantity into `shards` counter rows"""
+    table = _shards(db)
+    db.session.execute(table.delete().where(table.c.product_id == product.id))
+    db.session.execute(table.insert(), [{'product_id': product.id, 'shard': shard, 'quantity': quantity}
+                                        for shard, quantity in enumerate(_split(product.quantity or 0, shards))])
+    product.quantity = 0
+    product.sharded_stock = True
+
+
+def disable(db, product):
+    """Fold the shards back into products.quantity"""
+    product.quantity = total(db, product.id, lock=True)
+    table = _shards(db)
+    db.session.execute(table.delete().where(table.c.product_id == product.id))
+    product.sharded_stock = False
+
+
+def set_quantity(db, product, quantity):
+    """Replace a sharded product's stock, spread evenly over its existing shards"""
+    table = _shards(db)
+    shard_ids = db.session.execute(db.select(table.c.shard).where(table.c.product_id == product.id).
+                                   order_by(table.c.shard).with_for_update()).scalars().all()
+    if not shard_ids:
+        raise ValueError(f"Product {product.id} has no stock shards")
+    db.session.execute(table.update().where(table.c.product_id == product.id, table.c.shard == bindparam('shard_id')).
+                       values(quantity=bindparam('new_quantity')),
+                       [{'shard_id': shard, 'new_quantity': new_quantity}
+                        for shard, new_quantity in zip(shard_ids, _split(quantity, len(shard_ids)))])
+
+
+def total(db, product_id, lock=False):
+    table = _shards(db)
+    if lock:
+        # Lock the rows themselves (aggregates cannot be locked) and add them up here
+        query = db.select(table.c.quantity).where(table.c.product_id == product_id).with_for_update()
+        return sum(db.session.execute(query).scalars())
+    query = db.select(func.coalesce(func.sum(table.c.quantity), 0)).where(table.c.product_id == product_id)
+    return db.session.execute(query).scalar()
+
+
+def decrement(db, product_id, quantity):
+    """
+    Take `quantity` units from the product's shards. Returns False when they
+    hold too little between them; units taken by then go back with the caller's rollback.
+    """
+    table = _shards(db)
+    shards = [tuple(row) for row in db.session.execute(db.select(table.c.shard, table.c.quantity).
+                                                        where(table.c.product_id == product_id))]
+    if sum(available for _, available in shards) < quantity:
+        return False
+
+    # Fast path: the whole line from one random shard that (as last read) holds enough
+    candidates = [shard for shard, available in shards if available >= quantity]
+    if candidates and _take(db, table, product_id, _random.choice(candidates), quantity):
+        return True
+
+    # Fallback: collect the units from the shards in random order
+    _random.shuffle(shards)
+    remaining = quantity
+    for shard, available in shards:
+        take = min(available, remaining)
+        if take > 0 and _take(db, table, product_id, shard, take):
+            remaining -= take
+            if remaining == 0:
+                return True
+    return False
+
+
+def restock(db, product_id, quantity):
+    """Return units to a random shard, e.g. when an order is cancelled"""
+    table = _shards(db)
+    shard_ids = db.session.execute(db.select(table.c.shard).where(table.c.product_id == product_id)).scalars().all()
+    if not shard_ids:
+        return False
+    db.session.execute(table.update().
+                       where(table.c.product_id == product_id, table.c.shard == _random.choice(shard_ids)).
+                       values(quantity=table.c.quantity + quantity))
+    return True
+
+
+def _take(db, table, product_id, shard, quantity):
+    """Guarded decrement of one shard; False if a concurrent checkout got there first"""
+    result = db.session.execute(table.update().
+                                where(table.c.product_id == product_id, table.c.shard == shard,
+                                      table.c.quantity >= quantity).
+                                values(quantity=table.c.quantity - quantity))
+    return result.rowcount == 1
@@ -0,0 +1,110 @@
+# backend/shop_geo.py
+"""
+In-memory uniform-grid index of shop locations, for "shops near me" lookups
+that do not stop at a city's name.
+
+Shops are bucketed into cells of SHOP_GRID_CELL_DEGREES (default 0.02, about
+2.2 km north-south). A lookup only scans the cells overlapping the query
+circle's bounding box and measures the shops in them with the equirectangular
+approximation, which is well within a metre at these distances; with 100k
+shops that is a few hundred distance checks (`python benchmark_geo.py`).
+
+The grid is built from the shops table on the first lookup and rebuilt every
+SHOP_INDEX_REFRESH_SECONDS (default 300), so shops created by other workers
+show up within that; create_shop adds its shop to the local grid at once.
+Cells are replaced rather than modified, so lookups never take the lock.
+"""
+import math
+import threading
+import time
+
+from metrics import metrics
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+class ShopGridIndex:
+    def __init__(self, cell_degrees=0.02):
+        self._lock = threading.Lock()
+        self.cell_degrees = cell_degrees
+        self.max_age = 300.0
+        self._cells = None  # (lat cell, lng cell) -> ((shop_id, lat, lng), ...)
+        self._built_at = 0.0
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lng / self.cell_degrees))
+
+    def invalidate(self):
+        self._built_at = 0.0
+
+    def refresh(self, load):
+        """Rebuild from `load()` -> [(shop_id, lat, lng)] when stale; one caller builds, others keep the old grid"""
+        stale = self._cells is None or time.monotonic() - self._built_at > self.max_age
+        metrics.cache_lookup('shop_grid', hit=not stale)
+        if stale and self._lock.acquire(blocking=self._cells is None):
+            try:
+                if self._cells is None or time.monotonic() - self._built_at > self.max_age:
+                    cells = {}
+                    for shop_id, lat, lng in load():
+                        cells.setdefault(self._cell(lat, lng), []).append((shop_id, lat, lng))
+                    self._cells = {cell: tuple(shops) for cell, shops in cells.items()}
+                    self._built_at = time.monotonic()
+            finally:
+                self._lock.release()
+
+    def add(self, shop_id, lat, lng):
+        """Put a new shop on the grid (no-op until the grid is first built)"""
+        with self._lock:
+            if self._cells is None:
+                return
+            cells = dict(self._cells)
+            cell = self._cell(lat, lng)
+            cells[cell] = cells.get(cell, ()) + ((shop_id, lat, lng),)
+            self._cells = cells
+
+    def nearby(self, lat, lng, radius_km, limit=None):
+        """[(distance_km, shop_id)] within radius_km of (lat, lng), nearest first"""
+        cells = self._cells or {}
+        cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+        dlat = radius_km / KM_PER_DEGREE
+        dlng = min(radius_km / (KM_PER_DEGREE * cos_lat), 180.0)
+        lat_lo, lng_lo = self._cell(lat - dlat, lng - dlng)
+        lat_hi, lng_hi = self._cell(lat + dlat, lng + dlng)
+
+        found = []
+        radius_sq = radius_km * radius_km
+        for lat_cell in range(lat_lo, lat_hi + 1):
+            for lng_cell in range(lng_lo, lng_hi + 1):
+                for shop_id, shop_lat, shop_lng in cells.get((lat_cell, lng_cell), ()):
+                    y = (shop_lat - lat) * KM_PER_DEGREE
+                    x = (shop_lng - lng) * KM_PER_DEGREE * cos_lat
+                    distance_sq = x * x + y * y
+                    if distance_sq <= radius_sq:
+                        found.append((distance_sq, shop_id))
+        found.sort()
+        return [(math.sqrt(distance_sq), shop_id) for distance_sq, shop_id in found[:limit]]
+
+    def __len__(self):
+        return sum(len(shops) for shops in (self._cells or {}).values())
+
+
+def parse_coordinates(lat, lng):
+    """(lat, lng) as floats, or ValueError. Both missing gives (None, None)."""
+    if lat in (None, '') and lng in (None, ''):
+        return None, None
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        raise ValueError("latitude and longitude must both be numbers")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("latitude must be within -90..90 and longitude within -180..180")
+    return lat, lng
+
+
+shop_grid = ShopGridIndex()
+
+
+def init_shop_grid(app):
+    shop_grid.cell_degrees = float(app.config.get('SHOP_GRID_CELL_DEGREES', 0.02))
+    shop_grid.max_age = float(app.config.get('SHOP_INDEX_REFRESH_SECONDS', 300))
@@ -0,0 +1,228 @@
+# backend/sold_counts.py
+"""
+Buffered Product.sold_count maintenance and the best-seller ranking built on it.
+
+Checkouts never write sold_count themselves. place_order (and cancellations,
+with negative deltas) add to an in-process buffer, and a background thread
+applies the accumulated deltas every SOLD_COUNT_FLUSH_INTERVAL seconds in one
+batched UPDATE, so hot products do not turn every checkout into a row-lock
+queue on the products table. Deltas still buffered when a process dies are
+lost; reconcile_sold_counts() recomputes every count from order_items and is
+the source of truth (`python sold_counts.py --reconcile`, e.g. nightly).
+
+The best-seller ranking is a precomputed top-N per (city, category), rebuilt
+at most every BESTSELLERS_REFRESH_SECONDS and served from memory.
+
+Settings (app.config):
+    SOLD_COUNT_FLUSH_INTERVAL    seconds between batched UPDATEs (default 5)
+    BESTSELLERS_TOP_N            products kept per city/category (default 50)
+    BESTSELLERS_REFRESH_SECONDS  maximum age of the ranking (default 60)
+"""
+import atexit
+import os
+import threading
+import time
+
+from sqlalchemy import bindparam, func
+
+from metrics import METRICS, metrics
+
+METRICS['minimart_sold_count_pending_products'] = ('gauge', 'Products with sold_count deltas waiting to be flushed')
+
+ALL = None  # Key used for "every city" / "every category" in the ranking
+
+
+class SoldCountBuffer:
+    """product_id -> units sold since the last flush, for this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flusher_pid = None
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # Deltas recorded before the fork belong to (and are flushed by) the parent
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._flusher_pid = None
+
+    def add(self, lines, sign=1):
+        """Record order lines: an iterable of dicts or rows with product_id and quantity"""
+        with self._lock:
+            for line in lines:
+                product_id, quantity = _line_values(line)
+                self._pending[product_id] = self._pending.get(product_id, 0) + sign * quantity
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self, db):
+        """Apply buffered deltas in one executemany UPDATE. Needs an app context."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        pending = {product_id: delta for product_id, delta in pending.items() if delta}
+        if not pending:
+            return 0
+
+        products = db.metadata.tables['products']
+        statement = products.update().where(products.c.id == bindparam('product_id')).\
+            values(sold_count=func.coalesce(products.c.sold_count, 0) + bindparam('delta'))
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(statement, [{'product_id': product_id, 'delta': delta}
+                                               for product_id, delta in sorted(pending.items())])
+        except Exception:
+            # Put the deltas back so the next flush retries them
+            self.add(pending.items())
+            raise
+        return len(pending)
+
+    def start_flusher(self, app, db, interval):
+        """Start the periodic flush once per process (lazily, so it survives forks)"""
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+
+        def flush_forever():
+            while True:
+                time.sleep(interval)
+                try:
+                    with app.app_context():
+                        if self.flush(db):
+                            bestsellers.invalidate()
+                except Exception as e:
+                    print(f"Error flushing sold counts: {e}")
+
+        threading.Thread(target=flush_forever, name='sold-count-flusher', daemon=True).start()
+
+
+class BestsellerIndex:
+    """Top-N products by sold_count for every (city, category), including ALL of either"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rankings = None
+        self._built_at = 0.0
+        self.top_n = 50
+        self.max_age = 60.0
+
+    def invalidate(self):
+        self._built_at = 0.0
+
+    def get(self, build, city=ALL, category=ALL, limit=None):
+        """Ranked product dicts; `build` returns fresh rankings when the index is stale"""
+        stale = self._rankings is None or time.monotonic() - self._built_at > self.max_age
+        metrics.cache_lookup('bestsellers', hit=not stale)
+        # One request rebuilds; concurrent ones keep serving the previous ranking
+        if stale and self._lock.acquire(blocking=self._rankings is None):
+            try:
+                if self._rankings is None or time.monotonic() - self._built_at > self.max_age:
+                    self._rankings = build(self.top_n)
+                    self._built_at = time.monotonic()
+            finally:
+                self._lock.release()
+        ranking = self._rankings.get((_key(city), _key(category)), [])
+        return ranking[:min(limit or self.top_n, self.top_n)]
+
+
+def build_rankings(rows, top_n):
+    """
+    Rankings from (city, category, product_dict) rows that already hold each
+    (city, category)'s top N. The per-city, per-category and overall lists are
+    merged from those, which is exact: an overall top-N product is necessarily
+    in the top N of its own (city, category).
+    """
+    rankings = {}
+    for city, category, product in rows:
+        city, category = _key(city), _key(category)
+        for key in {(city, category), (city, ALL), (ALL, category), (ALL, ALL)}:
+            rankings.setdefault(key, []).append(product)
+    for key, products in rankings.items():
+        products.sort(key=lambda p: (-p['sold_count'], p['id']))
+        del products[top_n:]
+    return rankings
+
+
+def reconcile_sold_counts(db):
+    """
+    Recompute every sold_count from order_items (and the archive) of orders
+    that were not cancelled, after flushing this process's buffer. Returns the number of
+    products whose stored count was wrong.
+    """
+    sold_counts.flush(db)
+    products = db.metadata.tables['products']
+    tables = db.metadata.tables
+
+    def sold(orders, order_items):
+        return db.select(func.coalesce(func.sum(order_items.c.quantity), 0)).\
+            select_from(order_items.join(orders, orders.c.id == order_items.c.order_id)).\
+            where(order_items.c.product_id == products.c.id, orders.c.status != 'Cancelled').\
+            scalar_subquery()
+
+    # Archived orders (see order_archive.py) still count
+    actual = sold(tables['orders'], tables['order_items']) + \
+        sold(tables['orders_archive'], tables['order_items_archive'])
+    with db.engine.begin() as connection:
+        result = connection.execute(products.update().
+                                    where(func.coalesce(products.c.sold_count, -1) != actual).
+                                    values(sold_count=actual))
+    bestsellers.invalidate()
+    return result.rowcount
+
+
+def _line_values(line):
+    if isinstance(line, tuple):
+        return line
+    if isinstance(line, dict):
+        return line['product_id'], line['quantity']
+    return line.product_id, line.quantity
+
+def _key(value):
+    return value.strip().lower() if isinstance(value, str) and value.strip() else ALL
+
+
+sold_counts = SoldCountBuffer()
+bestsellers = BestsellerIndex()
+
+
+def init_sold_counts(app, db):
+    """Start flushing the buffer from `app`'s workers and configure the ranking"""
+    interval = float(app.config.get('SOLD_COUNT_FLUSH_INTERVAL', 5))
+    bestsellers.top_n = int(app.config.get('BESTSELLERS_TOP_N', 50))
+    bestsellers.max_age = float(app.config.get('BESTSELLERS_REFRESH_SECONDS', 60))
+
+    metrics.register_collector(lambda: [('minimart_sold_count_pending_products', None, len(sold_counts.pending()))])
+
+    @app.before_request
+    def start_sold_count_flusher():
+        sold_counts.start_flusher(app, db, interval)
+
+    def flush_at_exit():
+        try:
+            with app.app_context():
+                sold_counts.flush(db)
+        except Exception as e:
+            print(f"Error flushing sold counts at exit: {e}")
+
+    atexit.register(flush_at_exit)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Maintenance for products.sold_count')
+    parser.add_argument('--reconcile', action='store_true', help='recompute every sold_count from order_items')
+    args = parser.parse_args()
+    if not args.reconcile:
+        parser.error('nothing to do; pass --reconcile')
+
+    from app import app, db
+
+    with app.app_context():
+        fixed = reconcile_sold_counts(db)
+    print(f"Reconciled sold counts: {fixed} product(s) corrected")
@@ -0,0 +1,175 @@
+# backend/sql_profiler.py
+"""
+Opt-in per-request SQL profiler and N+1 detector.
+
+When SQL_PROFILER_ENABLED is set, every sampled request records the statements
+it sends to the database: how many, the total time spent in the driver, the
+slowest ones, and which statement shapes repeat often enough to look like a
+query issued once per row (an N+1). In development the summary is returned as
+X-SQL-* response headers; in production slow or suspicious requests are written
+as one JSON line each to the `sql_profiler` logger.
+
+Settings (app.config, usually from the environment):
+    SQL_PROFILER_ENABLED              turn the listeners on at all (default off)
+    SQL_PROFILER_SAMPLE_RATE          fraction of requests profiled (default 1.0)
+    SQL_PROFILER_OUTPUT               'headers' or 'log' (default: headers in debug, log otherwise)
+    SQL_PROFILER_SLOW_REQUEST_MS      log requests slower than this (default 500)
+    SQL_PROFILER_N_PLUS_ONE_THRESHOLD repeats of one shape that count as N+1 (default 5)
+"""
+import json
+import logging
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import request
+from sqlalchemy import event
+
+logger = logging.getLogger('sql_profiler')
+
+# Profiles collecting statements in the current thread/request
+_active_profiles = ContextVar('sql_profiler_active', default=())
+
+_WHITESPACE = re.compile(r'\s+')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM_LIST = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s)(?:\s*,\s*(?:\?|%s|%\(\w+\)s))*\s*\)')
+
+def statement_shape(statement):
+    """Normalize a statement so the same query with different values compares equal"""
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _STRING_LITERAL.sub('?', shape)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    return _PARAM_LIST.sub('(?)', shape)
+
+
+class SQLProfile:
+    """Statements executed while the profile was active"""
+
+    def __init__(self):
+        self.statements = []  # (statement, duration_seconds)
+
+    def record(self, statement, duration):
+        self.statements.append((statement, duration))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def total_time(self):
+        return sum(duration for _, duration in self.statements)
+
+    def slowest(self, n=3):
+        return sorted(self.statements, key=lambda s: s[1], reverse=True)[:n]
+
+    def shape_counts(self):
+        counts = {}
+        for statement, _ in self.statements:
+            shape = statement_shape(statement)
+            counts[shape] = counts.get(shape, 0) + 1
+        return counts
+
+    def n_plus_one_suspects(self, threshold=5):
+        """Statement shapes repeated at least `threshold` times, most frequent first"""
+        suspects = [(count, shape) for shape, count in self.shape_counts().items() if count >= threshold]
+        return sorted(suspects, reverse=True)
+
+    def summary(self, threshold=5, top=3):
+        return {
+            'statements': self.count,
+            'db_time_ms': round(self.total_time * 1000, 2),
+            'slowest': [{'ms': round(d * 1000, 2), 'sql': _WHITESPACE.sub(' ', s)[:300]} for s, d in self.slowest(top)],
+            'n_plus_one': [{'count': c, 'shape': shape[:300]} for c, shape in self.n_plus_one_suspects(threshold)],
+        }
+
+
+@contextmanager
+def capture_sql():
+    """Collect every statement run in this context, e.g. around test-client calls"""
+    profile = SQLProfile()
+    token = _active_profiles.set(_active_profiles.get() + (profile,))
+    try:
+        yield profile
+    finally:
+        _active_profiles.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active_profiles.get():
+        conn.info.setdefault('sql_profiler_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profiles = _active_profiles.get()
+    if not profiles:
+        return
+    starts = conn.info.get('sql_profiler_start')
+    duration = time.perf_counter() - starts.pop() if starts else 0.0
+    for profile in profiles:
+        profile.record(statement, duration)
+
+def instrument_engine(engine):
+    """Attach the cursor listeners to `engine`; safe to call more than once"""
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def init_sql_profiler(app, db):
+    """Wire request sampling and reporting into `app`. Does nothing unless enabled."""
+    if not app.config.get('SQL_PROFILER_ENABLED'):
+        return
+
+    sample_rate = float(app.config.get('SQL_PROFILER_SAMPLE_RATE', 1.0))
+    output = app.config.get('SQL_PROFILER_OUTPUT') or ('headers' if app.debug else 'log')
+    slow_ms = float(app.config.get('SQL_PROFILER_SLOW_REQUEST_MS', 500))
+    threshold = int(app.config.get('SQL_PROFILER_N_PLUS_ONE_THRESHOLD', 5))
+
+    with app.app_context():
+        instrument_engine(db.engine)
+
+    @app.before_request
+    def start_sql_profile():
+        if sample_rate >= 1 or random.random() < sample_rate:
+            profile = SQLProfile()
+            request.environ['sql_profiler'] = (profile, time.perf_counter(),
+                                               _active_profiles.set(_active_profiles.get() + (profile,)))
+
+    @app.after_request
+    def report_sql_profile(response):
+        state = request.environ.get('sql_profiler')
+        if not state:
+            return response
+        profile, started, _ = state
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        summary = profile.summary(threshold)
+
+        if output == 'headers':
+            response.headers['X-SQL-Statements'] = str(summary['statements'])
+            response.headers['X-SQL-Time-Ms'] = str(summary['db_time_ms'])
+            if summary['n_plus_one']:
+                response.headers['X-SQL-N-Plus-One'] = '; '.join(
+                    f"{s['count']}x {s['shape'][:120]}" for s in summary['n_plus_one'])
+        elif elapsed_ms >= slow_ms or summary['n_plus_one']:
+            logger.warning(json.dumps({
+                'event': 'slow_request',
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'duration_ms': round(elapsed_ms, 2),
+                **summary,
+            }))
+        return response
+
+    @app.teardown_request
+    def stop_sql_profile(exc):
+        state = request.environ.pop('sql_profiler', None)
+        if state:
+            try:
+                _active_profiles.reset(state[2])
+            except ValueError:
+                # Torn down from a different context than the one that started it
+                _active_profiles.set(())
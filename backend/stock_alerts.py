@@ -0,0 +1,208 @@
+# backend/stock_alerts.py
+"""
+Low-stock alerts for shop owners (the stock_alerts table).
+
+Every product has a reorder_threshold (0 unless the owner sets one, which
+alerts only when it sells out). Its alert level is 'out_of_stock' at 0 units,
+'low_stock' at or below the threshold and none above it. Nothing scans the
+catalog for this: the places that change stock already hold the stock before
+and after, so place_order, add_product and update_product hand both to
+stock_changed(), which writes only when the level changes. Most orders write
+nothing. Cancellations return units with set-based UPDATEs, so restocked()
+re-checks the open alerts of the cancelled orders' products in SQL instead.
+
+stock_alerts keeps at most one row per product, the level it is at now, so a
+shop's queue (GET /api/shops/my/alerts) is never longer than its number of
+short products. The row goes when the product is restocked above its
+threshold. An owner can dismiss it; it comes back at the next change of level.
+
+Checkouts of sharded products do not lock the products row, so two of them
+can race past a threshold, and verify_inventory(fix=True) resets stock without
+going through here. The daily summary (one query per shop) reports every short
+product and puts any alert that was missed or left behind right:
+
+    python stock_alerts.py --summary            # from cron, once a day
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, bindparam, case, func, or_, select, true
+from sqlalchemy.exc import IntegrityError
+
+SALES_DAYS = 7 # The summary estimates days of stock left from this many days of sales
+
+
+def _tables(db):
+    tables = db.metadata.tables
+    return (tables['stock_alerts'], tables['products'], tables['product_stock_shards'],
+            tables['order_items'], tables['inventory_movements'], tables['shops'])
+
+
+def level(stock, threshold):
+    """'out_of_stock', 'low_stock' or None for a product holding `stock` units"""
+    if stock <= 0:
+        return 'out_of_stock'
+    if stock <= (threshold or 0):
+        return 'low_stock'
+    return None
+
+
+def _stock(products, shards):
+    """Sellable stock of a products row, as Product.available_quantity"""
+    shard_total = select(func.coalesce(func.sum(shards.c.quantity), 0)).\
+        where(shards.c.product_id == products.c.id).scalar_subquery()
+    return case((products.c.sharded_stock == true(), shard_total), else_=products.c.quantity)
+
+
+def stock_changed(db, changes):
+    """
+    Raise, move or clear alerts for [(product, level before the change, stock
+    now)]; the product holds its current reorder_threshold. Pass None as the
+    level for a new product. Works inside the caller's transaction.
+    """
+    alerts = _tables(db)[0]
+    raised, cleared = {}, []
+    for product, previous, stock in changes:
+        current = level(stock, product.reorder_threshold)
+        if current == previous:
+            continue
+        if current is None:
+            cleared.append(product.id)
+        else:
+            raised[product.id] = {'product_id': product.id, 'shop_id': product.shop_id, 'level': current,
+                                  'stock': stock, 'raised_at': datetime.utcnow(), 'dismissed_at': None}
+    if cleared:
+        db.session.execute(alerts.delete().where(alerts.c.product_id.in_(cleared)))
+    if raised:
+        existing = set(db.session.execute(select(alerts.c.product_id).
+                                          where(alerts.c.product_id.in_(list(raised)))).scalars())
+        new = [row for product_id, row in raised.items() if product_id not in existing]
+        if new:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(alerts.insert(), new)
+            except IntegrityError:
+                # A concurrent checkout raised one of them first; move it instead
+                existing = set(raised)
+        _update(db, [row for product_id, row in raised.items() if product_id in existing])
+
+
+def _update(db, rows):
+    if rows:
+        alerts = _tables(db)[0]
+        db.session.execute(alerts.update().where(alerts.c.product_id == bindparam('alert_product_id')).
+                           values(level=bindparam('level'), stock=bindparam('stock'),
+                                  raised_at=bindparam('raised_at'), dismissed_at=None),
+                           [{'alert_product_id': row['product_id'], 'level': row['level'], 'stock': row['stock'],
+                             'raised_at': row['raised_at']} for row in rows])
+
+
+def restocked(db, order_ids):
+    """
+    Re-check the alerts of products that cancelling `order_ids` put units back
+    into (after inventory.restock_cancelled): clear those above their
+    threshold, turn out_of_stock into low_stock for those back above 0.
+    """
+    alerts, products, shards, order_items, _, _ = _tables(db)
+    cancelled_products = select(order_items.c.product_id).where(order_items.c.order_id.in_(order_ids))
+    stock = _stock(products, shards)
+    above_threshold = select(products.c.id).where(products.c.id.in_(cancelled_products),
+                                                  stock > products.c.reorder_threshold)
+    db.session.execute(alerts.delete().where(alerts.c.product_id.in_(above_threshold)))
+    current = select(stock).where(products.c.id == alerts.c.product_id).scalar_subquery()
+    db.session.execute(alerts.update().
+                       where(alerts.c.product_id.in_(cancelled_products), alerts.c.level == 'out_of_stock',
+                             current > 0).
+                       values(level='low_stock', stock=current, raised_at=datetime.utcnow(), dismissed_at=None))
+
+
+def shop_summary_query(db, shop_id, now=None):
+    """
+    Every product of the shop that is at or below its threshold or has an
+    alert row, with its stock, threshold, alert and units sold over the last
+    SALES_DAYS days: what the daily summary reads, one query per shop.
+    """
+    alerts, products, shards, _, movements, _ = _tables(db)
+    since = (now or datetime.utcnow()) - timedelta(days=SALES_DAYS)
+    stock = _stock(products, shards).label('stock')
+    sold = select(func.coalesce(func.sum(movements.c.quantity), 0)).\
+        where(movements.c.product_id == products.c.id, movements.c.kind == 'sale',
+              movements.c.created_at >= since).scalar_subquery().label('sold')
+    return select(products.c.id, products.c.name, products.c.reorder_threshold, products.c.deleted_at, stock, sold,
+                  alerts.c.level, alerts.c.dismissed_at).\
+        select_from(products.outerjoin(alerts, alerts.c.product_id == products.c.id)).\
+        where(products.c.shop_id == shop_id,
+              or_(alerts.c.product_id.isnot(None),
+                  and_(products.c.deleted_at.is_(None), stock <= products.c.reorder_threshold))).\
+        order_by(stock, products.c.id)
+
+
+def summarize_shop(db, shop_id, now=None):
+    """
+    The shop's daily summary, a list of short products, most urgent first.
+    Alerts that are missing, at the wrong level or no longer needed are put
+    right on the way; commits.
+    """
+    alerts = _tables(db)[0]
+    now = now or datetime.utcnow()
+    report, missing, wrong, stale = [], [], [], []
+    for row in db.session.execute(shop_summary_query(db, shop_id, now)):
+        current = None if row.deleted_at else level(row.stock, row.reorder_threshold)
+        if current is None:
+            stale.append(row.id)
+            continue
+        alert = {'product_id': row.id, 'shop_id': shop_id, 'level': current, 'stock': row.stock,
+                 'raised_at': now, 'dismissed_at': None}
+        if row.level is None:
+            missing.append(alert)
+        elif row.level != current:
+            wrong.append(alert)
+        daily_sales = row.sold / SALES_DAYS
+        report.append({'product_id': row.id, 'name': row.name, 'level': current, 'quantity': row.stock,
+                       'reorder_threshold': row.reorder_threshold, 'sold_last_week': row.sold,
+                       'days_left': round(row.stock / daily_sales, 1) if daily_sales else None,
+                       'dismissed': row.level == current and row.dismissed_at is not None})
+    if stale:
+        db.session.execute(alerts.delete().where(alerts.c.product_id.in_(stale)))
+    if missing:
+        db.session.execute(alerts.insert(), missing)
+    _update(db, wrong)
+    db.session.commit()
+    return report
+
+
+def daily_summary(db, log=print):
+    """{shop_id: summary} for every shop with short products"""
+    shops = _tables(db)[5]
+    summaries = {}
+    for shop_id, name in db.session.execute(select(shops.c.id, shops.c.name).
+                                            where(shops.c.deleted_at.is_(None)).order_by(shops.c.id)).all():
+        report = summarize_shop(db, shop_id)
+        if report:
+            summaries[shop_id] = report
+            log(f"{name} (shop {shop_id}): {len(report)} product(s) short")
+            for item in report:
+                days = f", about {item['days_left']} day(s) left" if item['days_left'] is not None else ""
+                log(f"  {item['name']}: {item['quantity']} left, reorder at {item['reorder_threshold']}{days}")
+    return summaries
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Low-stock alert maintenance')
+    parser.add_argument('--summary', action='store_true',
+                        help="report every shop's short products and repair their alerts")
+    parser.add_argument('--json', action='store_true', help='with --summary: print the summaries as JSON')
+    args = parser.parse_args()
+    if not args.summary:
+        parser.error('nothing to do; pass --summary')
+
+    from app import app, db
+
+    with app.app_context():
+        summaries = daily_summary(db, log=(lambda message: None) if args.json else print)
+        if args.json:
+            print(json.dumps(summaries))
+        else:
+            print(f"{len(summaries)} shop(s) have short products")
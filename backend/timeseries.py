@@ -0,0 +1,134 @@
+# backend/timeseries.py
+"""
+Vectorized revenue time series for the shop analytics endpoints.
+
+The route pulls one row per order, (created_at, shop amount, status), into
+NumPy arrays; everything else is array arithmetic with no Python loop over
+orders: timestamps are truncated to the bucket unit, turned into bucket
+offsets, and summed with np.bincount, which also fills every empty bucket
+with zero. Moving averages are trailing means from a cumulative sum.
+
+Buckets are UTC. Weeks start on Monday.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# resolution -> (numpy datetime unit, default moving-average window in buckets)
+RESOLUTIONS = {
+    'hour': ('h', 24),
+    'day': ('D', 7),
+    'week': ('W', 4),
+    'month': ('M', 3),
+}
+MAX_BUCKETS = 10_000
+# numpy weeks start on Thursday (1970-01-01); shifting by three days makes them start on Monday
+WEEK_SHIFT = np.timedelta64(3, 'D')
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def to_datetime64(values):
+    """
+    Naive datetimes as datetime64[us]. Going through integer microseconds since
+    the epoch is several times faster than np.array(values, 'datetime64[us]'),
+    which parses each datetime object on its own.
+    """
+    offsets = np.fromiter(((value - EPOCH) // MICROSECOND for value in values), np.int64, len(values))
+    return offsets.view('datetime64[us]')
+
+
+def truncate(timestamps, resolution):
+    """datetime64 values floored to the start of their bucket, in the bucket's unit"""
+    unit = RESOLUTIONS[resolution][0]
+    if resolution == 'week':
+        return (timestamps + WEEK_SHIFT).astype('datetime64[W]')
+    return timestamps.astype(f'datetime64[{unit}]')
+
+
+def bucket_starts(first, count, resolution):
+    """`count` consecutive bucket starts from `first`, as datetime64[s]"""
+    starts = first + np.arange(count)
+    if resolution == 'week':
+        return starts.astype('datetime64[D]') - WEEK_SHIFT
+    return starts
+
+
+def moving_average(values, window):
+    """Trailing mean over `window` buckets; the first ones average what is there"""
+    cumulative = np.cumsum(values, dtype=np.float64)
+    trailing = cumulative.copy()
+    trailing[window:] -= cumulative[:-window]
+    return trailing / np.minimum(np.arange(1, len(values) + 1), window)
+
+
+def bucket_count(start, end, resolution):
+    first = truncate(np.datetime64(start, 'us'), resolution)
+    last = truncate(np.datetime64(end, 'us'), resolution)
+    return int((last - first).astype(np.int64)) + 1
+
+
+def build_series(rows, start, end, resolution, window=None):
+    """
+    Gap-filled series between `start` and `end` (datetimes) from rows of
+    (created_at, amount, status). Cancelled orders are counted on their own
+    and left out of revenue and orders.
+    """
+    window = window or RESOLUTIONS[resolution][1]
+    if rows:
+        created, amounts, statuses = zip(*rows)
+    else:
+        created, amounts, statuses = (), (), ()
+    timestamps = to_datetime64(created)
+    amounts = np.array(amounts, dtype=np.float64)
+    cancelled = np.array(statuses, dtype=object) == 'Cancelled'
+
+    first = truncate(np.datetime64(start, 'us'), resolution)
+    count = bucket_count(start, end, resolution)
+    offsets = (truncate(timestamps, resolution) - first).astype(np.int64)
+    inside = (offsets >= 0) & (offsets < count)
+    kept, kept_offsets = inside & ~cancelled, offsets[inside & ~cancelled]
+
+    revenue = np.bincount(kept_offsets, weights=amounts[kept], minlength=count).astype(np.float64)
+    orders = np.bincount(kept_offsets, minlength=count)
+    cancelled_orders = np.bincount(offsets[inside & cancelled], minlength=count)
+
+    starts = bucket_starts(first, count, resolution).astype('datetime64[s]')
+    return {
+        'resolution': resolution,
+        'window': window,
+        'buckets': np.datetime_as_string(starts).tolist(),
+        'revenue': np.round(revenue, 2).tolist(),
+        'orders': orders.tolist(),
+        'cancelled_orders': cancelled_orders.tolist(),
+        'revenue_moving_average': np.round(moving_average(revenue, window), 2).tolist(),
+        'totals': {
+            'revenue': round(float(revenue.sum()), 2),
+            'orders': int(orders.sum()),
+            'cancelled_orders': int(cancelled_orders.sum()),
+            'average_order_value': round(float(revenue.sum() / orders.sum()), 2) if orders.sum() else 0,
+        },
+    }
+
+
+def parse_window(args, now=None):
+    """
+    (start, end) from ?start=&end= (ISO dates or datetimes) or ?days= (default
+    30) ending now. Raises ValueError with a message for the client.
+    """
+    now = now or datetime.utcnow()
+    try:
+        end = datetime.fromisoformat(args['end']) if args.get('end') else now
+        if args.get('start'):
+            start = datetime.fromisoformat(args['start'])
+        else:
+            start = end - timedelta(days=int(args.get('days', 30)))
+    except ValueError:
+        raise ValueError("start and end must be ISO dates, days a whole number")
+    except OverflowError:
+        raise ValueError("days reaches back too far")
+    if start.tzinfo or end.tzinfo:
+        raise ValueError("start and end are UTC and must not carry a timezone")
+    if start > end:
+        raise ValueError("start must not be after end")
+    return start, end
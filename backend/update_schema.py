@@ -4,6 +4,7 @@ import os
 from urllib.parse import quote_plus
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
 from dotenv import load_dotenv
 
 load_dotenv()  # Load environment variables from .env
@@ -20,12 +21,38 @@ db = SQLAlchemy(app)
 def column_exists(connection, table, column):
     """Check if a column exists in a table"""
     try:
-        result = connection.execute(f"SHOW COLUMNS FROM {table} LIKE '{column}'")
+        result = connection.execute(text(f"SHOW COLUMNS FROM {table} LIKE '{column}'"))
         return result.rowcount > 0
     except Exception as e:
         print(f"Error checking if column exists: {e}")
         return False
 
+def add_columns(connection, table, columns_to_add):
+    """Add each (column_name, data_type, default_value) the table does not have yet"""
+    for column_name, data_type, default_value in columns_to_add:
+        try:
+            # Check if column exists
+            if not column_exists(connection, table, column_name):
+                # Add column if it doesn't exist
+                sql = f"ALTER TABLE {table} ADD COLUMN {column_name} {data_type} DEFAULT {default_value}"
+                connection.execute(text(sql))
+                print(f"Added column: {table}.{column_name}")
+            else:
+                print(f"Column {table}.{column_name} already exists")
+        except Exception as e:
+            print(f"Error adding column {table}.{column_name}: {e}")
+
+def create_index(connection, name, table, columns):
+    try:
+        exists = connection.execute(text(f"SHOW INDEX FROM {table} WHERE Key_name = '{name}'")).rowcount > 0
+        if not exists:
+            connection.execute(text(f"CREATE INDEX {name} ON {table} ({columns})"))
+            print(f"Created index: {name}")
+        else:
+            print(f"Index {name} already exists")
+    except Exception as e:
+        print(f"Error creating index {name}: {e}")
+
 def add_columns_to_products():
     """Add new columns to the products table"""
     with app.app_context():
@@ -39,24 +66,174 @@ def add_columns_to_products():
             ("unit", "VARCHAR(20)", "'kg'"),
             ("description", "TEXT", "NULL"),
             ("sold_count", "INT", "0"),
-            ("quantity", "INT", "0")
+            ("quantity", "INT", "0"),
+            ("sharded_stock", "BOOLEAN NOT NULL", "FALSE"),
+            ("updated_at", "DATETIME(6) NOT NULL", "CURRENT_TIMESTAMP(6)"),
+            ("deleted_at", "DATETIME(6) NULL", "NULL"),
+            ("image_key", "VARCHAR(80) NULL", "NULL"),
+            ("reorder_threshold", "INT NOT NULL", "0")
         ]
+        add_columns(connection, "products", columns_to_add)
+        add_columns(connection, "shops", [
+            ("updated_at", "DATETIME(6) NOT NULL", "CURRENT_TIMESTAMP(6)"),
+            ("deleted_at", "DATETIME(6) NULL", "NULL"),
+            ("latitude", "DOUBLE NULL", "NULL"),
+            ("longitude", "DOUBLE NULL", "NULL")
+        ])
+        add_columns(connection, "addresses", [
+            ("latitude", "DOUBLE NULL", "NULL"),
+            ("longitude", "DOUBLE NULL", "NULL")
+        ])
+        add_columns(connection, "order_items", [
+            ("unit_price", "DOUBLE NULL", "NULL")
+        ])
+        create_index(connection, "ix_products_updated_at", "products", "updated_at, id")
         
-        for column_name, data_type, default_value in columns_to_add:
-            try:
-                # Check if column exists
-                if not column_exists(connection, "products", column_name):
-                    # Add column if it doesn't exist
-                    sql = f"ALTER TABLE products ADD COLUMN {column_name} {data_type} DEFAULT {default_value}"
-                    connection.execute(sql)
-                    print(f"Added column: {column_name}")
-                else:
-                    print(f"Column {column_name} already exists")
-            except Exception as e:
-                print(f"Error adding column {column_name}: {e}")
-        
+        create_tables(connection)
+        open_inventory_balances(connection)
+        connection.commit()
         connection.close()
         print("Schema update completed.")
 
+# Tables added after the original schema: (name, CREATE TABLE statement)
+NEW_TABLES = [
+    ("product_stock_shards", """
+        CREATE TABLE IF NOT EXISTS product_stock_shards (
+            product_id INT NOT NULL,
+            shard INT NOT NULL,
+            quantity INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (product_id, shard),
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+    """),
+    ("inventory_movements", """
+        CREATE TABLE IF NOT EXISTS inventory_movements (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            product_id INT NOT NULL,
+            order_id INT NULL,
+            kind VARCHAR(20) NOT NULL,
+            quantity INT NOT NULL,
+            stock_delta INT NOT NULL,
+            created_at DATETIME NOT NULL,
+            INDEX ix_inventory_movements_order_id (order_id),
+            INDEX ix_inventory_movements_product_created (product_id, created_at)
+        )
+    """),
+    ("offers", """
+        CREATE TABLE IF NOT EXISTS offers (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            shop_id INT NOT NULL,
+            name VARCHAR(100) NOT NULL,
+            kind VARCHAR(20) NOT NULL,
+            value FLOAT NOT NULL DEFAULT 0,
+            buy_quantity INT NULL,
+            free_quantity INT NULL,
+            product_id INT NULL,
+            category VARCHAR(50) NULL,
+            starts_at DATETIME NULL,
+            ends_at DATETIME NULL,
+            active BOOLEAN NOT NULL DEFAULT TRUE,
+            created_at DATETIME NOT NULL,
+            INDEX ix_offers_shop_id (shop_id),
+            FOREIGN KEY (shop_id) REFERENCES shops(id),
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+    """),
+    ("stock_alerts", """
+        CREATE TABLE IF NOT EXISTS stock_alerts (
+            product_id INT PRIMARY KEY,
+            shop_id INT NOT NULL,
+            level VARCHAR(20) NOT NULL,
+            stock INT NOT NULL,
+            raised_at DATETIME NOT NULL,
+            dismissed_at DATETIME NULL,
+            INDEX ix_stock_alerts_shop_raised (shop_id, raised_at)
+        )
+    """),
+    ("orders_archive", """
+        CREATE TABLE IF NOT EXISTS orders_archive (
+            id INT PRIMARY KEY,
+            customer_id INT NOT NULL,
+            address_id INT NULL,
+            created_at DATETIME NULL,
+            total_amount FLOAT NOT NULL DEFAULT 0,
+            status VARCHAR(50) NOT NULL,
+            payment_method VARCHAR(50) NULL,
+            payment_transaction_id VARCHAR(100) NULL,
+            INDEX ix_orders_archive_customer_created (customer_id, created_at),
+            INDEX ix_orders_archive_created_at (created_at)
+        )
+    """),
+    ("order_items_archive", """
+        CREATE TABLE IF NOT EXISTS order_items_archive (
+            order_id INT NOT NULL,
+            product_id INT NOT NULL,
+            quantity INT NOT NULL DEFAULT 1,
+            shop_id INT NOT NULL,
+            unit_price FLOAT NULL,
+            PRIMARY KEY (order_id, product_id),
+            INDEX ix_order_items_archive_shop_order (shop_id, order_id)
+        )
+    """),
+    ("product_pair_counts", """
+        CREATE TABLE IF NOT EXISTS product_pair_counts (
+            product_id INT NOT NULL,
+            other_product_id INT NOT NULL,
+            orders INT NOT NULL,
+            PRIMARY KEY (product_id, other_product_id)
+        )
+    """),
+    ("related_products", """
+        CREATE TABLE IF NOT EXISTS related_products (
+            product_id INT NOT NULL,
+            `rank` INT NOT NULL,
+            related_product_id INT NOT NULL,
+            orders INT NOT NULL,
+            confidence FLOAT NOT NULL,
+            PRIMARY KEY (product_id, `rank`)
+        )
+    """),
+    ("job_watermarks", """
+        CREATE TABLE IF NOT EXISTS job_watermarks (
+            name VARCHAR(50) PRIMARY KEY,
+            last_order_id INT NOT NULL DEFAULT 0,
+            updated_at DATETIME NOT NULL
+        )
+    """),
+]
+
+def create_tables(connection):
+    """Create the tables in NEW_TABLES that do not exist yet"""
+    for table_name, ddl in NEW_TABLES:
+        try:
+            connection.execute(text(ddl))
+            print(f"Table {table_name} is present")
+        except Exception as e:
+            print(f"Error creating {table_name}: {e}")
+
+def open_inventory_balances(connection):
+    """
+    Write an `opening` inventory_movements row with the current stock for every
+    product that has none (as inventory.record_opening_balances does), so the
+    ledger of an existing database starts from what the products hold.
+    """
+    try:
+        result = connection.execute(text("""
+            INSERT INTO inventory_movements (product_id, order_id, kind, quantity, stock_delta, created_at)
+            SELECT id, NULL, 'opening', stock, stock, NOW() FROM (
+                SELECT products.id AS id,
+                       CASE WHEN products.sharded_stock THEN
+                           (SELECT COALESCE(SUM(quantity), 0) FROM product_stock_shards
+                            WHERE product_stock_shards.product_id = products.id)
+                       ELSE COALESCE(products.quantity, 0) END AS stock
+                FROM products
+                WHERE NOT EXISTS (SELECT 1 FROM inventory_movements
+                                  WHERE inventory_movements.product_id = products.id)
+            ) AS unopened
+        """))
+        print(f"Opened inventory ledger balances for {result.rowcount} product(s)")
+    except Exception as e:
+        print(f"Error opening inventory balances: {e}")
+
 if __name__ == "__main__":
     add_columns_to_products()
\ No newline at end of file
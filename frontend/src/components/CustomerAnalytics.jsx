@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { motion } from 'framer-motion';
+import { getMyAnalytics, mediaUrl } from '../services/api';
 
 const CustomerAnalytics = ({ orders, formatCurrency }) => {
   const [analytics, setAnalytics] = useState({
@@ -7,89 +8,40 @@ const CustomerAnalytics = ({ orders, formatCurrency }) => {
     orderCount: 0,
     averageOrderValue: 0,
     mostOrderedProducts: [],
-    recentOrders: [],
+    favoriteCategories: [],
+    ordersPerMonth: 0,
     ordersByStatus: {},
     spendingByMonth: []
   });
 
+  // Figures come from the server; `orders` only tells us when to refresh them
   useEffect(() => {
-    if (orders && orders.length > 0) {
-      calculateAnalytics();
-    }
-  }, [orders]);
-
-  const calculateAnalytics = () => {
-    // Total spent
-    const totalSpent = orders.reduce((sum, order) => sum + order.total_amount, 0);
-    
-    // Order count
-    const orderCount = orders.length;
-    
-    // Average order value
-    const averageOrderValue = totalSpent / orderCount;
-    
-    // Orders by status
-    const ordersByStatus = orders.reduce((acc, order) => {
-      acc[order.status] = (acc[order.status] || 0) + 1;
-      return acc;
-    }, {});
-    
-    // Most ordered products
-    const productCounts = {};
-    orders.forEach(order => {
-      if (order.items && order.items.length > 0) {
-        order.items.forEach(item => {
-          if (!productCounts[item.product_id]) {
-            productCounts[item.product_id] = {
-              id: item.product_id,
-              name: item.name,
-              count: 0,
-              totalQuantity: 0,
-              image_url: item.image_url
-            };
-          }
-          productCounts[item.product_id].count += 1;
-          productCounts[item.product_id].totalQuantity += item.quantity;
+    let cancelled = false;
+    getMyAnalytics()
+      .then(({ data }) => {
+        if (cancelled) return;
+        setAnalytics({
+          totalSpent: data.total_spent,
+          orderCount: data.order_count,
+          averageOrderValue: data.average_order_value,
+          mostOrderedProducts: data.favorite_products.slice(0, 3).map(product => ({
+            id: product.id,
+            name: product.name,
+            totalQuantity: product.quantity,
+            image_url: mediaUrl(product.image_urls ? product.image_urls.thumb.jpg : product.image_url)
+          })),
+          favoriteCategories: data.favorite_categories,
+          ordersPerMonth: data.orders_per_month,
+          ordersByStatus: data.orders_by_status,
+          spendingByMonth: data.spending_by_month.slice(-6).map(({ month, amount }) => {
+            const [year, monthNumber] = month.split('-');
+            return { month: `${Number(monthNumber)}/${year}`, amount };
+          })
         });
-      }
-    });
-    
-    const mostOrderedProducts = Object.values(productCounts)
-      .sort((a, b) => b.totalQuantity - a.totalQuantity)
-      .slice(0, 3);
-    
-    // Recent orders
-    const recentOrders = [...orders]
-      .sort((a, b) => new Date(b.created_at) - new Date(a.created_at))
-      .slice(0, 3);
-    
-    // Spending by month
-    const spendingByMonth = {};
-    orders.forEach(order => {
-      const date = new Date(order.created_at);
-      const monthYear = `${date.getMonth() + 1}/${date.getFullYear()}`;
-      spendingByMonth[monthYear] = (spendingByMonth[monthYear] || 0) + order.total_amount;
-    });
-    
-    const spendingByMonthArray = Object.entries(spendingByMonth).map(([month, amount]) => ({
-      month,
-      amount
-    })).sort((a, b) => {
-      const [aMonth, aYear] = a.month.split('/');
-      const [bMonth, bYear] = b.month.split('/');
-      return new Date(bYear, bMonth - 1) - new Date(aYear, aMonth - 1);
-    }).slice(0, 6).reverse();
-    
-    setAnalytics({
-      totalSpent,
-      orderCount,
-      averageOrderValue,
-      mostOrderedProducts,
-      recentOrders,
-      ordersByStatus,
-      spendingByMonth: spendingByMonthArray
-    });
-  };
+      })
+      .catch(error => console.error('Error fetching analytics:', error));
+    return () => { cancelled = true; };
+  }, [orders]);
 
   const getStatusColor = (status) => {
     switch(status) {
@@ -134,6 +86,7 @@ const CustomerAnalytics = ({ orders, formatCurrency }) => {
           <div className="bg-gradient-to-br from-green-50 to-teal-50 p-4 rounded-lg border border-green-100">
             <p className="text-sm text-green-500 font-medium">Orders Placed</p>
             <p className="text-2xl font-bold text-green-700">{analytics.orderCount}</p>
+            <p className="text-xs text-green-600">{analytics.ordersPerMonth} per month</p>
           </div>
           
           <div className="bg-gradient-to-br from-purple-50 to-pink-50 p-4 rounded-lg border border-purple-100">
@@ -244,6 +197,20 @@ const CustomerAnalytics = ({ orders, formatCurrency }) => {
             </div>
           </div>
         )}
+
+        {/* Favorite Categories */}
+        {analytics.favoriteCategories.length > 0 && (
+          <div>
+            <h3 className="text-md font-semibold text-gray-700 mb-3">Your Favorite Categories</h3>
+            <div className="flex flex-wrap gap-2">
+              {analytics.favoriteCategories.map(category => (
+                <span key={category.category} className="bg-gray-100 text-gray-700 text-sm px-3 py-1 rounded-full">
+                  {category.category} · {category.quantity} items · {formatCurrency(category.spent)}
+                </span>
+              ))}
+            </div>
+          </div>
+        )}
       </div>
     </motion.div>
   );
@@ -3,6 +3,7 @@ import { Link } from 'react-router-dom';
 import { motion } from 'framer-motion';
 import { calculateDiscountedPrice } from '../utils/priceUtils';
 import { getCategoryEmoji } from '../utils/categoryUtils';
+import { mediaUrl } from '../services/api';
 
 const ProductCard = ({ product, onAddToCart, isCustomer, formatCurrency }) => {
   const handleAddToCart = () => {
@@ -65,16 +66,21 @@ const ProductCard = ({ product, onAddToCart, isCustomer, formatCurrency }) => {
       whileHover={{ y: -5 }}
     >
       <div className="relative overflow-hidden group">
-        <img 
-          id={`product-img-${product.id}`}
-          src={product.image_url || `https://placehold.co/600x400/E2E8F0/A0AEC0?text=${product.name.charAt(0)}`} 
-          alt={product.name} 
-          className={`w-full h-48 object-cover transition-transform duration-500 group-hover:scale-110 ${product.quantity <= 0 ? 'opacity-70 grayscale' : ''}`}
-          onError={(e) => { 
-            e.target.onerror = null; 
-            e.target.src=`https://placehold.co/600x400/E2E8F0/A0AEC0?text=${product.name.charAt(0)}`; 
-          }}
-        />
+        <picture>
+          {/* Uploaded images come resized; browsers that take WebP get the smaller file */}
+          {product.image_urls && <source type="image/webp" srcSet={mediaUrl(product.image_urls.card.webp)} />}
+          <img 
+            id={`product-img-${product.id}`}
+            src={mediaUrl(product.image_url) || `https://placehold.co/600x400/E2E8F0/A0AEC0?text=${product.name.charAt(0)}`} 
+            alt={product.name} 
+            loading="lazy"
+            className={`w-full h-48 object-cover transition-transform duration-500 group-hover:scale-110 ${product.quantity <= 0 ? 'opacity-70 grayscale' : ''}`}
+            onError={(e) => { 
+              e.target.onerror = null; 
+              e.target.src=`https://placehold.co/600x400/E2E8F0/A0AEC0?text=${product.name.charAt(0)}`; 
+            }}
+          />
+        </picture>
         
         {/* Out of stock overlay */}
         {product.quantity <= 0 && (
@@ -2,12 +2,13 @@
 import React, { useContext, useEffect, useState } from 'react';
 import { Link } from 'react-router-dom';
 import { AuthContext } from '../App';
-import { getMyShop, getShopOrders } from '../services/api'; // Removed product-related imports
+import { dismissAlert, getMyAlerts, getMyShop, getShopOrders } from '../services/api'; // Removed product-related imports
 
 function AdminDashboard() {
     const { auth } = useContext(AuthContext);
     const [shop, setShop] = useState(null);
     const [orders, setOrders] = useState([]);
+    const [alerts, setAlerts] = useState([]);
     const [loadingShop, setLoadingShop] = useState(true);
     const [loadingOrders, setLoadingOrders] = useState(false);
     const [error, setError] = useState('');
@@ -19,6 +20,7 @@ function AdminDashboard() {
     useEffect(() => {
         if (shop && shop.id) {
             fetchShopOrders(); // Fetch orders when shop details are available
+            fetchAlerts();
         }
     }, [shop]);
 
@@ -53,6 +55,24 @@ function AdminDashboard() {
         }
     };
 
+    const fetchAlerts = async () => {
+        try {
+            const response = await getMyAlerts();
+            setAlerts(response.data || []);
+        } catch (err) {
+            console.error('Failed to fetch stock alerts:', err);
+        }
+    };
+
+    const handleDismissAlert = async (productId) => {
+        try {
+            await dismissAlert(productId);
+            setAlerts(alerts.filter(alert => alert.product_id !== productId));
+        } catch (err) {
+            setError(`Failed to dismiss alert: ${err.response?.data?.message || err.message}`);
+        }
+    };
+
     const formatCurrency = (amount) => {
         if (typeof amount !== 'number') return 'N/A';
         return amount.toLocaleString('en-IN', { style: 'currency', currency: 'INR', minimumFractionDigits: 2 });
@@ -132,6 +152,34 @@ function AdminDashboard() {
                         </div>
                     </div>
 
+                    {alerts.length > 0 && (
+                        <div className="mb-8">
+                            <h2 className="text-2xl font-semibold mb-4 text-gray-700">Low Stock</h2>
+                            <ul className="bg-white rounded-lg shadow-md divide-y divide-gray-200">
+                                {alerts.map(alert => (
+                                    <li key={alert.product_id} className="p-4 flex items-center justify-between">
+                                        <div>
+                                            <p className="font-medium text-gray-800">{alert.name}</p>
+                                            <p className={`text-sm ${alert.level === 'out_of_stock' ? 'text-red-600' : 'text-yellow-600'}`}>
+                                                {alert.level === 'out_of_stock'
+                                                    ? 'Out of stock'
+                                                    : `${alert.quantity} left (reorder level ${alert.reorder_threshold})`}
+                                            </p>
+                                        </div>
+                                        <div className="flex gap-2">
+                                            <Link to={`/admin/edit-product/${alert.product_id}`} className="bg-blue-500 hover:bg-blue-700 text-white text-sm py-1 px-3 rounded">
+                                                Restock
+                                            </Link>
+                                            <button onClick={() => handleDismissAlert(alert.product_id)} className="bg-gray-200 hover:bg-gray-300 text-gray-700 text-sm py-1 px-3 rounded">
+                                                Dismiss
+                                            </button>
+                                        </div>
+                                    </li>
+                                ))}
+                            </ul>
+                        </div>
+                    )}
+
                     <div>
                         <h2 className="text-2xl font-semibold mb-4 text-gray-700">Shop Orders</h2>
                          <Link to="/admin/shop-orders" className="bg-indigo-500 hover:bg-indigo-700 text-white font-bold py-2 px-4 rounded mb-4 inline-block">
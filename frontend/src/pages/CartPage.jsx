@@ -3,7 +3,7 @@ import React, { useState, useEffect, useContext } from 'react';
 import { useNavigate, Link } from 'react-router-dom';
 import { motion, AnimatePresence } from 'framer-motion';
 import { AuthContext } from '../App';
-import { placeOrder } from '../services/api';
+import { placeOrder, quoteCart, getRelatedProducts, mediaUrl } from '../services/api';
 import CartItem from '../components/CartItem';
 import Toast from '../components/Toast';
 import PaymentModal from '../components/PaymentModal';
@@ -18,6 +18,8 @@ function CartPage() {
     const [loading, setLoading] = useState(false);
     const [notification, setNotification] = useState({ show: false, message: '', type: 'success' });
     const [isPaymentModalOpen, setIsPaymentModalOpen] = useState(false);
+    const [related, setRelated] = useState([]);
+    const [quote, setQuote] = useState(null);
     const { auth } = useContext(AuthContext);
     const navigate = useNavigate();
 
@@ -28,6 +30,43 @@ function CartPage() {
         window.dispatchEvent(new Event('cartUpdated'));
     }, [cart]);
 
+    // Offers and discounts are worked out by the server, the same way place_order charges them
+    const cartLines = cart.map(item => `${item.id}x${item.quantity}`).join(',');
+    useEffect(() => {
+        if (!cartLines) {
+            setQuote(null);
+            return;
+        }
+        const items = cartLines.split(',').map(line => {
+            const [productId, quantity] = line.split('x');
+            return { product_id: Number(productId), quantity: Number(quantity) };
+        });
+        quoteCart(items)
+            .then(response => setQuote(response.data))
+            .catch(err => console.error("Error pricing cart:", err));
+    }, [cartLines]);
+
+    // Frequently bought together; only refetched when the set of products changes, not their quantities
+    const cartProductIds = cart.map(item => item.id).sort((a, b) => a - b).join(',');
+    useEffect(() => {
+        if (!cartProductIds) {
+            setRelated([]);
+            return;
+        }
+        getRelatedProducts({ productIds: cartProductIds.split(','), limit: 4, fields: 'card' })
+            .then(response => setRelated(response.data))
+            .catch(err => console.error("Error fetching related products:", err));
+    }, [cartProductIds]);
+
+    const addRelatedToCart = (product) => {
+        setCart([...cart, { ...product, quantity: 1, quantity_available: product.quantity }]);
+        setNotification({
+            show: true,
+            message: `${product.name} added to cart`,
+            type: 'success'
+        });
+    };
+
     const updateQuantity = (productId, newQuantity) => {
         if (newQuantity < 1) {
             removeFromCart(productId);
@@ -58,7 +97,9 @@ function CartPage() {
         });
     };
 
-    const cartTotal = cart.reduce((total, item) => total + (item.price * item.quantity), 0);
+    // List prices until the quote arrives
+    const cartSubtotal = quote ? quote.subtotal : cart.reduce((total, item) => total + (item.price * item.quantity), 0);
+    const cartTotal = quote ? quote.total : cartSubtotal;
 
     const handleCheckout = () => {
         if (!auth.isAuthenticated) {
@@ -281,6 +322,32 @@ function CartPage() {
                                 </AnimatePresence>
                             </div>
                         </div>
+
+                        {related.length > 0 && (
+                            <div className="bg-white shadow-lg rounded-xl overflow-hidden mt-8 p-6">
+                                <h2 className="text-lg font-bold text-gray-800 mb-4">Frequently bought together</h2>
+                                <div className="grid grid-cols-2 md:grid-cols-4 gap-4">
+                                    {related.map(product => (
+                                        <div key={product.id} className="border rounded-lg p-3 flex flex-col">
+                                            <img
+                                                src={mediaUrl(product.image_urls ? product.image_urls.thumb.jpg : product.image_url) || `https://placehold.co/160x160/E2E8F0/A0AEC0?text=${product.name.charAt(0)}`}
+                                                alt={product.name}
+                                                className="h-24 w-full object-cover rounded mb-2"
+                                                loading="lazy"
+                                            />
+                                            <p className="text-sm font-medium text-gray-800 truncate">{product.name}</p>
+                                            <p className="text-sm text-primary font-bold mb-2">{formatCurrency(product.price)}</p>
+                                            <button
+                                                onClick={() => addRelatedToCart(product)}
+                                                className="mt-auto text-sm bg-primary hover:bg-primary-dark text-white font-semibold py-1 px-2 rounded-md transition-colors duration-200"
+                                            >
+                                                Add to Cart
+                                            </button>
+                                        </div>
+                                    ))}
+                                </div>
+                            </div>
+                        )}
                     </motion.div>
                     
                     <motion.div 
@@ -302,8 +369,19 @@ function CartPage() {
                                 <div className="space-y-4 mb-6">
                                     <div className="flex justify-between">
                                         <span className="text-gray-600">Subtotal</span>
-                                        <span className="font-medium">{formatCurrency(cartTotal)}</span>
+                                        <span className="font-medium">{formatCurrency(cartSubtotal)}</span>
                                     </div>
+                                    {quote && quote.discount > 0 && (
+                                        <div className="flex justify-between">
+                                            <span className="text-gray-600">
+                                                Offers
+                                                <span className="block text-xs text-gray-500">
+                                                    {[...new Set(quote.lines.filter(line => line.offer).map(line => line.offer.name))].join(', ')}
+                                                </span>
+                                            </span>
+                                            <span className="font-medium text-green-600">-{formatCurrency(quote.discount)}</span>
+                                        </div>
+                                    )}
                                     <div className="flex justify-between">
                                         <span className="text-gray-600">Shipping</span>
                                         <span className="font-medium text-green-600">Free</span>
@@ -23,6 +23,7 @@ function EditProductPage() {
         name: '',
         price: '',
         quantity: '',
+        reorder_threshold: 0,
         image_url: '',
         category: 'Vegetables',
         description: '',
@@ -63,6 +64,7 @@ function EditProductPage() {
                     name: foundProduct.name || '',
                     price: foundProduct.price || '',
                     quantity: foundProduct.quantity || 0,
+                    reorder_threshold: foundProduct.reorder_threshold || 0,
                     image_url: foundProduct.image_url || '',
                     category: foundProduct.category || 'Vegetables',
                     description: foundProduct.description || '',
@@ -133,6 +135,15 @@ function EditProductPage() {
             });
             return;
         }
+
+        if (formData.reorder_threshold < 0) {
+            setNotification({
+                show: true,
+                message: 'Reorder level cannot be negative',
+                type: 'error'
+            });
+            return;
+        }
         
         setSaving(true);
         try {
@@ -266,6 +277,20 @@ function EditProductPage() {
                                     required
                                 />
                             </div>
+
+                            <div>
+                                <label htmlFor="reorder_threshold" className="block text-sm font-medium text-gray-700 mb-1">Reorder Level</label>
+                                <input
+                                    type="number"
+                                    id="reorder_threshold"
+                                    name="reorder_threshold"
+                                    value={formData.reorder_threshold}
+                                    onChange={handleNumberChange}
+                                    min="0"
+                                    className="block w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-primary focus:border-primary"
+                                />
+                                <p className="mt-1 text-xs text-gray-500">You get a low-stock alert at or below this quantity (0: only when sold out)</p>
+                            </div>
                             
                             <div>
                                 <label htmlFor="category" className="block text-sm font-medium text-gray-700 mb-1">Category</label>
@@ -2,7 +2,7 @@ import React, { useState, useEffect, useContext } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
 import { motion, AnimatePresence } from 'framer-motion';
 import { AuthContext } from '../App';
-import { getProducts, updateProduct } from '../services/api';
+import { getProducts, updateProduct, getMyShop, getMyOffers, createOffer, updateOffer, deleteOffer } from '../services/api';
 import Toast from '../components/Toast';
 import { calculateDiscountedPrice, formatCurrency } from '../utils/priceUtils';
 
@@ -16,6 +16,10 @@ const ManageOffersPage = () => {
   const [categories, setCategories] = useState([]);
   const [notification, setNotification] = useState({ show: false, message: '', type: 'success' });
   const [editingProduct, setEditingProduct] = useState(null);
+  const [offers, setOffers] = useState([]);
+  const [shopId, setShopId] = useState(null);
+  const emptyOffer = { name: '', kind: 'percentage', value: '', buy_quantity: 2, free_quantity: 1, category: '', product_id: '', starts_at: '', ends_at: '' };
+  const [newOffer, setNewOffer] = useState(emptyOffer);
   const { auth } = useContext(AuthContext);
   const navigate = useNavigate();
 
@@ -50,6 +54,67 @@ const ManageOffersPage = () => {
     fetchProducts();
   }, []);
 
+  // Offer rules of the admin's shop, applied by the server to every cart (see POST /api/pricing/quote)
+  useEffect(() => {
+    getMyOffers()
+      .then(response => setOffers(response.data))
+      .catch(err => console.error("Error fetching offers:", err));
+    getMyShop()
+      .then(response => setShopId(response.data.id))
+      .catch(err => console.error("Error fetching shop:", err));
+  }, []);
+
+  const handleCreateOffer = async (e) => {
+    e.preventDefault();
+    const { kind, value, buy_quantity, free_quantity, category, product_id, starts_at, ends_at, name } = newOffer;
+    try {
+      const response = await createOffer({
+        name,
+        kind,
+        ...(kind === 'buy_x_get_y'
+          ? { buy_quantity: Number(buy_quantity), free_quantity: Number(free_quantity) }
+          : { value: Number(value) }),
+        category: category || null,
+        product_id: product_id ? Number(product_id) : null,
+        starts_at: starts_at ? new Date(starts_at).toISOString() : null,
+        ends_at: ends_at ? new Date(ends_at).toISOString() : null
+      });
+      setOffers([response.data.offer, ...offers]);
+      setNewOffer(emptyOffer);
+      setNotification({ show: true, message: `Offer "${name}" created`, type: 'success' });
+    } catch (err) {
+      setNotification({ show: true, message: `Failed to create offer: ${err.response?.data?.message || err.message}`, type: 'error' });
+    }
+  };
+
+  const handleToggleOffer = async (offer) => {
+    try {
+      const response = await updateOffer(offer.id, { active: !offer.active });
+      setOffers(offers.map(o => o.id === offer.id ? response.data.offer : o));
+    } catch (err) {
+      setNotification({ show: true, message: `Failed to update offer: ${err.response?.data?.message || err.message}`, type: 'error' });
+    }
+  };
+
+  const handleDeleteOffer = async (offer) => {
+    try {
+      await deleteOffer(offer.id);
+      setOffers(offers.filter(o => o.id !== offer.id));
+    } catch (err) {
+      setNotification({ show: true, message: `Failed to delete offer: ${err.response?.data?.message || err.message}`, type: 'error' });
+    }
+  };
+
+  const describeOffer = (offer) => {
+    const amount = offer.kind === 'percentage' ? `${offer.value}% off`
+      : offer.kind === 'flat' ? `${formatCurrency(offer.value)} off each`
+      : `Buy ${offer.buy_quantity} get ${offer.free_quantity} free`;
+    const target = offer.product_id
+      ? products.find(p => p.id === offer.product_id)?.name || `Product #${offer.product_id}`
+      : offer.category || 'Whole shop';
+    return `${amount} · ${target}`;
+  };
+
   // Filter products when search term or category changes
   useEffect(() => {
     let result = [...products];
@@ -151,6 +216,97 @@ const ManageOffersPage = () => {
         </div>
       </div>
       
+      {/* Offer Rules */}
+      <div className="bg-white rounded-xl shadow-md p-5 mb-8">
+        <h2 className="text-xl font-bold text-gray-800 mb-4">Offer Rules</h2>
+        <form onSubmit={handleCreateOffer} className="grid grid-cols-1 md:grid-cols-4 gap-4 mb-6">
+          <input
+            type="text"
+            required
+            value={newOffer.name}
+            onChange={(e) => setNewOffer({ ...newOffer, name: e.target.value })}
+            placeholder="Offer name, e.g. Weekend fruit sale"
+            className="md:col-span-2 border border-gray-300 rounded-md px-3 py-2 sm:text-sm"
+          />
+          <select
+            value={newOffer.kind}
+            onChange={(e) => setNewOffer({ ...newOffer, kind: e.target.value })}
+            className="border border-gray-300 rounded-md px-3 py-2 sm:text-sm"
+          >
+            <option value="percentage">Percentage off</option>
+            <option value="flat">Flat amount off each</option>
+            <option value="buy_x_get_y">Buy X get Y free</option>
+          </select>
+          {newOffer.kind === 'buy_x_get_y' ? (
+            <div className="flex gap-2">
+              <input type="number" min="1" value={newOffer.buy_quantity} title="Buy"
+                onChange={(e) => setNewOffer({ ...newOffer, buy_quantity: e.target.value })}
+                className="w-1/2 border border-gray-300 rounded-md px-3 py-2 sm:text-sm" />
+              <input type="number" min="1" value={newOffer.free_quantity} title="Get free"
+                onChange={(e) => setNewOffer({ ...newOffer, free_quantity: e.target.value })}
+                className="w-1/2 border border-gray-300 rounded-md px-3 py-2 sm:text-sm" />
+            </div>
+          ) : (
+            <input type="number" min="0" step="0.01" required value={newOffer.value}
+              placeholder={newOffer.kind === 'percentage' ? 'Percent off' : 'Amount off each'}
+              onChange={(e) => setNewOffer({ ...newOffer, value: e.target.value })}
+              className="border border-gray-300 rounded-md px-3 py-2 sm:text-sm" />
+          )}
+          <select
+            value={newOffer.product_id ? `p${newOffer.product_id}` : newOffer.category ? `c${newOffer.category}` : ''}
+            onChange={(e) => {
+              const target = e.target.value;
+              setNewOffer({
+                ...newOffer,
+                product_id: target.startsWith('p') ? target.slice(1) : '',
+                category: target.startsWith('c') ? target.slice(1) : ''
+              });
+            }}
+            className="md:col-span-2 border border-gray-300 rounded-md px-3 py-2 sm:text-sm"
+          >
+            <option value="">Whole shop</option>
+            {categories.map(category => <option key={`c${category}`} value={`c${category}`}>Category: {category}</option>)}
+            {products.filter(p => p.shop_id === shopId).map(product => (
+              <option key={`p${product.id}`} value={`p${product.id}`}>Product: {product.name}</option>
+            ))}
+          </select>
+          <input type="datetime-local" value={newOffer.starts_at} title="Starts (optional)"
+            onChange={(e) => setNewOffer({ ...newOffer, starts_at: e.target.value })}
+            className="border border-gray-300 rounded-md px-3 py-2 sm:text-sm" />
+          <input type="datetime-local" value={newOffer.ends_at} title="Ends (optional)"
+            onChange={(e) => setNewOffer({ ...newOffer, ends_at: e.target.value })}
+            className="border border-gray-300 rounded-md px-3 py-2 sm:text-sm" />
+          <button type="submit" className="md:col-span-4 bg-primary hover:bg-primary-dark text-white font-bold py-2 px-4 rounded-lg transition-colors duration-200">
+            Add Offer
+          </button>
+        </form>
+        {offers.length === 0 ? (
+          <p className="text-sm text-gray-600">No offer rules yet. Product discounts below still apply.</p>
+        ) : (
+          <ul className="divide-y divide-gray-200">
+            {offers.map(offer => (
+              <li key={offer.id} className="py-3 flex flex-col md:flex-row md:items-center md:justify-between">
+                <div>
+                  <p className={`font-medium ${offer.active ? 'text-gray-800' : 'text-gray-400 line-through'}`}>{offer.name}</p>
+                  <p className="text-sm text-gray-600">
+                    {describeOffer(offer)}
+                    {(offer.starts_at || offer.ends_at) && ` · ${offer.starts_at ? new Date(`${offer.starts_at}Z`).toLocaleString() : 'now'} – ${offer.ends_at ? new Date(`${offer.ends_at}Z`).toLocaleString() : 'no end'}`}
+                  </p>
+                </div>
+                <div className="flex gap-2 mt-2 md:mt-0">
+                  <button onClick={() => handleToggleOffer(offer)} className="text-sm bg-gray-100 hover:bg-gray-200 text-gray-800 py-1 px-3 rounded-md">
+                    {offer.active ? 'Pause' : 'Resume'}
+                  </button>
+                  <button onClick={() => handleDeleteOffer(offer)} className="text-sm bg-red-100 hover:bg-red-200 text-red-700 py-1 px-3 rounded-md">
+                    Delete
+                  </button>
+                </div>
+              </li>
+            ))}
+          </ul>
+        )}
+      </div>
+
       {/* Filters */}
       <div className="bg-white rounded-xl shadow-md p-5 mb-8">
         <div className="grid grid-cols-1 md:grid-cols-3 gap-6">
@@ -3,7 +3,7 @@ import React, { useState, useEffect, useContext } from 'react';
 import { Link } from 'react-router-dom';
 import { motion } from 'framer-motion';
 import { AuthContext } from '../App';
-import { getShopOrders, getMyShop, updateOrderStatus } from '../services/api';
+import { getShopOrders, getMyShop, updateOrderStatus, subscribeShopOrders } from '../services/api';
 import ShopOrderCard from '../components/ShopOrderCard';
 import Toast from '../components/Toast';
 
@@ -24,6 +24,18 @@ function ShopOrdersPage() {
         }
     }, [auth]);
 
+    // Live updates instead of refetching: new orders go on top, status changes are applied in place
+    useEffect(() => {
+        if (!shop?.id) return;
+        return subscribeShopOrders({
+            order_created: (order) => setOrders(current =>
+                current.some(o => o.id === order.id) ? current : [order, ...current]),
+            order_status_changed: ({ id, status }) => setOrders(current =>
+                current.map(order => order.id === id ? { ...order, status } : order)),
+            reset: () => getShopOrders().then(response => setOrders(response.data || [])),
+        });
+    }, [shop?.id]);
+
     const fetchShopAndOrders = async () => {
         setLoading(true);
         setError('');
@@ -57,7 +69,7 @@ function ShopOrdersPage() {
             await updateOrderStatus(orderId, newStatus);
             
             // Update local state
-            setOrders(orders.map(order => 
+            setOrders(current => current.map(order => 
                 order.id === orderId ? { ...order, status: newStatus } : order
             ));
             
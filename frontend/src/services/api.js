@@ -65,38 +65,71 @@ export const updateUserProfile = (userData) => apiClient.put('/auth/profile', us
 export const createShop = (shopData) => apiClient.post('/shops', shopData);
 export const getMyShop = () => apiClient.get('/shops/my');
 export const getShopsByCity = (cityName) => apiClient.get(`/shops/city/${cityName}`);
+// Offer rules of the admin's shop
+export const getMyOffers = () => apiClient.get('/shops/my/offers');
+export const createOffer = (offerData) => apiClient.post('/shops/my/offers', offerData);
+export const updateOffer = (offerId, offerData) => apiClient.put(`/shops/my/offers/${offerId}`, offerData);
+export const deleteOffer = (offerId) => apiClient.delete(`/shops/my/offers/${offerId}`);
+// Low-stock queue of the admin's shop; dismissing hides an alert until the product's level changes
+export const getMyAlerts = (includeDismissed = false) =>
+    apiClient.get('/shops/my/alerts', { params: includeDismissed ? { include_dismissed: true } : {} });
+export const dismissAlert = (productId) => apiClient.delete(`/shops/my/alerts/${productId}`);
+// Shops / products around a point ({ lat, lng } or { addressId }), nearest first; radius in km
+export const getNearbyShops = ({ lat, lng, addressId, radius, limit } = {}) =>
+    apiClient.get('/shops/nearby', { params: { lat, lng, address_id: addressId, radius, limit } });
+export const getNearbyProducts = ({ lat, lng, addressId, radius, fields } = {}) =>
+    apiClient.get('/products/nearby', { params: { lat, lng, address_id: addressId, radius, fields } });
 
 // --- Products ---
 export const addProduct = (productData) => apiClient.post('/products', productData);
 export const updateProduct = (productId, productData) => apiClient.put(`/products/${productId}`, productData);
 export const deleteProduct = (productId) => apiClient.delete(`/products/${productId}`);
-export const getProducts = async () => {
+// Upload a product image (File from an <input type="file">); the response lists its resized URLs
+export const uploadProductImage = (productId, file) => {
+    const form = new FormData();
+    form.append('image', file);
+    return apiClient.post(`/products/${productId}/image`, form, { headers: { 'Content-Type': 'multipart/form-data' } });
+};
+// Uploaded images are served by the backend under /media; other image URLs pass through unchanged
+export const mediaUrl = (url) => (url && url.startsWith('/media/') ? API_URL.replace(/\/api$/, '') + url : url);
+// `fields` narrows product listings: 'card', 'detail', 'admin' or comma-separated keys (default: every key)
+export const getProducts = async (fields) => {
     try {
-        return await apiClient.get('/products');
+        return await apiClient.get('/products', { params: { fields } });
     } catch (error) {
         console.error("Error fetching products:", error);
         throw error;
     }
 };
 
-export const getProductsByShop = async (shopId) => {
+export const getProductsByShop = async (shopId, fields) => {
     try {
-        return await apiClient.get(`/shops/${shopId}/products`);
+        return await apiClient.get(`/shops/${shopId}/products`, { params: { fields } });
     } catch (error) {
         console.error(`Error fetching products for shop ${shopId}:`, error);
         throw error;
     }
 };
 
-export const getProductsByCity = async (cityName) => {
+export const getProductsByCity = async (cityName, fields) => {
     try {
-        return await apiClient.get(`/products/city/${cityName}`);
+        return await apiClient.get(`/products/city/${cityName}`, { params: { fields } });
     } catch (error) {
         console.error(`Error fetching products for city ${cityName}:`, error);
         throw error;
     }
 };
 
+export const getBestsellers = ({ city, category, limit, fields } = {}) =>
+    apiClient.get('/products/bestsellers', { params: { city, category, limit, fields } });
+// Frequently bought together with one product, or with a whole cart (productIds)
+export const getRelatedProducts = ({ productId, productIds, limit, fields } = {}) => productId
+    ? apiClient.get(`/products/${productId}/related`, { params: { limit, fields } })
+    : apiClient.get('/products/related', { params: { product_ids: productIds.join(','), limit, fields } });
+// Catalog delta sync: pass the previous response's next_token as `since` (omit it for a full sync)
+export const getProductChanges = ({ since, city, limit, fields } = {}) =>
+    apiClient.get('/products/changes', { params: { since, city, limit, fields } });
+
 // --- Addresses ---
 export const getAddresses = () => apiClient.get('/addresses');
 export const getDefaultAddress = () => apiClient.get('/addresses/default');
@@ -105,14 +138,47 @@ export const updateAddress = (addressId, addressData) => apiClient.put(`/address
 export const deleteAddress = (addressId) => apiClient.delete(`/addresses/${addressId}`);
 
 // --- Orders ---
+// Profile, addresses, live prices/stock and totals for the cart in one call
+export const getCheckoutBootstrap = (items, paymentMethod) => apiClient.post('/checkout/bootstrap', { items, payment_method: paymentMethod });
+// Price a whole cart (offers, discounts, COD fee) in one call; the totals place_order will charge
+export const quoteCart = (items, paymentMethod) => apiClient.post('/pricing/quote', { items, payment_method: paymentMethod });
 export const placeOrder = (orderData) => apiClient.post('/orders', orderData);
-export const getCustomerOrders = () => apiClient.get('/orders/customer');
-export const getShopOrders = () => apiClient.get('/orders/shop'); // Admin getting orders for their shop
+// window: optional { days } or { start, end }; without one the whole order history is returned
+export const getCustomerOrders = (fields, window = {}) => apiClient.get('/orders/customer', { params: { fields, ...window } });
+export const getShopOrders = (fields, window = {}) => apiClient.get('/orders/shop', { params: { fields, ...window } }); // Admin getting orders for their shop
 export const updateOrderStatus = (orderId, status) => apiClient.put(`/orders/${orderId}/status`, { status });
+export const bulkUpdateOrderStatus = (orderIds, status) => apiClient.put('/orders/status', { order_ids: orderIds, status });
 export const cancelOrder = (orderId) => apiClient.put(`/orders/${orderId}/cancel`, { status: 'Cancelled' });
+// Live order events for the admin's shop (order_created, order_status_changed, reset).
+// EventSource reconnects and resumes by itself; call the returned function to stop.
+export const subscribeShopOrders = (handlers) => {
+    const token = localStorage.getItem('token');
+    const source = new EventSource(`${API_URL}/orders/shop/stream?jwt=${encodeURIComponent(token)}`);
+    Object.entries(handlers).forEach(([type, handler]) =>
+        source.addEventListener(type, (event) => handler(JSON.parse(event.data))));
+    return () => source.close();
+};
 
 // --- Analytics ---
 export const getShopAnalytics = (days = 30) => apiClient.get(`/admin/analytics?days=${days}`);
+export const getMyAnalytics = () => apiClient.get('/customers/me/analytics');
+// resolution: 'hour' | 'day' | 'week' | 'month'; pass days or start/end (ISO dates)
+export const getShopTimeseries = ({ resolution = 'day', days, start, end, window } = {}) =>
+    apiClient.get('/admin/analytics/timeseries', { params: { resolution, days, start, end, window } });
+// groupBy: up to two of 'city', 'category', 'shop', 'status', 'hour', 'weekday', 'day', 'month'
+export const getPlatformAnalytics = ({ groupBy = ['city'], days, start, end, city, category, status, sort, limit } = {}) =>
+    apiClient.get('/platform/analytics', {
+        params: { group_by: groupBy.join(','), days, start, end, city, category, status, sort, limit },
+    });
+
+// --- Batch ---
+// Several GET endpoints in one round trip, e.g. batchGet({ shop: '/api/shops/my', orders: '/api/orders/shop' })
+// Resolves to { shop: { status, body }, orders: { status, body } }
+export const batchGet = async (paths, { parallel = false } = {}) => {
+    const requests = Object.entries(paths).map(([id, path]) => ({ id, path }));
+    const response = await apiClient.post('/batch', { requests, parallel });
+    return Object.fromEntries(response.data.responses.map(({ id, status, body }) => [id, { status, body }]));
+};
 
 export default apiClient;
     
\ No newline at end of file
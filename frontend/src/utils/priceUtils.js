@@ -1,7 +1,8 @@
 // frontend/src/utils/priceUtils.js
 
 /**
- * Calculate the discounted price of a product
+ * Calculate the discounted price of a product, for display on product cards.
+ * Carts are priced by the server (quoteCart), which also applies shop offers.
  * @param {number} price - The original price
  * @param {number} discountPercentage - The discount percentage (0-100)
  * @returns {number} - The discounted price